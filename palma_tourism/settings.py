@@ -65,6 +65,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_gis',
     'corsheaders',
@@ -171,6 +172,49 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Configuración de caché
+# 'default' guarda las respuestas de lectura de la API; con CACHE_DIR se usa
+# una caché en disco compartida entre procesos en lugar de la de memoria.
+# 'versions' guarda en disco los números de versión con los que se invalidan
+# las respuestas de 'default' (ver tourism/cache.py): es compartida, así que
+# un cambio en un worker invalida las respuestas cacheadas en todos. Lo que
+# se guarda directamente en 'default' sin versión (la clasificación de
+# tourism/leaderboard.py) es propio de cada proceso si no hay CACHE_DIR: el
+# despliegue usa un solo proceso gunicorn con hilos (ver Procfile y start.sh).
+# 'tiles' guarda las teselas vectoriales en disco para que sobrevivan reinicios
+# 'jobs' guarda el estado de los trabajos de generación de itinerarios en
+# disco, compartido por todos los workers (status_url puede llegar a
+# cualquiera de ellos)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR'),
+    } if os.getenv('CACHE_DIR') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('TILE_CACHE_DIR', str(BASE_DIR / 'cache' / 'tiles')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('VERSION_CACHE_DIR', str(BASE_DIR / 'cache' / 'versions')),
+    },
+    'jobs': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('JOB_CACHE_DIR', str(BASE_DIR / 'cache' / 'jobs')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Matriz de vecinos entre lugares del catálogo (tourism.travel)
+TRAVEL_MATRIX_DIR = os.getenv('TRAVEL_MATRIX_DIR', str(BASE_DIR / 'cache' / 'travel_matrix'))
+
 # Configuración de CORS
 CORS_ALLOW_ALL_ORIGINS = True  # Configura esto apropiadamente en producción
 CORS_ALLOW_CREDENTIALS = True
@@ -183,11 +227,18 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ]
+        'tourism.renderers.ORJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'tourism.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Serializa los listados GeoJSON con tourism.geojson.FastGeoFeatureSerializer
+FAST_GEOJSON_SERIALIZER = os.getenv('FAST_GEOJSON_SERIALIZER', 'True').lower() == 'true'
+
 # Configuración de logging
 LOGGING = {
     'version': 1,
@@ -214,4 +265,8 @@ LOGGING = {
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 GPT_CUSTOM_ID = os.getenv('GPT_CUSTOM_ID')
 
-
+# Generación de itinerarios en segundo plano (tourism/llm.py)
+ITINERARY_WORKERS = int(os.getenv('ITINERARY_WORKERS', 2))
+ITINERARY_LLM_CLIENT = os.getenv('ITINERARY_LLM_CLIENT', 'openai.OpenAI')
+# Número máximo de POIs que se incluyen en el prompt
+ITINERARY_MAX_CANDIDATES = int(os.getenv('ITINERARY_MAX_CANDIDATES', 25))
@@ -123,7 +123,9 @@ python manage.py collectstatic --noinput
 echo "Starting Gunicorn..."
 exec gunicorn palma_tourism.wsgi:application \
     --bind 0.0.0.0:${PORT:-8000} \
+    --worker-class gthread \
     --workers 1 \
+    --threads ${GUNICORN_THREADS:-8} \
     --timeout 120 \
     --log-level debug \
     --access-logfile - \
@@ -0,0 +1,479 @@
+"""
+Escenarios de benchmark ejecutables con `python manage.py benchmark <nombre>`.
+
+Cada escenario recibe el comando (para escribir por stdout) y las opciones,
+genera sus propios datos sintéticos y se ejecuta dentro de una transacción
+que se deshace al terminar.
+"""
+import gzip
+import itertools
+import json
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import msgpack
+import orjson
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import llm, routing
+from .candidates import select_candidates
+from .geojson import FastGeoFeatureSerializer
+from .importers import import_file
+from .itinerary_edits import apply_operations
+from .models import Event, Itinerary, ItineraryPoint, PointOfInterest, Restaurant
+from .opening_hours import open_at, sync_opening_intervals, week_minute, weekly_intervals
+from .periods import overlapping
+from .renderers import ColumnarJSONRenderer, ColumnarMsgPackRenderer, ORJSONRenderer
+from .search import full_text_search
+from .serializers import ItinerarySerializer, PointOfInterestSerializer
+from .spatial import within_radius
+from .viewport import DEFAULT_MAX_FEATURES, filter_in_bbox
+from .views import PointOfInterestViewSet
+
+# Caja envolvente aproximada de La Palma (lng, lat)
+LA_PALMA_BBOX = (-18.01, 28.45, -17.72, 28.86)
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def random_point(rng, bbox=LA_PALMA_BBOX):
+    min_x, min_y, max_x, max_y = bbox
+    return Point(rng.uniform(min_x, max_x), rng.uniform(min_y, max_y), srid=4326)
+
+
+# Vocabulario para generar nombres y descripciones con texto realista
+WORDS = [
+    'playa', 'volcán', 'mirador', 'sendero', 'barranco', 'pinar', 'caldera', 'roque',
+    'iglesia', 'museo', 'puerto', 'faro', 'cueva', 'bosque', 'laurisilva', 'charco',
+    'salinas', 'plátanos', 'vino', 'estrellas', 'observatorio', 'cumbre', 'costa', 'plaza',
+]
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed_points_of_interest(rows, rng, batch_size=5000):
+    types = ['MONUMENT', 'MUSEUM', 'PARK', 'BEACH', 'VIEWPOINT', 'OTHER']
+    difficulties = ['EASY', 'MEDIUM', 'HARD']
+    batch = []
+    for i in range(rows):
+        batch.append(PointOfInterest(
+            name=f'POI {i} {random_text(rng, 2)}',
+            description=random_text(rng, 25),
+            location=random_point(rng),
+            address=f'Calle {i}',
+            type=rng.choice(types),
+            difficulty=rng.choice(difficulties),
+            estimated_time=timedelta(minutes=rng.randint(15, 240)),
+        ))
+        if len(batch) >= batch_size:
+            PointOfInterest.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PointOfInterest.objects.bulk_create(batch)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE tourism_pointofinterest')
+
+
+def measure(func, repeat):
+    """Ejecuta `func` `repeat` veces y devuelve los tiempos en milisegundos."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(stdout, label, samples):
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    stdout.write(
+        f'{label:<40} p50={statistics.median(ordered):8.2f} ms  '
+        f'p99={p99:8.2f} ms  n={len(ordered)}'
+    )
+
+
+@benchmark('nearby')
+def nearby_benchmark(command, options):
+    """
+    Compara el filtro `distance_lte` original con `within_radius`.
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(options['rows'], rng)
+    centers = [random_point(rng) for _ in range(options['repeat'])]
+    radius_km = 10
+
+    legacy_centers = itertools.cycle(centers)
+    shared_centers = itertools.cycle(centers)
+
+    def legacy():
+        center = next(legacy_centers)
+        list(PointOfInterest.objects.annotate(
+            distance=Distance('location', center)
+        ).filter(location__distance_lte=(center, D(km=radius_km))).order_by('distance'))
+
+    def shared():
+        center = next(shared_centers)
+        list(within_radius(PointOfInterest.objects.all(), center, radius_km).order_by('distance'))
+
+    report(command.stdout, 'distance_lte (geometry, esferoide)', measure(legacy, options['repeat']))
+    report(command.stdout, 'ST_DWithin (geography + índice)', measure(shared, options['repeat']))
+
+
+@benchmark('geojson')
+def geojson_benchmark(command, options):
+    """
+    Filas por segundo de PointOfInterestSerializer frente a FastGeoFeatureSerializer.
+    Usar con --rows 10000.
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(options['rows'], rng)
+    queryset = PointOfInterest.objects.order_by('pk')
+    renderer = JSONRenderer()
+    fast = FastGeoFeatureSerializer(PointOfInterestSerializer)
+    repeat = max(1, options['repeat'] // 20)
+
+    def drf():
+        return renderer.render(PointOfInterestSerializer(queryset, many=True).data)
+
+    def fast_path():
+        return renderer.render(fast.to_representation(fast.prepare(queryset)))
+
+    if drf() != fast_path():
+        command.stderr.write('La salida de FastGeoFeatureSerializer no coincide con la del serializer DRF')
+
+    rows = options['rows']
+    for label, func in [('GeoFeatureModelSerializer', drf), ('FastGeoFeatureSerializer', fast_path)]:
+        samples = measure(func, repeat)
+        report(command.stdout, label, samples)
+        command.stdout.write(f'{"":<40} {rows / (statistics.median(samples) / 1000):,.0f} filas/s')
+
+
+@benchmark('renderers')
+def renderers_benchmark(command, options):
+    """
+    JSONRenderer de DRF frente a ORJSONRenderer sobre las cargas de
+    itinerarios y de puntos de interés. Usar con --rows 1000.
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(options['rows'], rng)
+    pois = list(PointOfInterest.objects.order_by('pk'))
+    for i in range(10):
+        itinerary = Itinerary.objects.create(
+            title=f'Itinerario {i}', start_date=date(2030, 1, 1), end_date=date(2030, 1, 3)
+        )
+        ItineraryPoint.objects.bulk_create([
+            ItineraryPoint(itinerary=itinerary, point_of_interest=rng.choice(pois), day=n % 3 + 1, order=n)
+            for n in range(20)
+        ])
+
+    payloads = {
+        'itinerarios': ItinerarySerializer(
+            Itinerary.objects.prefetch_related('points__point_of_interest'), many=True
+        ).data,
+        'puntos de interés': PointOfInterestSerializer(pois, many=True).data,
+    }
+    for name, data in payloads.items():
+        for label, renderer in [('JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer())]:
+            report(command.stdout, f'{label} ({name})', measure(lambda: renderer.render(data), options['repeat']))
+
+
+@benchmark('prompt')
+def prompt_benchmark(command, options):
+    """
+    Tamaño del prompt con todo el catálogo frente a los candidatos elegidos
+    en servidor, y coste de la selección. Usar con --rows 2000.
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(options['rows'], rng)
+    query = 'Quiero un itinerario de 2 días con playas y miradores cerca de POI 42'
+
+    full = list(PointOfInterest.objects.values('id', 'name', 'description', 'type', 'difficulty'))
+    candidates = select_candidates(query)
+    for label, pois in [('catálogo completo', full), ('candidatos del servidor', candidates)]:
+        prompt = llm.build_prompt(query, pois)
+        # ~4 caracteres por token es una aproximación razonable para el español
+        command.stdout.write(
+            f'{label:<40} pois={len(pois):>6}  caracteres={len(prompt):>9,}  tokens≈{len(prompt) // 4:>8,}'
+        )
+
+    report(command.stdout, 'select_candidates', measure(lambda: select_candidates(query), options['repeat']))
+
+
+@benchmark('search')
+def search_benchmark(command, options):
+    """
+    SearchFilter (ILIKE '%término%') frente a la búsqueda de texto completo.
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(options['rows'], rng)
+    terms = itertools.cycle(['volcán', 'laurisilva', 'faro', 'observatorio', 'charco'])
+
+    def ilike():
+        term = next(terms)
+        list(PointOfInterest.objects.filter(
+            Q(name__icontains=term) | Q(description__icontains=term)
+        )[:20])
+
+    def fts():
+        list(full_text_search(PointOfInterest.objects.all(), next(terms), 'name')[:20])
+
+    report(command.stdout, 'ILIKE (SearchFilter)', measure(ilike, options['repeat']))
+    report(command.stdout, 'tsvector + GIN + trigramas', measure(fts, options['repeat']))
+
+
+@benchmark('import')
+def import_benchmark(command, options):
+    """
+    Throughput de import_catalogue con un fichero NDJSON de --rows filas.
+    """
+    rng = random.Random(options['seed'])
+    with tempfile.NamedTemporaryFile('w', suffix='.ndjson', encoding='utf-8') as tmp:
+        for i in range(options['rows']):
+            point = random_point(rng)
+            tmp.write(json.dumps({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [point.x, point.y]},
+                'properties': {
+                    'name': f'POI {i}',
+                    'description': random_text(rng, 25),
+                    'address': f'Calle {i}',
+                    'type': 'PARK',
+                    'difficulty': 'EASY',
+                    'estimated_time': '01:30:00',
+                },
+            }) + '\n')
+        tmp.flush()
+        result = import_file('pois', tmp.name)
+
+    command.stdout.write(
+        f'{result.saved:,} filas guardadas ({result.error_count} errores) en {result.elapsed:.1f} s '
+        f'- {result.rows_per_second:,.0f} filas/s'
+    )
+
+
+@benchmark('edit')
+def edit_benchmark(command, options):
+    """
+    Invertir el orden de un itinerario de 200 puntos en un día: un UPDATE
+    por punto frente a apply_operations (un solo UPDATE con CASE).
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(200, rng)
+    pois = list(PointOfInterest.objects.order_by('pk'))
+    itinerary = Itinerary.objects.create(
+        title='Itinerario largo', start_date=date(2030, 1, 1), end_date=date(2030, 1, 1)
+    )
+    ItineraryPoint.objects.bulk_create([
+        ItineraryPoint(itinerary=itinerary, point_of_interest=poi, day=1, order=n)
+        for n, poi in enumerate(pois, 1)
+    ])
+    repeat = max(1, options['repeat'] // 10)
+
+    def reversed_ids():
+        return list(ItineraryPoint.objects.filter(itinerary=itinerary).order_by('-order').values_list('id', flat=True))
+
+    def legacy():
+        for new_order, point_id in enumerate(reversed_ids(), 1):
+            ItineraryPoint.objects.filter(id=point_id).update(order=new_order)
+
+    def batch():
+        apply_operations(itinerary.pk, [{'op': 'reorder', 'day': 1, 'points': reversed_ids()}])
+
+    report(command.stdout, 'UPDATE por punto (200 puntos)', measure(legacy, repeat))
+    report(command.stdout, 'apply_operations (200 puntos)', measure(batch, repeat))
+
+
+@benchmark('optimize')
+def optimize_benchmark(command, options):
+    """
+    Optimización de rutas con 500 paradas: orden dentro de cada día y
+    reparto en 7 días.
+    """
+    rng = random.Random(options['seed'])
+    stops = []
+    for i in range(500):
+        point = random_point(rng)
+        stops.append(routing.Stop(i, point.x, point.y, rng.randint(15, 240), day=rng.randint(1, 7)))
+    repeat = max(1, options['repeat'] // 20)
+
+    for label, days in [('reordenar cada día', None), ('repartir en 7 días', 7)]:
+        plan = routing.optimize(stops, days=days)
+        report(command.stdout, f'{label} (500 paradas)', measure(lambda: routing.optimize(stops, days=days), repeat))
+        command.stdout.write(f'{"":<40} {sum(day["distance_km"] for day in plan):,.1f} km en total')
+
+
+def random_opening_hours(rng):
+    hours = {}
+    for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']:
+        if rng.random() < 0.15:
+            hours[day] = 'closed'
+        elif rng.random() < 0.3:
+            # Cierre pasada la medianoche
+            hours[day] = f'{rng.randint(12, 13)}:00-16:00, 20:00-0{rng.randint(0, 2)}:30'
+        else:
+            hours[day] = f'{rng.randint(8, 13)}:00-{rng.randint(15, 23)}:00'
+    return hours
+
+
+@benchmark('open')
+def open_benchmark(command, options):
+    """
+    Restaurantes abiertos cerca de un punto: interpretar `opening_hours` en
+    Python frente al filtro SQL sobre los intervalos. Usar con --rows 50000.
+    """
+    rng = random.Random(options['seed'])
+    cuisines = [choice for choice, _ in Restaurant.CUISINE_CHOICES]
+    Restaurant.objects.bulk_create([
+        Restaurant(
+            name=f'Restaurante {i}', description=random_text(rng, 10), location=random_point(rng),
+            address=f'Calle {i}', cuisine_type=rng.choice(cuisines), opening_hours=random_opening_hours(rng),
+        )
+        for i in range(options['rows'])
+    ], batch_size=5000)
+    sync_opening_intervals(Restaurant.objects.only('id', 'opening_hours').iterator())
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE tourism_restaurant')
+        cursor.execute('ANALYZE tourism_restaurantopeninginterval')
+
+    centers = itertools.cycle([random_point(rng) for _ in range(options['repeat'])])
+    radius_km = 5
+
+    def python():
+        minute = week_minute()
+        return [
+            restaurant for restaurant in within_radius(Restaurant.objects.all(), next(centers), radius_km)
+            if any(start <= minute < end for start, end in weekly_intervals(restaurant.opening_hours))
+        ]
+
+    def sql():
+        return list(open_at(within_radius(Restaurant.objects.all(), next(centers), radius_km)))
+
+    report(command.stdout, 'opening_hours en Python', measure(python, options['repeat']))
+    report(command.stdout, 'intervalos en SQL (GiST)', measure(sql, options['repeat']))
+
+
+def plan_indexes(queryset):
+    """Índices que aparecen en el plan de ejecución de la consulta."""
+    plan = queryset.explain()
+    return sorted({word for word in plan.replace('(', ' ').split() if word.endswith('_idx')}) or ['(ninguno)']
+
+
+@benchmark('events')
+def events_benchmark(command, options):
+    """
+    Eventos en una ventana de una semana a 10 km de un punto: filtros
+    start_date/end_date frente al rango `period` con índice GiST.
+    """
+    rng = random.Random(options['seed'])
+    origin = timezone.make_aware(datetime(2030, 1, 1))
+    batch = []
+    for i in range(options['rows']):
+        start = origin + timedelta(hours=rng.randint(0, 24 * 365 * 3))
+        batch.append(Event(
+            name=f'Evento {i}', description=random_text(rng, 10), location=random_point(rng),
+            address=f'Calle {i}', start_date=start, end_date=start + timedelta(hours=rng.randint(1, 72)),
+        ))
+        if len(batch) >= 5000:
+            Event.objects.bulk_create(batch)
+            batch = []
+    Event.objects.bulk_create(batch)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE tourism_event')
+
+    windows = []
+    for _ in range(options['repeat']):
+        start = origin + timedelta(days=rng.randint(0, 365 * 3))
+        windows.append((random_point(rng), start, start + timedelta(days=7)))
+    radius_km = 10
+
+    def legacy(center, start, end):
+        return within_radius(Event.objects.all(), center, radius_km).filter(
+            start_date__lte=end, end_date__gte=start
+        )
+
+    def ranged(center, start, end):
+        return overlapping(within_radius(Event.objects.all(), center, radius_km), start, end)
+
+    for label, build in [('start_date/end_date', legacy), ('period && (GiST)', ranged)]:
+        queries = itertools.cycle(windows)
+        report(command.stdout, label, measure(lambda: list(build(*next(queries))), options['repeat']))
+        command.stdout.write(f'{"":<40} índices: {", ".join(plan_indexes(build(*windows[0])))}')
+
+
+@benchmark('viewport')
+def viewport_benchmark(command, options):
+    """
+    Tiempo de servidor (consulta y JSON) de la vista del mapa a varios
+    tamaños: FeatureCollection completa frente a in_bbox con presupuesto.
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(options['rows'], rng)
+    renderer = JSONRenderer()
+    fast = FastGeoFeatureSerializer(PointOfInterestSerializer)
+    view = PointOfInterestViewSet()
+    repeat = max(1, options['repeat'] // 10)
+
+    for span in (0.01, 0.05, 0.2):
+        boxes = []
+        for _ in range(repeat):
+            center = random_point(rng)
+            boxes.append((center.x - span / 2, center.y - span / 2, center.x + span / 2, center.y + span / 2))
+        full_boxes, budget_boxes = itertools.cycle(boxes), itertools.cycle(boxes)
+
+        def full():
+            queryset = filter_in_bbox(PointOfInterest.objects.all(), next(full_boxes))
+            return renderer.render(fast.to_representation(fast.prepare(queryset)))
+
+        def budgeted():
+            queryset = filter_in_bbox(PointOfInterest.objects.all(), next(budget_boxes))
+            return renderer.render(view.viewport_data(queryset, DEFAULT_MAX_FEATURES))
+
+        report(command.stdout, f'{span}° completa', measure(full, repeat))
+        report(command.stdout, f'{span}° in_bbox (límite {DEFAULT_MAX_FEATURES})', measure(budgeted, repeat))
+    command.stdout.write(
+        f'{"":<40} índices: {", ".join(plan_indexes(filter_in_bbox(PointOfInterest.objects.all(), LA_PALMA_BBOX)))}'
+    )
+
+
+@benchmark('columnar')
+def columnar_benchmark(command, options):
+    """
+    Tamaño (con y sin gzip), tiempo de codificación y de decodificación de
+    una página de puntos de interés en GeoJSON y en formato columnar.
+    Usar con --rows 1000.
+    """
+    rng = random.Random(options['seed'])
+    seed_points_of_interest(options['rows'], rng)
+    fast = FastGeoFeatureSerializer(PointOfInterestSerializer)
+    data = fast.to_representation(fast.prepare(PointOfInterest.objects.order_by('pk')))
+    context = {'view': PointOfInterestViewSet()}
+
+    formats = [
+        ('GeoJSON', ORJSONRenderer(), orjson.loads),
+        ('columnar JSON', ColumnarJSONRenderer(), orjson.loads),
+        ('columnar MessagePack', ColumnarMsgPackRenderer(), msgpack.unpackb),
+    ]
+    for label, renderer, decode in formats:
+        body = renderer.render(data, renderer_context=context)
+        report(command.stdout, f'{label} codificar', measure(lambda: renderer.render(data, renderer_context=context), options['repeat']))
+        report(command.stdout, f'{label} decodificar', measure(lambda: decode(body), options['repeat']))
+        command.stdout.write(f'{"":<40} {len(body):,} bytes, {len(gzip.compress(body)):,} con gzip')
@@ -0,0 +1,133 @@
+"""
+Caché con versiones por espacio de nombres.
+
+En lugar de borrar claves al cambiar los datos se incrementa un número de
+versión que forma parte de la clave; las entradas antiguas caducan solas.
+
+La caché `default` puede ser de memoria, propia de cada proceso, pero sus
+números de versión se guardan en la caché compartida `versions`: una señal
+en un worker invalida las respuestas cacheadas por todos.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+DEFAULT_TIMEOUT = 60 * 60
+# Caché donde se guardan las versiones de cada caché (por defecto, ella misma)
+VERSION_CACHE_ALIASES = {'default': 'versions'}
+
+
+def version_cache(alias):
+    return caches[VERSION_CACHE_ALIASES.get(alias, alias)]
+
+
+def get_version(namespace, alias='default'):
+    return version_cache(alias).get_or_set(f'version:{namespace}', 1, timeout=None)
+
+
+def bump_version(namespace, alias='default'):
+    cache = version_cache(alias)
+    key = f'version:{namespace}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def versioned_key(namespace, key, alias='default'):
+    return f'{namespace}:{get_version(namespace, alias)}:{key}'
+
+
+def get_or_compute(namespace, key, compute, timeout=DEFAULT_TIMEOUT, alias='default'):
+    """
+    Devuelve el valor cacheado para `key` o lo calcula con `compute()`.
+    """
+    cache = caches[alias]
+    cache_key = versioned_key(namespace, key, alias)
+    value = cache.get(cache_key)
+    if value is None:
+        value = compute()
+        cache.set(cache_key, value, timeout=timeout)
+    return value
+
+
+def response_key(request, name, kwargs):
+    """
+    Clave de una respuesta: acción, argumentos de la URL, host y parámetros
+    de consulta normalizados (ordenados y con valores múltiples ordenados).
+    """
+    params = sorted(
+        (param, value)
+        for param, values in request.query_params.lists()
+        for value in values
+    )
+    raw = f'{name}|{sorted(kwargs.items())}|{request.get_host()}|{urlencode(params)}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def etag_matches(request, etag):
+    """
+    True si `etag` aparece en la cabecera If-None-Match de la petición.
+    """
+    if_none_match = request.headers.get('If-None-Match', '')
+    return etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+
+
+def cache_response(method):
+    """
+    Cachea la respuesta de una acción de lectura de un ViewSet.
+
+    La clave se versiona con el modelo del ViewSet, de forma que las señales
+    post_save/post_delete la invalidan. Añade un ETag derivado de la clave y
+    responde 304 si coincide con `If-None-Match`, sin consultar la base de datos.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        namespace = self.queryset.model._meta.model_name
+        name = method.__name__
+        # Las vistas cuyo resultado depende de algo más que la petición
+        # (p. ej. la hora actual) lo añaden a la clave con cache_vary()
+        if hasattr(self, 'cache_vary'):
+            name = f'{name}|{self.cache_vary(request)}'
+        key = versioned_key(namespace, response_key(request, name, kwargs))
+        # Los datos cacheados son los mismos para todos los formatos, pero
+        # cada formato (JSON, columnar...) necesita su propio ETag
+        renderer = getattr(request, 'accepted_renderer', None)
+        raw_etag = f'{key}|{renderer.format}' if renderer is not None else key
+        etag = f'"{hashlib.sha1(raw_etag.encode("utf-8")).hexdigest()}"'
+
+        if etag_matches(request, etag):
+            return Response(status=304, headers={'ETag': etag, 'Vary': 'Accept'})
+
+        cache = caches['default']
+        data = cache.get(key)
+        if data is None:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, timeout=DEFAULT_TIMEOUT)
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept'])
+        return response
+    return wrapper
+
+
+class CachedResponseMixin:
+    """
+    Cachea `list` y `retrieve`. Para otras acciones usar `@cache_response`.
+    """
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
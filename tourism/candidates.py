@@ -0,0 +1,130 @@
+"""
+Selección en servidor de los puntos de interés candidatos para el prompt.
+
+En lugar de pegar en el prompt todos los POIs que envía el cliente se
+puntúa el catálogo según la consulta del usuario y solo se envían los N
+mejores. La puntuación combina:
+
+- relevancia de texto completo (columna indexada `search_vector`),
+- una bonificación si el tipo del POI aparece en la consulta (playa, museo...),
+- cercanía a los lugares nombrados en la consulta (p. ej. "Roque de los Muchachos").
+"""
+import re
+import unicodedata
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Coalesce, Least
+
+from .models import PointOfInterest
+from .spatial import GeographyDistance
+
+SEARCH_CONFIG = 'spanish'
+DEFAULT_MAX_CANDIDATES = 25
+MAX_ANCHORS = 3
+DESCRIPTION_LENGTH = 200
+
+TYPE_BONUS = 0.5
+PROXIMITY_BONUS = 1.0
+# Distancia (km) a la que la bonificación por cercanía cae a la mitad
+PROXIMITY_HALF_KM = 5
+
+TYPE_KEYWORDS = {
+    'BEACH': ['playa', 'playas', 'beach', 'beaches', 'cala', 'piscina natural', 'charco'],
+    'MUSEUM': ['museo', 'museos', 'museum', 'museums'],
+    'VIEWPOINT': ['mirador', 'miradores', 'vistas', 'viewpoint', 'estrellas', 'observatorio'],
+    'PARK': ['parque', 'sendero', 'senderismo', 'ruta a pie', 'park', 'hiking', 'trail', 'bosque'],
+    'MONUMENT': ['monumento', 'iglesia', 'historico', 'monument', 'church', 'casco'],
+}
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def detect_types(user_query):
+    query = normalize(user_query)
+    return [
+        poi_type for poi_type, keywords in TYPE_KEYWORDS.items()
+        if any(re.search(rf'\b{re.escape(keyword)}\b', query) for keyword in keywords)
+    ]
+
+
+def build_search_query(user_query):
+    """
+    SearchQuery que encuentra cualquiera de las palabras de la consulta
+    (OR), ya que una frase completa en lenguaje natural rara vez coincide
+    con todos sus términos.
+    """
+    words = [word for word in WORD_RE.findall(user_query) if len(word) > 2]
+    if not words:
+        return None
+    return reduce(or_, [SearchQuery(word, config=SEARCH_CONFIG) for word in words])
+
+
+def find_anchors(search_query):
+    """
+    POIs cuyo nombre coincide con la consulta: los lugares mencionados.
+    """
+    name_vector = SearchVector('name', config=SEARCH_CONFIG)
+    return list(
+        PointOfInterest.objects.filter(location__isnull=False, search_vector=search_query)
+        .annotate(name_rank=SearchRank(name_vector, search_query))
+        .filter(name_rank__gt=0)
+        .order_by('-name_rank', 'id')
+        .values_list('location', flat=True)[:MAX_ANCHORS]
+    )
+
+
+def select_candidates(user_query, limit=None):
+    """
+    Devuelve los `limit` POIs más relevantes para la consulta en el formato
+    que espera llm.build_prompt.
+    """
+    if limit is None:
+        limit = getattr(settings, 'ITINERARY_MAX_CANDIDATES', DEFAULT_MAX_CANDIDATES)
+
+    queryset = PointOfInterest.objects.all()
+    score = Value(0.0, output_field=FloatField())
+
+    search_query = build_search_query(user_query)
+    anchors = []
+    if search_query is not None:
+        queryset = queryset.annotate(text_rank=SearchRank(F('search_vector'), search_query))
+        score = score + F('text_rank')
+        anchors = find_anchors(search_query)
+
+    types = detect_types(user_query)
+    if types:
+        queryset = queryset.annotate(type_bonus=Case(
+            When(type__in=types, then=Value(TYPE_BONUS)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ))
+        score = score + F('type_bonus')
+
+    if anchors:
+        distances = [GeographyDistance('location', anchor) for anchor in anchors]
+        nearest = distances[0] if len(distances) == 1 else Least(*distances)
+        # bonus = PROXIMITY_BONUS / (1 + km / PROXIMITY_HALF_KM); sin ubicación no puntúa
+        queryset = queryset.annotate(proximity_bonus=Coalesce(
+            Value(PROXIMITY_BONUS) / (Value(1.0) + nearest / Value(PROXIMITY_HALF_KM * 1000.0)),
+            Value(0.0),
+            output_field=FloatField(),
+        ))
+        score = score + F('proximity_bonus')
+
+    candidates = queryset.annotate(score=score).order_by('-score', 'id').values(
+        'id', 'name', 'description', 'type', 'difficulty'
+    )[:limit]
+
+    return [
+        {**candidate, 'description': candidate['description'][:DESCRIPTION_LENGTH]}
+        for candidate in candidates
+    ]
@@ -0,0 +1,127 @@
+"""
+Agrupación de POIs y restaurantes en clusters para los zooms bajos del mapa.
+
+Los lugares se agrupan en una rejilla en Web Mercator (ST_SnapToGrid) cuyas
+celdas miden CELL_PIXELS píxeles en pantalla al zoom pedido, así que el
+número de clusters visibles no depende de cuántos lugares haya. Cada celda
+devuelve su número de lugares, su centroide, su caja envolvente y el
+desglose por `type` (POIs) o `cuisine_type` (restaurantes).
+
+Los clusters de cada capa y zoom se calculan una vez para todo el catálogo
+y se guardan en la caché de teselas con la misma versión que ellas: al
+cambiar una fila de la capa (ver signals.py) dejan de usarse. El filtro por
+bbox se aplica después, sobre la lista cacheada. El ETag de la respuesta se
+deriva de esas mismas versiones.
+"""
+import hashlib
+import json
+import math
+
+from django.db import connection
+
+from .cache import get_or_compute, get_version
+from .models import PointOfInterest, Restaurant
+from .tiles import TILE_CACHE_ALIAS, TILE_CACHE_TIMEOUT
+
+# Capa: (modelo, campo con la categoría)
+CLUSTER_LAYERS = {
+    'pois': (PointOfInterest, 'type'),
+    'restaurants': (Restaurant, 'cuisine_type'),
+}
+MAX_CLUSTER_ZOOM = 18
+CELL_PIXELS = 64
+TILE_PIXELS = 256
+# Circunferencia de la Tierra en el ecuador en metros de Web Mercator
+WORLD_METERS = 2 * math.pi * 6378137
+
+
+def cell_size(zoom):
+    """
+    Lado de la celda en metros de Web Mercator al zoom indicado.
+    """
+    return WORLD_METERS / (TILE_PIXELS * 2 ** zoom) * CELL_PIXELS
+
+
+def compute_layer(layer, zoom):
+    """
+    Clusters de una capa en una sola consulta agrupada por celda y categoría.
+    Devuelve tuplas (celda_x, celda_y, categoría, número, suma_lng, suma_lat,
+    min_lng, min_lat, max_lng, max_lat, id) donde id es el del lugar si la
+    celda solo tiene uno.
+    """
+    model, category = CLUSTER_LAYERS[layer]
+    size = cell_size(zoom)
+    sql = f"""
+        SELECT round(ST_X(t.cell) / %s)::bigint, round(ST_Y(t.cell) / %s)::bigint, t.category,
+               count(*), sum(ST_X(t.location)), sum(ST_Y(t.location)),
+               min(ST_X(t.location)), min(ST_Y(t.location)),
+               max(ST_X(t.location)), max(ST_Y(t.location)), min(t.id)
+        FROM (
+            SELECT id, location, {connection.ops.quote_name(category)} AS category,
+                   ST_SnapToGrid(ST_Transform(location, 3857), %s) AS cell
+            FROM {connection.ops.quote_name(model._meta.db_table)}
+            WHERE location IS NOT NULL
+        ) t
+        GROUP BY 1, 2, 3
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [size, size, size])
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def get_layer(layer, zoom):
+    return get_or_compute(
+        f'tiles-{layer}', f'clusters:{zoom}', lambda: compute_layer(layer, zoom),
+        timeout=TILE_CACHE_TIMEOUT, alias=TILE_CACHE_ALIAS,
+    )
+
+
+def get_etag(zoom, bbox=None, layers=None):
+    """
+    ETag de la respuesta de get_clusters: cambia al cambiar alguna capa.
+    """
+    versions = [
+        (layer, get_version(f'tiles-{layer}', TILE_CACHE_ALIAS)) for layer in sorted(layers or CLUSTER_LAYERS)
+    ]
+    raw = json.dumps([max(0, min(zoom, MAX_CLUSTER_ZOOM)), bbox, versions])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def get_clusters(zoom, bbox=None, layers=None):
+    """
+    Clusters de las capas indicadas (todas por defecto) cuyo centroide cae
+    dentro de `bbox`, del más grande al más pequeño. Las celdas con un solo
+    lugar incluyen su capa e id para pintarlo directamente.
+    """
+    zoom = max(0, min(zoom, MAX_CLUSTER_ZOOM))
+    cells = {}
+    for layer in layers or CLUSTER_LAYERS:
+        for cx, cy, category, count, sum_lng, sum_lat, min_lng, min_lat, max_lng, max_lat, pk in get_layer(layer, zoom):
+            cell = cells.setdefault((cx, cy), {
+                'count': 0, 'sum_lng': 0.0, 'sum_lat': 0.0,
+                'bbox': [min_lng, min_lat, max_lng, max_lat], 'counts': {}, 'place': (layer, pk),
+            })
+            cell['count'] += count
+            cell['sum_lng'] += sum_lng
+            cell['sum_lat'] += sum_lat
+            box = cell['bbox']
+            cell['bbox'] = [min(box[0], min_lng), min(box[1], min_lat), max(box[2], max_lng), max(box[3], max_lat)]
+            counts = cell['counts'].setdefault(layer, {})
+            counts[category] = counts.get(category, 0) + count
+
+    clusters = []
+    for cell in cells.values():
+        lng, lat = cell['sum_lng'] / cell['count'], cell['sum_lat'] / cell['count']
+        if bbox and not (bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+            continue
+        cluster = {
+            'coordinates': [lng, lat],
+            'count': cell['count'],
+            'bbox': cell['bbox'],
+            'counts': cell['counts'],
+        }
+        if cell['count'] == 1:
+            cluster['type'], cluster['id'] = cell['place']
+        clusters.append(cluster)
+    clusters.sort(key=lambda cluster: -cluster['count'])
+    return {'zoom': zoom, 'clusters': clusters}
@@ -0,0 +1,84 @@
+"""
+Exportación completa de capas en GeoJSON / GeoJSON por líneas (NDJSON).
+
+Las filas se leen con `iterator()`, que en PostgreSQL usa un cursor de
+servidor, y las features se escriben a medida que se generan, de modo que la
+memoria usada no depende del número de filas.
+"""
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+
+from .geojson import FastGeoFeatureSerializer
+from .models import Event, PointOfInterest, Restaurant
+from .serializers import EventSerializer, PointOfInterestSerializer, RestaurantSerializer
+
+EXPORT_LAYERS = {
+    'pois': (PointOfInterest, PointOfInterestSerializer),
+    'restaurants': (Restaurant, RestaurantSerializer),
+    'events': (Event, EventSerializer),
+}
+
+CHUNK_SIZE = 2000
+# Tamaño aproximado de cada bloque escrito en la respuesta
+BUFFER_SIZE = 64 * 1024
+
+
+def dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def to_feature(obj, serializer_class):
+    data = serializer_class(obj).data
+    if data.get('type') == 'Feature':
+        return data
+    # EventSerializer no es GeoJSON: se envuelve con la geometría de `location`
+    return {
+        'id': obj.pk,
+        'type': 'Feature',
+        'geometry': json.loads(obj.location.geojson) if obj.location else None,
+        'properties': data,
+    }
+
+
+def iter_features(layer):
+    model, serializer_class = EXPORT_LAYERS[layer]
+    queryset = model.objects.order_by('pk')
+    if issubclass(serializer_class, GeoFeatureModelSerializer):
+        fast = FastGeoFeatureSerializer(serializer_class)
+        for row in fast.prepare(queryset).iterator(chunk_size=CHUNK_SIZE):
+            yield dumps(fast.to_feature(row))
+        return
+    for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield dumps(to_feature(obj, serializer_class))
+
+
+def buffered(parts):
+    """
+    Agrupa fragmentos pequeños en bloques de ~BUFFER_SIZE caracteres.
+    """
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def geojson_stream(layer):
+    def parts():
+        yield '{"type":"FeatureCollection","features":['
+        for index, feature in enumerate(iter_features(layer)):
+            yield feature if index == 0 else ',' + feature
+        yield ']}'
+    return buffered(parts())
+
+
+def ndjson_stream(layer):
+    return buffered(feature + '\n' for feature in iter_features(layer))
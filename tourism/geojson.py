@@ -0,0 +1,100 @@
+"""
+Serialización GeoJSON rápida para capas de puntos.
+
+`GeoFeatureModelSerializer` crea una instancia de modelo y una geometría GEOS
+por fila. Aquí se leen las filas con `values()`, las coordenadas se extraen en
+SQL con ST_X/ST_Y y las features se montan directamente, reutilizando los
+campos ya enlazados del serializer original para que la salida sea idéntica.
+"""
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from .spatial import X, Y
+
+
+def ogr_coordinate(value):
+    # GEOS/OGR escriben las coordenadas con 15 cifras significativas
+    return float('%.15g' % value)
+
+
+class FastGeoFeatureSerializer:
+    """
+    Equivalente de solo lectura a un `GeoFeatureModelSerializer` de puntos.
+
+    Uso:
+        fast = FastGeoFeatureSerializer(PointOfInterestSerializer)
+        rows = fast.prepare(queryset)
+        data = fast.to_representation(rows)
+    """
+    x_alias = '_fast_x'
+    y_alias = '_fast_y'
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        meta = serializer_class.Meta
+        self.geo_field = meta.geo_field
+        self.id_field = getattr(meta, 'id_field', None)
+        if self.id_field is None:
+            self.id_field = meta.model._meta.pk.name
+        self.fields = serializer.fields
+        self.property_fields = [
+            field for name, field in self.fields.items()
+            if name not in (self.id_field, self.geo_field)
+        ]
+
+    def prepare(self, queryset):
+        """
+        Convierte el queryset en filas `values()` con las coordenadas anotadas.
+        """
+        sources = [self.fields[self.id_field].source] + [field.source for field in self.property_fields]
+        return queryset.annotate(**{
+            self.x_alias: X(self.geo_field),
+            self.y_alias: Y(self.geo_field),
+        }).values(*sources, self.x_alias, self.y_alias)
+
+    def to_feature(self, row):
+        feature = OrderedDict()
+        if self.id_field:
+            field = self.fields[self.id_field]
+            feature['id'] = field.to_representation(row[field.source])
+        feature['type'] = 'Feature'
+        x, y = row[self.x_alias], row[self.y_alias]
+        if x is None:
+            feature['geometry'] = None
+        else:
+            feature['geometry'] = OrderedDict((
+                ('type', 'Point'),
+                ('coordinates', [ogr_coordinate(x), ogr_coordinate(y)]),
+            ))
+        properties = OrderedDict()
+        for field in self.property_fields:
+            value = row[field.source]
+            properties[field.field_name] = None if value is None else field.to_representation(value)
+        feature['properties'] = properties
+        return feature
+
+    def to_representation(self, rows):
+        return OrderedDict((
+            ('type', 'FeatureCollection'),
+            ('features', [self.to_feature(row) for row in rows]),
+        ))
+
+
+class FastGeoJSONListMixin:
+    """
+    Sirve `list` con FastGeoFeatureSerializer cuando FAST_GEOJSON_SERIALIZER
+    está activo (por defecto sí).
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'FAST_GEOJSON_SERIALIZER', True):
+            return super().list(request, *args, **kwargs)
+
+        fast = FastGeoFeatureSerializer(self.get_serializer_class())
+        rows = fast.prepare(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast.to_representation(page))
+        return Response(fast.to_representation(rows))
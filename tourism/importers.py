@@ -0,0 +1,313 @@
+"""
+Importación masiva de catálogos (POIs, restaurantes y eventos).
+
+Los ficheros se leen de forma incremental (GeoJSON, GeoJSON por líneas, CSV
+o shapefile vía GDAL), las filas se validan por lotes con las reglas de los
+modelos y se guardan con `bulk_create(update_conflicts=True)`: las filas con
+`id` existente se actualizan y el resto se insertan. La memoria usada depende
+del tamaño del lote, no del fichero.
+"""
+import codecs
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.contrib.gis.gdal import DataSource, GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, Point
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import JSONField
+from django.utils import timezone
+
+from .jsonstream import ArrayItemParser
+from .models import Event, PointOfInterest, Restaurant
+from .opening_hours import sync_opening_intervals
+from .signals import invalidate_catalogue
+
+IMPORT_LAYERS = {
+    'pois': PointOfInterest,
+    'restaurants': Restaurant,
+    'events': Event,
+}
+
+FORMATS_BY_EXTENSION = {
+    '.geojson': 'geojson',
+    '.json': 'geojson',
+    '.ndjson': 'ndjson',
+    '.geojsonl': 'ndjson',
+    '.csv': 'csv',
+    '.shp': 'shapefile',
+    '.zip': 'shapefile',
+}
+
+DEFAULT_BATCH_SIZE = 2000
+READ_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+# Longitud máxima de los nombres de columna en DBF
+DBF_NAME_LENGTH = 10
+
+
+def detect_format(filename):
+    for extension, fmt in FORMATS_BY_EXTENSION.items():
+        if filename.lower().endswith(extension):
+            return fmt
+    raise ValueError(f"Formato no reconocido para {filename}")
+
+
+def text_chunks(fileobj):
+    """
+    Lee un fichero binario o de texto en fragmentos de texto UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = fileobj.read(READ_SIZE)
+        if not chunk:
+            break
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+class InvalidRow:
+    """
+    Fila que no se ha podido leer; se informa como error de esa fila.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+
+def feature_to_row(feature):
+    row = dict(feature.get('properties') or {})
+    if feature.get('id') is not None:
+        row.setdefault('id', feature['id'])
+    geometry = feature.get('geometry')
+    try:
+        row['location'] = GEOSGeometry(json.dumps(geometry), srid=4326) if geometry else None
+    except (ValueError, TypeError, GEOSException) as e:
+        return InvalidRow(f"Geometría inválida: {e}")
+    return row
+
+
+def read_geojson(fileobj):
+    parser = ArrayItemParser('features')
+    for chunk in text_chunks(fileobj):
+        for feature in parser.feed(chunk):
+            yield feature_to_row(feature)
+
+
+def read_ndjson(fileobj):
+    wrapper = io.TextIOWrapper(fileobj, encoding='utf-8') if not isinstance(fileobj, io.TextIOBase) else fileobj
+    for line in wrapper:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            feature = json.loads(line)
+        except ValueError as e:
+            yield InvalidRow(f"JSON inválido: {e}")
+            continue
+        yield feature_to_row(feature)
+
+
+def read_csv(fileobj):
+    """
+    CSV con columnas `lng`/`lat` (o `longitude`/`latitude`) o `location` en WKT.
+    """
+    wrapper = io.TextIOWrapper(fileobj, encoding='utf-8', newline='') if not isinstance(fileobj, io.TextIOBase) else fileobj
+    for record in csv.DictReader(wrapper):
+        row = {key: value for key, value in record.items() if value != ''}
+        lng, longitude = row.pop('lng', None), row.pop('longitude', None)
+        lat, latitude = row.pop('lat', None), row.pop('latitude', None)
+        lng = lng if lng is not None else longitude
+        lat = lat if lat is not None else latitude
+        try:
+            if lng is not None and lat is not None:
+                row['location'] = Point(float(lng), float(lat), srid=4326)
+            elif row.get('location'):
+                row['location'] = GEOSGeometry(row['location'], srid=4326)
+        except (ValueError, TypeError, GEOSException) as e:
+            yield InvalidRow(f"Ubicación inválida: {e}")
+            continue
+        yield row
+
+
+def read_shapefile(path, field_names=()):
+    """
+    Shapefile (o .zip con el shapefile) leído con GDAL y reproyectado a 4326.
+
+    El DBF corta los nombres de columna a 10 caracteres (`descriptio`,
+    `estimated_`...): se traducen a los de `field_names` que empiezan igual.
+    Un fichero ilegible lanza ValueError; sin .prj cada fila es un error.
+    """
+    if path.lower().endswith('.zip'):
+        path = f'/vsizip/{path}'
+    names = {name[:DBF_NAME_LENGTH]: name for name in field_names}
+    try:
+        layer = DataSource(path)[0]
+    except (GDALException, IndexError) as e:
+        raise ValueError(f"Shapefile ilegible: {e}")
+    for feature in layer:
+        row = {names.get(field, field): feature.get(field) for field in layer.fields}
+        geometry = feature.geom
+        if geometry.srs is None:
+            yield InvalidRow("El shapefile no indica sistema de referencia (falta el .prj)")
+            continue
+        try:
+            geometry.transform(4326)
+        except GDALException as e:
+            yield InvalidRow(f"No se puede reproyectar la geometría: {e}")
+            continue
+        row['location'] = geometry.geos
+        yield row
+
+
+def import_field_names(model):
+    """
+    Campos que se pueden importar: los no editables (fechas automáticas,
+    columnas mantenidas por triggers) se excluyen.
+    """
+    return {field.name for field in model._meta.concrete_fields if field.editable}
+
+
+def read_rows(fmt, source, field_names=()):
+    """
+    `source` es un fichero abierto en modo binario, o una ruta para shapefiles.
+    `field_names` son los campos del modelo destino (ver read_shapefile).
+    """
+    if fmt == 'geojson':
+        return read_geojson(source)
+    if fmt == 'ndjson':
+        return read_ndjson(source)
+    if fmt == 'csv':
+        return read_csv(source)
+    if fmt == 'shapefile':
+        return read_shapefile(source, field_names)
+    raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.rows = 0
+        self.saved = 0
+        self.error_count = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'saved': self.saved,
+            'errors': self.error_count,
+            'error_details': self.errors,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def build_instance(model, row, field_names):
+    unknown = set(row) - field_names
+    if unknown:
+        raise ValidationError(f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    for field in model._meta.concrete_fields:
+        # En CSV los campos JSON (opening_hours) llegan como texto
+        if isinstance(field, JSONField) and isinstance(row.get(field.name), str):
+            try:
+                row[field.name] = json.loads(row[field.name])
+            except ValueError:
+                raise ValidationError({field.name: "JSON inválido"})
+    instance = model(**row)
+    # full_clean valida y convierte los valores (duraciones, fechas...) al tipo del campo
+    instance.full_clean(
+        exclude=[field.name for field in model._meta.concrete_fields if not field.editable],
+        validate_unique=False,
+    )
+    return instance
+
+
+def import_rows(model, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Valida y guarda las filas por lotes. Las filas inválidas se informan en
+    el resultado y no detienen la importación.
+    """
+    result = ImportResult()
+    field_names = import_field_names(model)
+    update_fields = sorted(field_names - {'id'}) + ['updated_at']
+    start = time.perf_counter()
+    started_at = timezone.now()
+
+    rows = enumerate(rows, 1)
+    for batch in batched(rows, batch_size):
+        instances = []
+        for row_number, row in batch:
+            result.rows += 1
+            if isinstance(row, InvalidRow):
+                result.add_error(row_number, row.message)
+                continue
+            try:
+                instances.append(build_instance(model, row, field_names))
+            except ValidationError as e:
+                result.add_error(row_number, e.message_dict if hasattr(e, 'error_dict') else e.messages)
+            except (TypeError, ValueError) as e:
+                result.add_error(row_number, str(e))
+
+        if instances:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    instances,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=update_fields,
+                )
+            result.saved += len(instances)
+
+    if result.saved:
+        # Las filas pueden traer id explícito: avanzar la secuencia como
+        # hace loaddata para que los siguientes create() no choquen
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
+        # bulk_create no envía post_save: invalidar cachés y teselas y
+        # regenerar los horarios a mano
+        if model is Restaurant:
+            sync_opening_intervals(
+                Restaurant.objects.filter(updated_at__gte=started_at).only('id', 'opening_hours').iterator()
+            )
+        invalidate_catalogue(sender=model)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def import_file(layer, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Importa el fichero `path` en la capa indicada (pois, restaurants, events).
+    """
+    model = IMPORT_LAYERS[layer]
+    fmt = fmt or detect_format(path)
+    if fmt == 'shapefile':
+        return import_rows(model, read_rows(fmt, path, import_field_names(model)), batch_size)
+    with open(path, 'rb') as fileobj:
+        return import_rows(model, read_rows(fmt, fileobj), batch_size)
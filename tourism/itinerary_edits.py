@@ -0,0 +1,201 @@
+"""
+Edición por lotes de los puntos de un itinerario.
+
+Las operaciones (move, reorder, insert, delete) se aplican en memoria sobre
+el orden actual de cada día y después se escriben de una vez: un DELETE, un
+INSERT y un único UPDATE con `bulk_update` (CASE por id) para las filas cuyo
+día u orden ha cambiado. Cada día queda numerado de 1 a n.
+
+El itinerario se bloquea con SELECT ... FOR UPDATE durante la edición, así
+que dos ediciones simultáneas del mismo itinerario se aplican una detrás de
+otra y siempre sobre el orden ya renumerado por la anterior. El GeoJSON
+materializado se actualiza una vez al final, solo en los días tocados.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .itinerary_geojson import deferred_refresh, refresh
+from .models import Event, Itinerary, ItineraryPoint, PointOfInterest, Restaurant
+
+# point_type -> (campo de ItineraryPoint, modelo)
+POINT_TYPES = {
+    'poi': ('point_of_interest', PointOfInterest),
+    'restaurant': ('restaurant', Restaurant),
+    'event': ('event', Event),
+}
+
+
+class EditError(ValueError):
+    """
+    Operación inválida; `index` es su posición en la lista de operaciones.
+    """
+
+    def __init__(self, index, message):
+        super().__init__(f"Operación {index}: {message}")
+        self.index = index
+
+
+def positive_int(value, name, index):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise EditError(index, f"{name} debe ser un entero")
+    if value < 1:
+        raise EditError(index, f"{name} debe ser mayor que 0")
+    return value
+
+
+def place(days, day, point, order=None):
+    """
+    Coloca `point` en la posición `order` (1..n) del día, o al final.
+    """
+    points = days[day]
+    position = len(points) if order is None else min(order - 1, len(points))
+    points.insert(position, point)
+
+
+class ItineraryEdit:
+    """
+    Estado en memoria de los días de un itinerario mientras se aplican
+    las operaciones.
+    """
+
+    def __init__(self, itinerary, points):
+        self.itinerary = itinerary
+        self.original = {point.pk: (point.day, point.order) for point in points}
+        self.points = {point.pk: point for point in points}
+        self.days = defaultdict(list)
+        for point in sorted(points, key=lambda point: (point.day, point.order, point.pk)):
+            self.days[point.day].append(point)
+        self.deleted = []
+        self.inserted = []
+
+    def get_point(self, index, point_id):
+        try:
+            return self.points[int(point_id)]
+        except (KeyError, TypeError, ValueError):
+            raise EditError(index, f"El punto {point_id} no pertenece a este itinerario")
+
+    def remove(self, point):
+        self.days[point.day].remove(point)
+
+    def move(self, index, operation):
+        point = self.get_point(index, operation.get('point_id'))
+        day = positive_int(operation.get('day'), 'day', index)
+        order = operation.get('order')
+        order = positive_int(order, 'order', index) if order else None
+        self.remove(point)
+        point.day = day
+        place(self.days, day, point, order)
+
+    def reorder(self, index, operation):
+        """
+        Los puntos indicados pasan al principio del día en ese orden; el
+        resto mantiene su orden relativo detrás de ellos.
+        """
+        day = positive_int(operation.get('day'), 'day', index)
+        point_ids = operation.get('points') or []
+        listed = [self.get_point(index, point_id) for point_id in point_ids]
+        if len({point.pk for point in listed}) != len(listed):
+            raise EditError(index, "La lista de puntos tiene duplicados")
+        if any(point.day != day for point in listed):
+            raise EditError(index, f"Algunos puntos no pertenecen al día {day}")
+        rest = [point for point in self.days[day] if point not in listed]
+        self.days[day] = listed + rest
+
+    def insert(self, index, operation):
+        point_type = operation.get('point_type')
+        if point_type not in POINT_TYPES:
+            raise EditError(index, "point_type debe ser 'poi', 'restaurant' o 'event'")
+        field, model = POINT_TYPES[point_type]
+        target_id = positive_int(operation.get('point_id'), 'point_id', index)
+        day = positive_int(operation.get('day'), 'day', index)
+        order = operation.get('order')
+        order = positive_int(order, 'order', index) if order else None
+        point = ItineraryPoint(
+            itinerary=self.itinerary,
+            day=day,
+            notes=operation.get('notes', ''),
+            **{f'{field}_id': target_id},
+        )
+        self.inserted.append((index, model, target_id, point))
+        place(self.days, day, point, order)
+
+    def delete(self, index, operation):
+        point = self.get_point(index, operation.get('point_id'))
+        self.remove(point)
+        del self.points[point.pk]
+        self.deleted.append(point.pk)
+
+    def apply(self, index, operation):
+        handler = {
+            'move': self.move,
+            'reorder': self.reorder,
+            'insert': self.insert,
+            'delete': self.delete,
+        }.get(operation.get('op') if isinstance(operation, dict) else None)
+        if handler is None:
+            raise EditError(index, "op debe ser 'move', 'reorder', 'insert' o 'delete'")
+        handler(index, operation)
+
+    def check_inserted_targets(self):
+        """
+        Comprueba con una consulta por tipo que los lugares insertados existen.
+        """
+        wanted = defaultdict(set)
+        for _, model, target_id, _ in self.inserted:
+            wanted[model].add(target_id)
+        existing = {
+            model: set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            for model, ids in wanted.items()
+        }
+        for index, model, target_id, _ in self.inserted:
+            if target_id not in existing[model]:
+                raise EditError(index, f"No existe {model._meta.verbose_name} con id {target_id}")
+
+    def save(self):
+        self.check_inserted_targets()
+
+        changed = []
+        touched_days = {self.original[pk][0] for pk in self.deleted}
+        for day, points in self.days.items():
+            for order, point in enumerate(points, 1):
+                point.day, point.order = day, order
+                if point.pk is None:
+                    touched_days.add(day)
+                elif self.original[point.pk] != (day, order):
+                    changed.append(point)
+                    touched_days.update([day, self.original[point.pk][0]])
+
+        if self.deleted:
+            ItineraryPoint.objects.filter(pk__in=self.deleted).delete()
+        if changed:
+            ItineraryPoint.objects.bulk_update(changed, ['day', 'order'])
+        if self.inserted:
+            ItineraryPoint.objects.bulk_create([point for *_, point in self.inserted])
+        # bulk_update y bulk_create no envían señales
+        refresh(self.itinerary.pk, touched_days)
+        return touched_days
+
+
+def apply_operations(itinerary_id, operations):
+    """
+    Aplica la lista de operaciones de forma atómica y devuelve los puntos
+    del itinerario ya renumerados. Lanza EditError si alguna es inválida,
+    en cuyo caso no se modifica nada.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise EditError(0, "Se requiere una lista de operaciones")
+
+    with transaction.atomic(), deferred_refresh():
+        itinerary = Itinerary.objects.select_for_update().get(pk=itinerary_id)
+        points = list(ItineraryPoint.objects.filter(itinerary=itinerary).only('id', 'itinerary', 'day', 'order'))
+        edit = ItineraryEdit(itinerary, points)
+        for index, operation in enumerate(operations):
+            edit.apply(index, operation)
+        edit.save()
+
+    return ItineraryPoint.objects.filter(itinerary_id=itinerary_id).select_related(
+        'point_of_interest', 'restaurant', 'event'
+    ).order_by('day', 'order')
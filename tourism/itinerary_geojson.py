@@ -0,0 +1,198 @@
+"""
+GeoJSON materializado de los itinerarios.
+
+Cada itinerario tiene una fila ItineraryGeoJSON con las features de sus
+puntos (POIs, restaurantes y eventos) y una LineString con la ruta de cada
+día, agrupadas por día. Cuando cambia un ItineraryPoint solo se recalculan
+los días afectados (ver signals.py); cuando cambia un lugar del catálogo,
+los días de los itinerarios que lo visitan.
+
+La fila se crea al pedir el GeoJSON por primera vez. Las señales solo
+actualizan filas ya existentes, así que los itinerarios que nadie consulta
+no cuestan nada.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from .models import ItineraryGeoJSON, ItineraryPoint
+
+# (campo de ItineraryPoint, tipo en las properties)
+POINT_KINDS = [
+    ('point_of_interest', 'poi'),
+    ('restaurant', 'restaurant'),
+    ('event', 'event'),
+]
+
+_pending = ContextVar('itinerary_geojson_pending', default=None)
+
+
+def point_feature(point):
+    for field, kind in POINT_KINDS:
+        place = getattr(point, field)
+        if place is not None:
+            break
+    else:
+        return None
+    return {
+        'type': 'Feature',
+        'id': point.pk,
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [place.location.x, place.location.y],
+        } if place.location else None,
+        'properties': {
+            'name': place.name,
+            'description': place.description,
+            'type': kind,
+            'place_id': place.pk,
+            'day': point.day,
+            'order': point.order,
+            'notes': point.notes,
+        },
+    }
+
+
+def route_feature(day, features):
+    coordinates = [feature['geometry']['coordinates'] for feature in features if feature['geometry']]
+    if len(coordinates) < 2:
+        return None
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': coordinates},
+        'properties': {'type': 'route', 'day': day},
+    }
+
+
+def build_days(itinerary_id, days=None):
+    """
+    Features y ruta de los días indicados (o de todos) en una sola consulta.
+    """
+    points = ItineraryPoint.objects.filter(itinerary_id=itinerary_id).select_related(
+        'point_of_interest', 'restaurant', 'event'
+    ).order_by('day', 'order', 'pk')
+    if days is not None:
+        points = points.filter(day__in=days)
+
+    features_by_day = {}
+    for point in points:
+        feature = point_feature(point)
+        if feature is not None:
+            features_by_day.setdefault(point.day, []).append(feature)
+
+    return {
+        str(day): {'features': features, 'route': route_feature(day, features)}
+        for day, features in features_by_day.items()
+    }
+
+
+def compute_etag(days):
+    raw = json.dumps(days, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def as_feature_collection(days):
+    features = []
+    for day in sorted(days, key=int):
+        features.extend(days[day]['features'])
+        if days[day]['route']:
+            features.append(days[day]['route'])
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def get_geojson(itinerary_id):
+    """
+    Devuelve (FeatureCollection, etag), materializando el itinerario si
+    todavía no lo estaba.
+    """
+    row = ItineraryGeoJSON.objects.filter(pk=itinerary_id).first()
+    if row is None:
+        days = build_days(itinerary_id)
+        row, _ = ItineraryGeoJSON.objects.get_or_create(
+            pk=itinerary_id, defaults={'days': days, 'etag': compute_etag(days)}
+        )
+    return as_feature_collection(row.days), row.etag
+
+
+def get_etag(itinerary_id):
+    return ItineraryGeoJSON.objects.filter(pk=itinerary_id).values_list('etag', flat=True).first()
+
+
+def days_containing(row, point_ids):
+    """
+    Días de la versión materializada en los que aparece alguno de los puntos.
+    """
+    point_ids = set(point_ids)
+    if not point_ids:
+        return set()
+    return {
+        int(day) for day, value in row.days.items()
+        if any(feature['id'] in point_ids for feature in value['features'])
+    }
+
+
+def refresh(itinerary_id, days=None, point_ids=()):
+    """
+    Recalcula en un itinerario ya materializado los días `days` (todos si
+    es None) y aquellos en los que estaban los puntos `point_ids`, por si
+    se han movido o borrado.
+    """
+    if days is not None:
+        # Los puntos creados desde la API pueden traer el día como texto
+        days = {int(day) for day in days}
+    pending = _pending.get()
+    if pending is not None:
+        # Dentro de deferred_refresh: se recalcula una sola vez al salir
+        pending_days, pending_points = pending.setdefault(itinerary_id, [set(), set()])
+        pending[itinerary_id] = [
+            None if days is None or pending_days is None else pending_days | set(days),
+            pending_points | set(point_ids),
+        ]
+        return
+
+    with transaction.atomic():
+        row = ItineraryGeoJSON.objects.select_for_update().filter(pk=itinerary_id).first()
+        if row is None:
+            return
+        if days is None:
+            row.days = build_days(itinerary_id)
+        else:
+            days = set(days) | days_containing(row, point_ids)
+            row.days = {day: value for day, value in row.days.items() if int(day) not in days}
+            row.days.update(build_days(itinerary_id, days))
+        row.etag = compute_etag(row.days)
+        row.save(update_fields=['days', 'etag', 'updated_at'])
+
+
+def refresh_days(pairs):
+    """
+    Recalcula una lista de pares (itinerario, día).
+    """
+    days_by_itinerary = defaultdict(set)
+    for itinerary_id, day in pairs:
+        days_by_itinerary[itinerary_id].add(day)
+    for itinerary_id, days in days_by_itinerary.items():
+        refresh(itinerary_id, days)
+
+
+@contextmanager
+def deferred_refresh():
+    """
+    Agrupa las actualizaciones del bloque y recalcula cada itinerario una
+    sola vez al salir, p. ej. en ediciones por lotes.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    for itinerary_id, (days, point_ids) in pending.items():
+        refresh(itinerary_id, days, point_ids)
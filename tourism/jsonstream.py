@@ -0,0 +1,77 @@
+"""
+Lectura incremental de los elementos de un array JSON.
+"""
+import json
+import re
+
+
+class ArrayItemParser:
+    """
+    Parser incremental de los objetos de un array JSON con clave `key`.
+
+    Recibe fragmentos de texto y devuelve cada objeto del array en cuanto su
+    JSON está completo, sin esperar al resto del documento. El texto ya
+    procesado se descarta, así que la memoria depende del tamaño de un
+    elemento y no del documento entero.
+    """
+
+    def __init__(self, key):
+        self.key_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buffer = ''
+        self.pos = 0
+        self.search_from = 0
+        self.in_array = False
+        self.finished = False
+        self.in_string = False
+        self.escape = False
+        self.depth = 0
+        self.start = None
+
+    def feed(self, text):
+        self.buffer += text
+        items = []
+        while not self.finished:
+            if not self.in_array:
+                match = self.key_re.search(self.buffer, self.search_from)
+                if not match:
+                    # La clave puede llegar partida entre fragmentos
+                    self.search_from = max(0, len(self.buffer) - 64)
+                    break
+                self.in_array = True
+                self.pos = match.end()
+                continue
+
+            if self.pos >= len(self.buffer):
+                break
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                if self.depth == 0:
+                    self.start = self.pos
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    items.append(json.loads(self.buffer[self.start:self.pos + 1]))
+            elif char == ']' and self.depth == 0:
+                self.finished = True
+            self.pos += 1
+
+        if self.in_array:
+            self.discard_processed()
+        return items
+
+    def discard_processed(self):
+        keep_from = self.start if self.depth > 0 else self.pos
+        self.buffer = self.buffer[keep_from:]
+        self.pos -= keep_from
+        if self.depth > 0:
+            self.start = 0
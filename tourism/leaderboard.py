@@ -0,0 +1,243 @@
+"""
+Clasificación de itinerarios por valoración con media bayesiana.
+
+    score = (C · m + suma) / (C + n)
+
+donde m es la media global de la valoración, C (PRIOR_WEIGHT) un número de
+reseñas ficticias con esa media y n y suma las del itinerario. Con pocas
+reseñas el score se acerca a la media global; con muchas, a la media propia.
+
+La clasificación de cada valoración se guarda ya ordenada en la caché,
+repartida en bloques de BLOCK_SIZE entradas (un bloque que pasa de
+2·BLOCK_SIZE al actualizarse se parte en dos). Hay además un índice con el primer
+elemento y el tamaño de cada bloque, y la entrada actual de cada itinerario.
+Pedir los N mejores solo lee el índice y los primeros bloques. Se construye
+a partir de ItineraryReviewStats (una fila por itinerario, sin recorrer las
+reseñas). Cuando cambian los agregados de un itinerario (ver signals.py) se
+busca su entrada anterior en el índice, se quita de su bloque y la nueva se
+inserta en el bloque que le corresponde: solo se reescriben el índice y
+esos bloques. La media global se fija al construir la clasificación y se
+recalcula cuando caduca (LEADERBOARD_TIMEOUT).
+"""
+import bisect
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ItineraryReviewStats
+from .review_stats import DIMENSIONS
+
+PRIOR_WEIGHT = 5
+BLOCK_SIZE = 200
+LEADERBOARD_TIMEOUT = 60 * 60
+# Si otro proceso está actualizando la clasificación se descarta y se
+# reconstruye en la siguiente lectura
+LOCK_TIMEOUT = 10
+
+
+def resolve_dimension(value):
+    """
+    Nombre de la valoración a partir del nombre o del campo de
+    ItineraryReview (p. ej. "accessibility" o "accessibility_rating").
+    """
+    for name, field in DIMENSIONS.items():
+        if value in (name, field):
+            return name
+    raise ValueError(f"Valoración desconocida: {value}")
+
+
+def bayesian_score(total, count, prior_mean, prior_weight=PRIOR_WEIGHT):
+    return (prior_weight * prior_mean + total) / (prior_weight + count)
+
+
+def make_entry(itinerary_id, entry, prior_mean):
+    # Tuplas ordenables directamente: mejor score, más reseñas, menor id
+    return (-bayesian_score(entry['sum'], entry['count'], prior_mean), -entry['count'], itinerary_id, entry['sum'])
+
+
+def cache_key(dimension, part):
+    return f'leaderboard:{dimension}:{part}'
+
+
+def block_key(dimension, block_id):
+    return cache_key(dimension, f'block:{block_id}')
+
+
+def entry_key(dimension, itinerary_id):
+    return cache_key(dimension, f'entry:{itinerary_id}')
+
+
+def remaining(index):
+    # Las actualizaciones no alargan la vida de la clasificación, para que
+    # la media global se recalcule cada LEADERBOARD_TIMEOUT
+    age = (timezone.now() - index['built_at']).total_seconds()
+    return max(1, LEADERBOARD_TIMEOUT - age)
+
+
+def build(dimension):
+    """
+    Calcula la clasificación completa de una valoración y la guarda.
+    Devuelve el índice: {prior_mean, prior_weight, built_at, size, blocks,
+    next_block}, con `blocks` como [id, primera entrada, tamaño].
+    """
+    rows = ItineraryReviewStats.objects.filter(
+        dimensions__has_key=dimension
+    ).values_list('itinerary_id', 'dimensions').iterator(chunk_size=5000)
+    stats = [
+        (itinerary_id, dimensions[dimension]) for itinerary_id, dimensions in rows
+        if dimensions[dimension]['count'] > 0
+    ]
+
+    count = sum(entry['count'] for _, entry in stats)
+    prior_mean = sum(entry['sum'] for _, entry in stats) / count if count else 0.0
+    entries = sorted(make_entry(itinerary_id, entry, prior_mean) for itinerary_id, entry in stats)
+    blocks = [entries[start:start + BLOCK_SIZE] for start in range(0, len(entries), BLOCK_SIZE)]
+    index = {
+        'prior_mean': prior_mean,
+        'prior_weight': PRIOR_WEIGHT,
+        'built_at': timezone.now(),
+        'size': len(entries),
+        'blocks': [[block_id, block[0], len(block)] for block_id, block in enumerate(blocks)],
+        'next_block': len(blocks),
+    }
+    values = {block_key(dimension, block_id): block for block_id, block in enumerate(blocks)}
+    values.update({entry_key(dimension, entry[2]): entry for entry in entries})
+    values[cache_key(dimension, 'index')] = index
+    cache.set_many(values, timeout=remaining(index))
+    return index
+
+
+def read_rows(dimension, index, limit, offset):
+    """
+    Filas de las posiciones offset+1 .. offset+limit, o None si falta algún
+    bloque en la caché.
+    """
+    wanted = []
+    position = 0
+    for block_id, _, count in index['blocks']:
+        if position + count > offset and position < offset + limit:
+            wanted.append((block_id, position))
+        position += count
+    if not wanted:
+        return []
+
+    keys = [block_key(dimension, block_id) for block_id, _ in wanted]
+    blocks = cache.get_many(keys)
+    if len(blocks) < len(keys):
+        return None
+    entries = [entry for key in keys for entry in blocks[key]]
+    skip = offset - wanted[0][1]
+
+    rows = []
+    for rank, (score, count, itinerary_id, total) in enumerate(entries[skip:skip + limit], offset + 1):
+        rows.append({
+            'rank': rank,
+            'itinerary_id': itinerary_id,
+            'score': -score,
+            'mean': total / -count,
+            'review_count': -count,
+        })
+    return rows
+
+
+def top(dimension, limit, offset=0):
+    """
+    Posiciones offset+1 .. offset+limit: (índice, filas). Cada fila es
+    {rank, itinerary_id, score, mean, review_count}.
+    """
+    index = cache.get(cache_key(dimension, 'index'))
+    rows = read_rows(dimension, index, limit, offset) if index is not None else None
+    if rows is None:
+        index = build(dimension)
+        rows = read_rows(dimension, index, limit, offset)
+    return index, rows
+
+
+def relocate(dimension, index, itinerary_id, new):
+    """
+    Sustituye la entrada del itinerario por `new` (None para quitarlo)
+    reescribiendo solo los bloques afectados. Devuelve False si la caché
+    no tiene los datos necesarios.
+    """
+    old = cache.get(entry_key(dimension, itinerary_id))
+    if old == new:
+        return True
+    blocks = index['blocks']
+    firsts = [first for _, first, _ in blocks]
+    changed = {}
+
+    def load(entry):
+        block_id = blocks[max(0, bisect.bisect_right(firsts, entry) - 1)][0]
+        if block_id not in changed:
+            changed[block_id] = cache.get(block_key(dimension, block_id))
+        return changed[block_id]
+
+    if old is not None:
+        entries = load(old)
+        position = bisect.bisect_left(entries, old) if entries is not None else 0
+        if entries is None or position == len(entries) or entries[position] != old:
+            return False
+        del entries[position]
+        index['size'] -= 1
+    if new is not None:
+        if not blocks:
+            blocks.append([index['next_block'], new, 0])
+            index['next_block'] += 1
+            changed[blocks[0][0]] = []
+            firsts = [new]
+        entries = load(new)
+        if entries is None:
+            return False
+        bisect.insort(entries, new)
+        index['size'] += 1
+
+    updated, values, removed = [], {}, []
+    for block_id, first, count in blocks:
+        entries = changed.get(block_id)
+        if entries is None:
+            updated.append([block_id, first, count])
+        elif not entries:
+            removed.append(block_key(dimension, block_id))
+        else:
+            parts = [(block_id, entries)]
+            if len(entries) > 2 * BLOCK_SIZE:
+                parts = [(block_id, entries[:BLOCK_SIZE]), (index['next_block'], entries[BLOCK_SIZE:])]
+                index['next_block'] += 1
+            for part_id, part in parts:
+                updated.append([part_id, part[0], len(part)])
+                values[block_key(dimension, part_id)] = part
+    index['blocks'] = updated
+
+    timeout = remaining(index)
+    if new is None:
+        removed.append(entry_key(dimension, itinerary_id))
+    else:
+        values[entry_key(dimension, itinerary_id)] = new
+    values[cache_key(dimension, 'index')] = index
+    cache.set_many(values, timeout=timeout)
+    if removed:
+        cache.delete_many(removed)
+    return True
+
+
+def update(itinerary_id, dimensions):
+    """
+    Recoloca un itinerario en las clasificaciones ya construidas con sus
+    agregados nuevos (`dimensions` vacío si se ha borrado).
+    """
+    for dimension in DIMENSIONS:
+        lock = cache_key(dimension, 'lock')
+        if not cache.add(lock, 1, timeout=LOCK_TIMEOUT):
+            cache.delete(cache_key(dimension, 'index'))
+            continue
+        try:
+            index = cache.get(cache_key(dimension, 'index'))
+            if index is None:
+                continue
+            entry = dimensions.get(dimension)
+            new = make_entry(itinerary_id, entry, index['prior_mean']) if entry and entry['count'] > 0 else None
+            if not relocate(dimension, index, itinerary_id, new):
+                # Faltan bloques en la caché: se reconstruye en la siguiente lectura
+                cache.delete(cache_key(dimension, 'index'))
+        finally:
+            cache.delete(lock)
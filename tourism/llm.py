@@ -0,0 +1,298 @@
+"""
+Generación de itinerarios con el modelo de lenguaje.
+
+Las peticiones se ejecutan en segundo plano (un pool de hilos del proceso)
+para no bloquear el worker de gunicorn. Cada trabajo se identifica por el
+hash de su contenido (consulta + POIs disponibles), así que las peticiones
+idénticas comparten trabajo y resultado. El estado de los trabajos se guarda
+en la caché `jobs`, compartida entre procesos, para que status_url responda
+desde cualquier worker. Si el worker que ejecuta un trabajo se reinicia, el
+trabajo queda pendiente; pasado PENDING_TIMEOUT se marca como fallido y la
+siguiente petición igual lo vuelve a encolar.
+
+El modo streaming (SSE) sí ocupa un hilo del worker mientras dura la
+generación, por eso gunicorn se arranca con workers `gthread` (ver Procfile
+y start.sh): con workers síncronos cada stream bloquearía un proceso entero.
+Si el mismo itinerario ya se está generando, el stream espera como mucho
+STREAM_WAIT_TIMEOUT y después remite al status_url del trabajo.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .jsonstream import ArrayItemParser
+
+logger = logging.getLogger(__name__)
+
+MODEL = "gpt-4-1106-preview"
+SYSTEM_PROMPT = "Eres un asistente especializado en crear itinerarios turísticos para La Palma. Debes responder SOLO con un JSON válido, sin texto adicional."
+JOB_CACHE_ALIAS = 'jobs'
+JOB_TIMEOUT = 60 * 60 * 24
+# Un trabajo pendiente más antiguo se da por perdido (p. ej. el worker se
+# reinició a mitad) y se marca como fallido
+PENDING_TIMEOUT = 60 * 10
+ABANDONED_ERROR = "La generación se interrumpió, vuelve a intentarlo"
+# Los errores del cliente del modelo se registran pero no se devuelven
+GENERATION_ERROR = "No se pudo generar el itinerario, vuelve a intentarlo"
+# Segundos entre consultas al esperar un trabajo en curso en modo streaming
+# y tiempo máximo de espera antes de remitir al status_url
+POLL_INTERVAL = 1
+STREAM_WAIT_TIMEOUT = 30
+
+PENDING = 'pending'
+DONE = 'done'
+ERROR = 'error'
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ITINERARY_WORKERS', 2),
+            thread_name_prefix='itinerary',
+        )
+    return _executor
+
+
+def get_client():
+    """
+    Cliente del modelo. Configurable con ITINERARY_LLM_CLIENT (ruta a una
+    clase compatible con `openai.OpenAI`), útil para usar un cliente falso.
+    """
+    client_class = import_string(getattr(settings, 'ITINERARY_LLM_CLIENT', 'openai.OpenAI'))
+    return client_class(api_key=settings.OPENAI_API_KEY)
+
+
+def build_prompt(user_query, available_pois):
+    context = "\n".join([
+        f"- {poi['name']} (ID: {poi['id']}): {poi['description']} - Tipo: {poi['type']}, Dificultad: {poi['difficulty']}"
+        for poi in available_pois
+    ])
+
+    return f"""
+        Como experto en turismo de La Palma, genera un itinerario basado en esta solicitud: {user_query}
+
+        Usa SOLO los siguientes puntos de interés disponibles:
+        {context}
+
+        IMPORTANTE: Responde SOLO con este JSON, sin ningún texto adicional:
+        {{
+            "display": "Tu itinerario ya está disponible en el mapa",
+            "data": {{
+                "title": "Título atractivo para el itinerario",
+                "description": "Descripción breve y atractiva del itinerario, máximo 50 palabras.",
+                "points": [
+                    {{
+                        "id": 1,
+                        "day": 1,
+                        "order": 1,
+                        "notes": "Consejo breve, máximo 10 palabras",
+                        "point_details": {{
+                            "name": "Nombre del lugar",
+                            "description": "Descripción breve, máximo 30 palabras",
+                            "type": "PARK",
+                            "estimated_time": "HH:MM",
+                            "coordinates": [longitud, latitud]
+                        }}
+                    }},
+                    {{
+                        "id": 2,
+                        "day": 2,
+                        "order": 1,
+                        "notes": "Consejo breve, máximo 10 palabras",
+                        "point_details": {{
+                            "name": "Nombre del lugar",
+                            "description": "Descripción breve, máximo 30 palabras",
+                            "type": "VIEWPOINT",
+                            "estimated_time": "HH:MM",
+                            "coordinates": [longitud, latitud]
+                        }}
+                    }}
+                ]
+            }}
+        }}
+        """
+
+
+def build_messages(user_query, available_pois):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(user_query, available_pois)},
+    ]
+
+
+def parse_response(content):
+    """
+    Limpia los bloques markdown que a veces añade el modelo y parsea el JSON.
+    """
+    cleaned = content.strip()
+    cleaned = re.sub(r"^```(?:json)?\s*", "", cleaned, flags=re.IGNORECASE)
+    cleaned = re.sub(r"\s*```$", "", cleaned)
+    gpt_response = json.loads(cleaned.strip())
+    return {
+        'display': gpt_response.get('display', ''),
+        'data': gpt_response.get('data', {}),
+    }
+
+
+def generate(user_query, available_pois):
+    """
+    Llama al modelo de forma síncrona y devuelve {'display', 'data'}.
+    """
+    response = get_client().chat.completions.create(
+        model=MODEL,
+        messages=build_messages(user_query, available_pois),
+    )
+    content = response.choices[0].message.content
+    logger.debug("Respuesta del modelo: %s", content)
+    return parse_response(content)
+
+
+def job_id_for(user_query, available_pois):
+    payload = json.dumps(
+        {'query': user_query.strip(), 'available_pois': available_pois},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def job_key(job_id):
+    return f'itinerary-job:{job_id}'
+
+
+def job_cache():
+    return caches[JOB_CACHE_ALIAS]
+
+
+def get_job(job_id):
+    """
+    Estado del trabajo. Los pendientes abandonados se marcan como fallidos.
+    """
+    job = job_cache().get(job_key(job_id))
+    if job and is_stale(job):
+        job = {'id': job_id, 'status': ERROR, 'error': ABANDONED_ERROR}
+        job_cache().set(job_key(job_id), job, timeout=JOB_TIMEOUT)
+    return job
+
+
+def run_job(job_id, user_query, available_pois):
+    try:
+        job = {'id': job_id, 'status': DONE, 'result': generate(user_query, available_pois)}
+    except Exception:
+        logger.exception("Error generando el itinerario %s", job_id)
+        job = {'id': job_id, 'status': ERROR, 'error': GENERATION_ERROR}
+    job_cache().set(job_key(job_id), job, timeout=JOB_TIMEOUT)
+    return job
+
+
+def is_stale(job):
+    return job['status'] == PENDING and time.time() - job.get('started_at', 0) > PENDING_TIMEOUT
+
+
+def claim_job(job_id):
+    """
+    Marca el trabajo como pendiente para generarlo. Devuelve (trabajo, True)
+    si se ha reclamado o (trabajo existente, False) si ya hay uno pendiente o
+    terminado con el mismo contenido. Los trabajos con error (también los
+    abandonados, ver get_job) se reclaman de nuevo.
+    """
+    pending = {'id': job_id, 'status': PENDING, 'started_at': time.time()}
+    if not job_cache().add(job_key(job_id), pending, timeout=JOB_TIMEOUT):
+        job = get_job(job_id)
+        if job and job['status'] != ERROR:
+            return job, False
+        job_cache().set(job_key(job_id), pending, timeout=JOB_TIMEOUT)
+    return pending, True
+
+
+def submit_job(user_query, available_pois):
+    """
+    Encola la generación y devuelve el estado del trabajo.
+
+    Si ya existe un trabajo con el mismo contenido se devuelve ese en lugar
+    de volver a llamar al modelo (ver claim_job). Con ITINERARY_EAGER se
+    ejecuta en el mismo hilo.
+    """
+    job_id = job_id_for(user_query, available_pois)
+    job, claimed = claim_job(job_id)
+    if not claimed:
+        return job
+
+    if getattr(settings, 'ITINERARY_EAGER', False):
+        return run_job(job_id, user_query, available_pois)
+
+    get_executor().submit(run_job, job_id, user_query, available_pois)
+    return job
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_itinerary(user_query, available_pois, status_url=None):
+    """
+    Genera eventos SSE: un `point` por cada punto del itinerario en cuanto
+    está completo y un `done` final con el itinerario entero (o `error`).
+
+    El stream comparte trabajos con submit_job: si el mismo itinerario ya se
+    está generando se espera a que termine (con comentarios SSE para mantener
+    viva la conexión) y si ya está en la caché se reproducen sus puntos sin
+    llamar al modelo. Si la espera supera STREAM_WAIT_TIMEOUT se termina con
+    un evento `pending` con el `status_url` del trabajo. Al terminar, el
+    resultado queda cacheado como un trabajo.
+    """
+    job_id = job_id_for(user_query, available_pois)
+    job, claimed = claim_job(job_id)
+    deadline = time.monotonic() + STREAM_WAIT_TIMEOUT
+    while not claimed and job['status'] == PENDING:
+        if time.monotonic() >= deadline:
+            yield sse('pending', {'job_id': job_id, 'status': PENDING, 'status_url': status_url})
+            return
+        yield ': pending\n\n'
+        time.sleep(POLL_INTERVAL)
+        job, claimed = claim_job(job_id)
+
+    if not claimed:
+        for point in job['result']['data'].get('points', []):
+            yield sse('point', point)
+        yield sse('done', {'job_id': job_id, **job['result']})
+        return
+
+    try:
+        stream = get_client().chat.completions.create(
+            model=MODEL,
+            messages=build_messages(user_query, available_pois),
+            stream=True,
+        )
+        parser = ArrayItemParser('points')
+        content = []
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            content.append(delta)
+            for point in parser.feed(delta):
+                yield sse('point', point)
+
+        result = parse_response(''.join(content))
+        job_cache().set(job_key(job_id), {'id': job_id, 'status': DONE, 'result': result}, timeout=JOB_TIMEOUT)
+        yield sse('done', {'job_id': job_id, **result})
+    except GeneratorExit:
+        # El cliente cerró la conexión: se libera el trabajo para que otra
+        # petición lo genere sin esperar a PENDING_TIMEOUT
+        job_cache().delete(job_key(job_id))
+        raise
+    except Exception:
+        logger.exception("Error generando el itinerario %s", job_id)
+        job = {'id': job_id, 'status': ERROR, 'error': GENERATION_ERROR}
+        job_cache().set(job_key(job_id), job, timeout=JOB_TIMEOUT)
+        yield sse('error', {'error': GENERATION_ERROR})
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tourism.benchmarks import BENCHMARKS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta un escenario de benchmark sobre datos sintéticos (los datos no se guardan)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Escenario: ' + ', '.join(sorted(BENCHMARKS)))
+        parser.add_argument('--rows', type=int, default=100_000, help='Filas sintéticas a generar')
+        parser.add_argument('--repeat', type=int, default=200, help='Repeticiones por medición')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla aleatoria')
+
+    def handle(self, *args, **options):
+        scenario = BENCHMARKS.get(options['name'])
+        if scenario is None:
+            raise CommandError(
+                f"Escenario desconocido '{options['name']}'. Opciones: {', '.join(sorted(BENCHMARKS))}"
+            )
+
+        try:
+            with transaction.atomic():
+                scenario(self, options)
+                raise Rollback()
+        except Rollback:
+            pass
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tourism.travel import DEFAULT_K, build
+
+
+class Command(BaseCommand):
+    help = 'Construye o actualiza la matriz de vecinos entre POIs, restaurantes y eventos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=DEFAULT_K, help='Vecinos guardados por lugar')
+        parser.add_argument('--full', action='store_true', help='Recalcular todas las filas')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = build(k=options['k'], full=options['full'])
+        mode = 'incremental' if result['incremental'] else 'completa'
+        self.stdout.write(self.style.SUCCESS(
+            f"Matriz {mode}: {result['recomputed']} de {result['locations']} filas recalculadas "
+            f"en {time.perf_counter() - start:.1f} s"
+        ))
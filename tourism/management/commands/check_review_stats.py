@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tourism.review_stats import check_consistency
+
+
+class Command(BaseCommand):
+    help = 'Comprueba que los agregados de reseñas de los itinerarios coinciden con las reseñas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recalcular los itinerarios desajustados')
+
+    def handle(self, *args, **options):
+        mismatched = check_consistency(fix=options['fix'])
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('Los agregados de reseñas están al día'))
+            return
+
+        ids = ', '.join(str(itinerary_id) for itinerary_id in mismatched[:20])
+        more = f' y {len(mismatched) - 20} más' if len(mismatched) > 20 else ''
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Recalculados {len(mismatched)} itinerarios: {ids}{more}'
+            ))
+            return
+        raise CommandError(f'{len(mismatched)} itinerarios desajustados: {ids}{more}. Usar --fix para corregirlos')
@@ -0,0 +1,32 @@
+from django.contrib.gis.gdal import GDALException
+from django.core.management.base import BaseCommand, CommandError
+
+from tourism.importers import DEFAULT_BATCH_SIZE, IMPORT_LAYERS, import_file
+
+
+class Command(BaseCommand):
+    help = 'Importa POIs, restaurantes o eventos desde GeoJSON, NDJSON, CSV o shapefile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('layer', choices=sorted(IMPORT_LAYERS))
+        parser.add_argument('path', help='Fichero a importar')
+        parser.add_argument('--format', choices=['geojson', 'ndjson', 'csv', 'shapefile'],
+                            help='Formato del fichero (por defecto, según la extensión)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            result = import_file(options['layer'], options['path'], options['format'], options['batch_size'])
+        except (OSError, ValueError, GDALException) as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(f"Fila {error['row']}: {error['error']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... y {result.error_count - len(result.errors)} errores más")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.saved} filas guardadas de {result.rows} "
+            f"({result.error_count} errores) en {result.elapsed:.1f} s "
+            f"- {result.rows_per_second:,.0f} filas/s"
+        ))
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0003_alter_pointofinterest_address_and_more'),
+    ]
+
+    # Índice GiST funcional sobre location::geography para que las búsquedas
+    # KNN (`<->`) en metros recorran el índice en orden de cercanía.
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS tourism_poi_location_geog_idx '
+                'ON tourism_pointofinterest USING GIST ((location::geography));',
+            reverse_sql='DROP INDEX IF EXISTS tourism_poi_location_geog_idx;',
+        ),
+    ]
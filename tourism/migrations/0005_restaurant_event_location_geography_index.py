@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0004_pointofinterest_location_geography_index'),
+    ]
+
+    # Índices GiST funcionales sobre location::geography usados por los
+    # filtros ST_DWithin en metros de spatial.within_radius.
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS tourism_restaurant_location_geog_idx '
+                'ON tourism_restaurant USING GIST ((location::geography));',
+            reverse_sql='DROP INDEX IF EXISTS tourism_restaurant_location_geog_idx;',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS tourism_event_location_geog_idx '
+                'ON tourism_event USING GIST ((location::geography));',
+            reverse_sql='DROP INDEX IF EXISTS tourism_event_location_geog_idx;',
+        ),
+    ]
@@ -0,0 +1,110 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# (tabla, columna principal, columna secundaria)
+SEARCH_TABLES = [
+    ('tourism_pointofinterest', 'name', 'description'),
+    ('tourism_restaurant', 'name', 'description'),
+    ('tourism_event', 'name', 'description'),
+    ('tourism_itinerary', 'title', 'description'),
+    ('tourism_itineraryreview', None, 'comment'),
+]
+
+
+def vector_sql(prefix, title, body):
+    """
+    tsvector en español (pesos A/B) y en inglés (pesos C/D).
+    """
+    parts = []
+    for config, (title_weight, body_weight) in [('spanish', 'AB'), ('english', 'CD')]:
+        if title:
+            parts.append(f"setweight(to_tsvector('{config}', coalesce({prefix}{title}, '')), '{title_weight}')")
+        parts.append(f"setweight(to_tsvector('{config}', coalesce({prefix}{body}, '')), '{body_weight}')")
+    return ' || '.join(parts)
+
+
+def trigger_sql(table, title, body):
+    return f"""
+        CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {vector_sql('NEW.', title, body)};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER {table}_search_vector_trigger
+            BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update();
+
+        UPDATE {table} SET search_vector = {vector_sql('', title, body)};
+    """
+
+
+def reverse_trigger_sql(table):
+    return f"""
+        DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};
+        DROP FUNCTION IF EXISTS {table}_search_vector_update();
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0005_restaurant_event_location_geography_index'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ] + [
+        migrations.AddField(
+            model_name=model_name,
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        )
+        for model_name in ['pointofinterest', 'restaurant', 'event', 'itinerary', 'itineraryreview']
+    ] + [
+        migrations.AddIndex(
+            model_name='pointofinterest',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='pointofinterest_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pointofinterest',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='pointofinterest_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='restaurant_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='restaurant_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='event_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='event_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='itinerary_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='itinerary_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='itineraryreview',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='itineraryreview_search_idx'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=trigger_sql(table, title, body),
+            reverse_sql=reverse_trigger_sql(table),
+        )
+        for table, title, body in SEARCH_TABLES
+    ]
@@ -0,0 +1,21 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0006_full_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItineraryGeoJSON',
+            fields=[
+                ('itinerary', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geojson', serialize=False, to='tourism.itinerary')),
+                ('days', models.JSONField(default=dict, help_text='Features y ruta de cada día, por número de día')),
+                ('etag', models.CharField(max_length=40)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,133 @@
+import re
+import unicodedata
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.backends.postgresql.psycopg_any import NumericRange
+
+# Copia de la interpretación de tourism.opening_hours en el momento de esta
+# migración, para que cambios posteriores no alteren lo que hace.
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+DAY_NAMES = [
+    ('monday', 'mon', 'lunes', 'lun'),
+    ('tuesday', 'tue', 'martes', 'mar'),
+    ('wednesday', 'wed', 'miercoles', 'mie'),
+    ('thursday', 'thu', 'jueves', 'jue'),
+    ('friday', 'fri', 'viernes', 'vie'),
+    ('saturday', 'sat', 'sabado', 'sab'),
+    ('sunday', 'sun', 'domingo', 'dom'),
+]
+DAY_INDEX = {name: index for index, names in enumerate(DAY_NAMES) for name in names}
+CLOSED = {'', 'closed', 'cerrado'}
+TIME_RE = re.compile(r'^(\d{1,2})(?::(\d{2}))?$')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text).strip().lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def parse_days(key):
+    key = normalize(key)
+    if '-' in key:
+        first, last = (DAY_INDEX[part.strip()] for part in key.split('-', 1))
+        return [(first + offset) % 7 for offset in range((last - first) % 7 + 1)]
+    return [DAY_INDEX[key]]
+
+
+def parse_time(value):
+    match = TIME_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Hora inválida: {value}")
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if hours > 24 or minutes > 59 or (hours == 24 and minutes):
+        raise ValueError(f"Hora inválida: {value}")
+    return hours * 60 + minutes
+
+
+def parse_ranges(value):
+    if value is None or value is False:
+        return []
+    if isinstance(value, dict):
+        value = [value]
+    if isinstance(value, str):
+        if normalize(value) in CLOSED:
+            return []
+        value = value.split(',')
+
+    ranges = []
+    for item in value:
+        if isinstance(item, dict):
+            start, end = item.get('open'), item.get('close')
+        else:
+            if normalize(item) in CLOSED:
+                continue
+            start, end = str(item).split('-', 1)
+        start, end = parse_time(start), parse_time(end)
+        if end <= start:
+            end += DAY_MINUTES
+        ranges.append((start, end))
+    return ranges
+
+
+def weekly_intervals(opening_hours):
+    intervals = []
+    if not isinstance(opening_hours, dict):
+        return intervals
+    for key, value in opening_hours.items():
+        try:
+            days = parse_days(key)
+            ranges = parse_ranges(value)
+        except (KeyError, ValueError, TypeError, AttributeError):
+            continue
+        for day in days:
+            for start, end in ranges:
+                start, end = day * DAY_MINUTES + start, day * DAY_MINUTES + end
+                if end > WEEK_MINUTES:
+                    intervals.append((start, WEEK_MINUTES))
+                    intervals.append((0, end - WEEK_MINUTES))
+                else:
+                    intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def populate_intervals(apps, schema_editor):
+    Restaurant = apps.get_model('tourism', 'Restaurant')
+    RestaurantOpeningInterval = apps.get_model('tourism', 'RestaurantOpeningInterval')
+    RestaurantOpeningInterval.objects.bulk_create([
+        RestaurantOpeningInterval(restaurant_id=restaurant.pk, minutes=NumericRange(start, end, '[)'))
+        for restaurant in Restaurant.objects.only('id', 'opening_hours').iterator()
+        for start, end in weekly_intervals(restaurant.opening_hours)
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0007_itinerarygeojson'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantOpeningInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minutes', django.contrib.postgres.fields.ranges.IntegerRangeField(help_text='Minutos desde el lunes a las 00:00 (hora de Canarias), [inicio, fin)')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_intervals', to='tourism.restaurant')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(fields=['minutes'], name='restaurant_opening_minutes_idx')],
+            },
+        ),
+        migrations.RunPython(populate_intervals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+# Rango cerrado [start_date, end_date]; NULL si las fechas están invertidas
+PERIOD_SQL = "CASE WHEN {prefix}end_date >= {prefix}start_date THEN tstzrange({prefix}start_date, {prefix}end_date, '[]') END"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0008_restaurantopeninginterval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='period',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['period'], name='event_period_idx'),
+        ),
+        migrations.RunSQL(
+            sql=f"""
+                CREATE OR REPLACE FUNCTION tourism_event_period_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.period := {PERIOD_SQL.format(prefix='NEW.')};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER tourism_event_period_trigger
+                    BEFORE INSERT OR UPDATE ON tourism_event
+                    FOR EACH ROW EXECUTE FUNCTION tourism_event_period_update();
+
+                UPDATE tourism_event SET period = {PERIOD_SQL.format(prefix='')};
+            """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS tourism_event_period_trigger ON tourism_event;
+                DROP FUNCTION IF EXISTS tourism_event_period_update();
+            """,
+        ),
+        # Índice GiST combinado para "eventos en estas fechas cerca de aquí":
+        # ubicación (como en spatial.within_radius) y periodo en una sola búsqueda
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS tourism_event_location_period_idx '
+                'ON tourism_event USING GIST ((location::geography), period);',
+            reverse_sql='DROP INDEX IF EXISTS tourism_event_location_period_idx;',
+        ),
+    ]
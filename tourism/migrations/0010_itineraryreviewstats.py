@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Agregados iniciales calculados como tourism.review_stats en el momento de
+# esta migración, para que cambios posteriores no alteren lo que hace.
+DIMENSIONS = {
+    'rating': 'rating',
+    'scenery': 'scenery_rating',
+    'accessibility': 'accessibility_rating',
+    'signposting': 'signposting_rating',
+    'cleanliness': 'cleanliness_rating',
+    'services': 'services_rating',
+}
+STARS = 5
+
+
+def populate_stats(apps, schema_editor):
+    ItineraryReview = apps.get_model('tourism', 'ItineraryReview')
+    ItineraryReviewStats = apps.get_model('tourism', 'ItineraryReviewStats')
+
+    stats = {}
+    rows = ItineraryReview.objects.values('itinerary_id', *DIMENSIONS.values()).iterator()
+    for row in rows:
+        dimensions = stats.setdefault(row['itinerary_id'], {})
+        for name, field in DIMENSIONS.items():
+            value = row[field]
+            if value is None or not 1 <= value <= STARS:
+                continue
+            entry = dimensions.setdefault(name, {'count': 0, 'sum': 0, 'histogram': [0] * STARS})
+            entry['count'] += 1
+            entry['sum'] += value
+            entry['histogram'][value - 1] += 1
+
+    objects = []
+    for itinerary_id, dimensions in stats.items():
+        overall = dimensions.get('rating') or {'count': 0, 'sum': 0}
+        objects.append(ItineraryReviewStats(
+            itinerary_id=itinerary_id,
+            dimensions=dimensions,
+            review_count=overall['count'],
+            average_rating=overall['sum'] / overall['count'] if overall['count'] else None,
+        ))
+    ItineraryReviewStats.objects.bulk_create(objects, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0009_event_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItineraryReviewStats',
+            fields=[
+                ('itinerary', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_stats', serialize=False, to='tourism.itinerary')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.FloatField(blank=True, null=True)),
+                ('dimensions', models.JSONField(default=dict, help_text='Por valoración: count, sum e histograma de 1 a 5 estrellas')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
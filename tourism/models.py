@@ -1,5 +1,8 @@
 from django.contrib.gis.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import DateTimeRangeField, IntegerRangeField
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVectorField
 
 class BaseLocation(models.Model):
     name = models.CharField(max_length=200)
@@ -8,11 +11,20 @@ class BaseLocation(models.Model):
     address = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Mantenido por un trigger de PostgreSQL (ver migración 0006)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         abstract = True
+        indexes = [
+            GinIndex(fields=['search_vector'], name='%(class)s_search_idx'),
+            GinIndex(fields=['name'], name='%(class)s_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
 class PointOfInterest(models.Model):
+    # Escala ordinal de dificultad usada en estadísticas y ordenaciones
+    DIFFICULTY_LEVELS = {'EASY': 1, 'MEDIUM': 2, 'HARD': 3}
+
     name = models.CharField(max_length=200)
     description = models.TextField()
     location = models.PointField(null=True, blank=True)  # Hacemos el campo opcional temporalmente
@@ -33,6 +45,13 @@ class PointOfInterest(models.Model):
     estimated_time = models.DurationField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='pointofinterest_search_idx'),
+            GinIndex(fields=['name'], name='pointofinterest_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.name
@@ -51,11 +70,34 @@ class Restaurant(BaseLocation):
     def __str__(self):
         return f"{self.name} ({self.get_cuisine_type_display()})"
 
+class RestaurantOpeningInterval(models.Model):
+    """
+    Tramo de apertura semanal de un restaurante, derivado de `opening_hours`
+    (ver tourism.opening_hours).
+    """
+    restaurant = models.ForeignKey(Restaurant, related_name='opening_intervals', on_delete=models.CASCADE)
+    minutes = IntegerRangeField(help_text="Minutos desde el lunes a las 00:00 (hora de Canarias), [inicio, fin)")
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=['minutes'], name='restaurant_opening_minutes_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id}: {self.minutes}"
+
 class Event(BaseLocation):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     url = models.URLField(blank=True)
+    # [start_date, end_date] mantenido por un trigger de PostgreSQL (ver migración 0009)
+    period = DateTimeRangeField(null=True, blank=True, editable=False)
+
+    class Meta(BaseLocation.Meta):
+        indexes = BaseLocation.Meta.indexes + [
+            GistIndex(fields=['period'], name='event_period_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.start_date.date()})"
@@ -69,36 +111,23 @@ class Itinerary(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_completed = models.BooleanField(default=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='itinerary_search_idx'),
+            GinIndex(fields=['title'], name='itinerary_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.start_date} - {self.end_date})"
 
     def get_points_geojson(self):
-        points = []
-        for point in self.points.all():
-            if point.point_of_interest:
-                points.append({
-                    'type': 'Feature',
-                    'geometry': {
-                        'type': 'Point',
-                        'coordinates': [
-                            point.point_of_interest.location.x,
-                            point.point_of_interest.location.y
-                        ]
-                    },
-                    'properties': {
-                        'name': point.point_of_interest.name,
-                        'description': point.point_of_interest.description,
-                        'type': 'poi',
-                        'day': point.day,
-                        'order': point.order,
-                        'notes': point.notes
-                    }
-                })
-        return {
-            'type': 'FeatureCollection',
-            'features': points
-        }
+        """
+        GeoJSON materializado del itinerario (ver tourism.itinerary_geojson).
+        """
+        from .itinerary_geojson import get_geojson
+        return get_geojson(self.pk)[0]
 
 class ItineraryPoint(models.Model):
     itinerary = models.ForeignKey(Itinerary, related_name='points', on_delete=models.CASCADE)
@@ -119,6 +148,19 @@ class ItineraryPoint(models.Model):
         point = self.point_of_interest or self.restaurant or self.event
         return f"Day {self.day}: {point.name if point else 'Deleted point'}"
 
+class ItineraryGeoJSON(models.Model):
+    """
+    GeoJSON precalculado de un itinerario: las features de cada día y su ruta.
+    Se actualiza por días cuando cambian sus puntos.
+    """
+    itinerary = models.OneToOneField(Itinerary, primary_key=True, related_name='geojson', on_delete=models.CASCADE)
+    days = models.JSONField(default=dict, help_text="Features y ruta de cada día, por número de día")
+    etag = models.CharField(max_length=40)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"GeoJSON de {self.itinerary_id}"
+
 class ItineraryReview(models.Model):
     RATING_CHOICES = [
         (1, '1 Estrella'),
@@ -141,13 +183,32 @@ class ItineraryReview(models.Model):
     signposting_rating = models.IntegerField(choices=RATING_CHOICES, null=True, blank=True, verbose_name="Valoración de la señalización")
     cleanliness_rating = models.IntegerField(choices=RATING_CHOICES, null=True, blank=True, verbose_name="Valoración de la limpieza")
     services_rating = models.IntegerField(choices=RATING_CHOICES, null=True, blank=True, verbose_name="Valoración de los servicios")
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         unique_together = ['itinerary', 'user']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='itineraryreview_search_idx'),
+        ]
     
     def __str__(self):
         return f"Review de {self.user.username} para {self.itinerary.title} ({self.rating} estrellas)"
 
+class ItineraryReviewStats(models.Model):
+    """
+    Agregados de las reseñas de un itinerario: número, media e histograma de
+    cada valoración. Se actualizan al crear, modificar o borrar reseñas (ver
+    tourism.review_stats).
+    """
+    itinerary = models.OneToOneField(Itinerary, primary_key=True, related_name='review_stats', on_delete=models.CASCADE)
+    review_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(null=True, blank=True)
+    dimensions = models.JSONField(default=dict, help_text="Por valoración: count, sum e histograma de 1 a 5 estrellas")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Valoraciones de {self.itinerary_id}"
+
 class ReviewPhoto(models.Model):
     review = models.ForeignKey(ItineraryReview, related_name='photos', on_delete=models.CASCADE)
     photo = models.ImageField(upload_to='review_photos/')
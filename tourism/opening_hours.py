@@ -0,0 +1,172 @@
+"""
+Horarios de apertura de los restaurantes como intervalos semanales.
+
+`Restaurant.opening_hours` es un JSON libre por día de la semana. Al guardar
+un restaurante se normaliza en filas RestaurantOpeningInterval con rangos
+[inicio, fin) de minutos desde el lunes a las 00:00 en hora de Canarias,
+indexados con GiST, de modo que "abierto ahora" es una consulta SQL.
+
+Formatos aceptados por día (claves en inglés o español, completas o
+abreviadas, y rangos de días como "monday-friday"):
+
+    {"monday": "12:00-16:00, 20:00-23:30"}
+    {"lunes": ["12:00-16:00", "20:00-01:00"]}
+    {"mon": [{"open": "12:00", "close": "16:00"}]}
+    {"sunday": "closed"}
+
+Un cierre anterior o igual a la apertura (20:00-01:00) continúa al día
+siguiente; el domingo por la noche continúa el lunes.
+"""
+import re
+import unicodedata
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.db.backends.postgresql.psycopg_any import NumericRange
+
+from .models import RestaurantOpeningInterval
+
+TIMEZONE = ZoneInfo('Atlantic/Canary')
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+
+DAY_NAMES = [
+    ('monday', 'mon', 'lunes', 'lun'),
+    ('tuesday', 'tue', 'martes', 'mar'),
+    ('wednesday', 'wed', 'miercoles', 'mie'),
+    ('thursday', 'thu', 'jueves', 'jue'),
+    ('friday', 'fri', 'viernes', 'vie'),
+    ('saturday', 'sat', 'sabado', 'sab'),
+    ('sunday', 'sun', 'domingo', 'dom'),
+]
+DAY_INDEX = {name: index for index, names in enumerate(DAY_NAMES) for name in names}
+CLOSED = {'', 'closed', 'cerrado'}
+
+TIME_RE = re.compile(r'^(\d{1,2})(?::(\d{2}))?$')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text).strip().lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def parse_days(key):
+    """
+    Índices (0 = lunes) de una clave como "monday" o "lunes-viernes".
+    """
+    key = normalize(key)
+    if '-' in key:
+        first, last = (DAY_INDEX[part.strip()] for part in key.split('-', 1))
+        return [(first + offset) % 7 for offset in range((last - first) % 7 + 1)]
+    return [DAY_INDEX[key]]
+
+
+def parse_time(value):
+    match = TIME_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Hora inválida: {value}")
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if hours > 24 or minutes > 59 or (hours == 24 and minutes):
+        raise ValueError(f"Hora inválida: {value}")
+    return hours * 60 + minutes
+
+
+def parse_ranges(value):
+    """
+    Pares (apertura, cierre) en minutos del día. El cierre puede superar
+    1440 si el tramo termina al día siguiente.
+    """
+    if value is None or value is False:
+        return []
+    if isinstance(value, dict):
+        value = [value]
+    if isinstance(value, str):
+        if normalize(value) in CLOSED:
+            return []
+        value = value.split(',')
+
+    ranges = []
+    for item in value:
+        if isinstance(item, dict):
+            start, end = item.get('open'), item.get('close')
+        else:
+            if normalize(item) in CLOSED:
+                continue
+            start, end = str(item).split('-', 1)
+        start, end = parse_time(start), parse_time(end)
+        if end <= start:
+            end += DAY_MINUTES
+        ranges.append((start, end))
+    return ranges
+
+
+def weekly_intervals(opening_hours):
+    """
+    Intervalos [inicio, fin) en minutos de la semana, fusionados. Las
+    entradas que no se pueden interpretar se ignoran.
+    """
+    intervals = []
+    if not isinstance(opening_hours, dict):
+        return intervals
+    for key, value in opening_hours.items():
+        try:
+            days = parse_days(key)
+            ranges = parse_ranges(value)
+        except (KeyError, ValueError, TypeError, AttributeError):
+            continue
+        for day in days:
+            for start, end in ranges:
+                start, end = day * DAY_MINUTES + start, day * DAY_MINUTES + end
+                if end > WEEK_MINUTES:
+                    # El domingo por la noche continúa el lunes
+                    intervals.append((start, WEEK_MINUTES))
+                    intervals.append((0, end - WEEK_MINUTES))
+                else:
+                    intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def week_minute(moment=None):
+    """
+    Minuto de la semana (0 = lunes 00:00) de un instante en hora de
+    Canarias. Las fechas sin zona horaria se interpretan en esa hora.
+    """
+    moment = moment or timezone.now()
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=TIMEZONE)
+    local = moment.astimezone(TIMEZONE)
+    return local.weekday() * DAY_MINUTES + local.hour * 60 + local.minute
+
+
+def sync_opening_intervals(restaurants, batch_size=2000):
+    """
+    Regenera los intervalos de los restaurantes a partir de su JSON, por lotes.
+    """
+    iterator = iter(restaurants)
+    while batch := list(islice(iterator, batch_size)):
+        RestaurantOpeningInterval.objects.filter(restaurant__in=[r.pk for r in batch]).delete()
+        RestaurantOpeningInterval.objects.bulk_create([
+            RestaurantOpeningInterval(restaurant_id=restaurant.pk, minutes=NumericRange(start, end, '[)'))
+            for restaurant in batch
+            for start, end in weekly_intervals(restaurant.opening_hours)
+        ])
+
+
+def open_at(queryset, moment=None):
+    """
+    Filtra los restaurantes abiertos en `moment` (por defecto, ahora).
+    """
+    minute = week_minute(moment)
+    intervals = RestaurantOpeningInterval.objects.filter(
+        restaurant=OuterRef('pk'), minutes__contains=NumericRange(minute, minute + 1)
+    )
+    return queryset.filter(Exists(intervals))
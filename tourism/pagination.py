@@ -0,0 +1,95 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class NearestCursorPagination(BasePagination):
+    """
+    Paginación por cursor (keyset) para búsquedas de vecinos más cercanos.
+
+    El queryset debe venir anotado con `knn_distance` (ver spatial.KNNDistance).
+    El cursor guarda la distancia y el id del último elemento devuelto, de modo
+    que la página siguiente continúa "hacia fuera" desde ese anillo sin volver
+    a recorrer los resultados anteriores.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_params = ('k', 'limit')
+    page_size = 20
+    max_page_size = 100
+    distance_field = 'knn_distance'
+
+    def get_page_size(self, request):
+        for param in self.page_size_query_params:
+            value = request.query_params.get(param)
+            if value is not None:
+                try:
+                    size = int(value)
+                except ValueError:
+                    raise ValidationError({param: "Debe ser un número entero"})
+                if size < 1:
+                    raise ValidationError({param: "Debe ser mayor que 0"})
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return float(data['d']), int(data['id'])
+        except (ValueError, TypeError, KeyError):
+            raise ValidationError({self.cursor_query_param: "Cursor inválido"})
+
+    def encode_cursor(self, distance, pk):
+        data = json.dumps({'d': distance, 'id': pk}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            distance, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{self.distance_field}__gt': distance}) |
+                Q(**{self.distance_field: distance, 'pk__gt': pk})
+            )
+
+        # Se pide un elemento extra para saber si hay página siguiente
+        page = list(queryset.order_by(self.distance_field, 'pk')[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+
+        self.next_cursor = None
+        if self.has_next:
+            last = page[-1]
+            self.next_cursor = self.encode_cursor(getattr(last, self.distance_field), last.pk)
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        # Se mantiene el formato FeatureCollection para los serializers GeoJSON
+        features = data['features'] if isinstance(data, dict) and 'features' in data else data
+        return Response({
+            'type': 'FeatureCollection',
+            'next_cursor': self.next_cursor,
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'features': features,
+        })
@@ -0,0 +1,66 @@
+"""
+Consultas temporales sobre eventos.
+
+`Event.period` es el rango [start_date, end_date] mantenido por un trigger e
+indexado con GiST, solo y combinado con la ubicación (migración 0009). Los
+filtros por fechas se expresan como operadores de rango (&&, <@) para que
+PostgreSQL pueda usar esos índices. El trigger deja period a NULL si las
+fechas están invertidas (end_date < start_date); esos eventos se filtran
+con las columnas de fecha, como antes de existir period.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_moment(value):
+    """
+    Fecha y hora ISO 8601, o solo fecha (a medianoche en la zona horaria
+    del proyecto). Lanza ValueError si no es válida.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Fecha inválida: {value}")
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def overlapping(queryset, start=None, end=None):
+    """
+    Eventos que coinciden en algún momento con [start, end]. Un extremo
+    None deja el intervalo abierto por ese lado.
+    """
+    inverted = Q(period__isnull=True)
+    if start is not None:
+        inverted &= Q(end_date__gte=start)
+    if end is not None:
+        inverted &= Q(start_date__lte=end)
+    return queryset.filter(Q(period__overlap=DateTimeTZRange(start, end, '[]')) | inverted)
+
+
+def contained_in(queryset, start=None, end=None):
+    """
+    Eventos que empiezan y terminan dentro de [start, end].
+    """
+    inverted = Q(period__isnull=True)
+    if start is not None:
+        inverted &= Q(start_date__gte=start)
+    if end is not None:
+        inverted &= Q(end_date__lte=end)
+    return queryset.filter(Q(period__contained_by=DateTimeTZRange(start, end, '[]')) | inverted)
+
+
+def itinerary_window(itinerary):
+    """
+    Desde el primer día del itinerario a las 00:00 hasta el final del último.
+    """
+    start = timezone.make_aware(datetime.combine(itinerary.start_date, time.min))
+    end = timezone.make_aware(datetime.combine(itinerary.end_date + timedelta(days=1), time.min))
+    return start, end - timedelta(microseconds=1)
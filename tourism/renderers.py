@@ -0,0 +1,169 @@
+"""
+Renderer y parser JSON basados en orjson.
+
+La salida es la misma que la de `rest_framework.renderers.JSONRenderer`
+(compacta, UTF-8, con U+2028/U+2029 escapados). Los tipos que orjson no
+codifica igual que DRF (fechas, Decimal, timedelta, cadenas perezosas...)
+se delegan en el JSONEncoder de DRF.
+
+También hay un formato columnar para las capas del mapa, que se pide por
+negociación de contenido (cabecera Accept o `?format=columnar|msgpack`).
+Cada FeatureCollection se convierte en arrays paralelos:
+
+    {
+        "type": "ColumnarFeatureCollection",
+        "length": 2,
+        "ids": [1, 2],
+        "coordinates": [lng1, lat1, lng2, lat2],
+        "properties": {"name": ["Roque", "Nogales"], "type": [4, 3], ...},
+        "enums": {"type": ["MONUMENT", "MUSEUM", "PARK", "BEACH", "VIEWPOINT", "OTHER"], ...}
+    }
+
+Los campos con choices del serializer se codifican como índices en `enums`,
+que siguen el orden de las choices y por tanto son estables entre
+respuestas. El resto de claves de la respuesta (paginación) se conservan.
+"""
+from functools import lru_cache
+
+import msgpack
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.fields import ChoiceField
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+COLUMNAR_TYPE = 'ColumnarFeatureCollection'
+
+_encoder = JSONEncoder()
+
+
+def default(obj):
+    return _encoder.default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        options = OPTIONS
+        renderer_context = renderer_context or {}
+        if (accepted_media_type and 'indent' in accepted_media_type) or renderer_context.get('indent'):
+            # orjson solo admite sangría de 2 espacios (API navegable)
+            options |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=default, option=options)
+        # Igual que DRF: escapar separadores de línea no válidos en JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+
+@lru_cache(maxsize=None)
+def serializer_enums(serializer_class):
+    """
+    Valores posibles de los campos con choices del serializer.
+    """
+    return {
+        name: list(field.choices)
+        for name, field in serializer_class().fields.items()
+        if isinstance(field, ChoiceField)
+    }
+
+
+def view_enums(renderer_context):
+    view = (renderer_context or {}).get('view')
+    if view is None or not hasattr(view, 'get_serializer_class'):
+        return {}
+    return serializer_enums(view.get_serializer_class())
+
+
+def to_columns(collection, enums):
+    """
+    Convierte una FeatureCollection de puntos en arrays paralelos.
+    """
+    features = collection['features']
+    ids, coordinates = [], []
+    names = {}
+    for feature in features:
+        ids.append(feature.get('id'))
+        geometry = feature.get('geometry')
+        coordinates.extend(geometry['coordinates'][:2] if geometry else (None, None))
+        names.update(dict.fromkeys(feature.get('properties') or ()))
+
+    properties, used_enums = {}, {}
+    for name in names:
+        values = [(feature.get('properties') or {}).get(name) for feature in features]
+        if name in enums:
+            # Valores fuera de las choices (datos antiguos) se añaden al final
+            choices = list(enums[name])
+            codes = {value: code for code, value in enumerate(choices)}
+            for index, value in enumerate(values):
+                if value is None:
+                    continue
+                if value not in codes:
+                    codes[value] = len(choices)
+                    choices.append(value)
+                values[index] = codes[value]
+            used_enums[name] = choices
+        properties[name] = values
+
+    result = {'type': COLUMNAR_TYPE}
+    result.update((key, value) for key, value in collection.items() if key not in ('type', 'features'))
+    result.update({
+        'length': len(features),
+        'ids': ids,
+        'coordinates': coordinates,
+        'properties': properties,
+        'enums': used_enums,
+    })
+    return result
+
+
+def columnar(data, enums):
+    """
+    Aplica `to_columns` a la FeatureCollection de la respuesta, también si
+    va dentro de `results` (paginación). Lo demás se devuelve sin cambios.
+    """
+    if isinstance(data, dict):
+        if data.get('type') == 'FeatureCollection' and 'features' in data:
+            return to_columns(data, enums)
+        if 'results' in data:
+            return {**data, 'results': columnar(data['results'], enums)}
+    return data
+
+
+class ColumnarJSONRenderer(ORJSONRenderer):
+    media_type = 'application/vnd.palma.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar(data, view_enums(renderer_context)), accepted_media_type, renderer_context)
+
+
+class ColumnarMsgPackRenderer(BaseRenderer):
+    media_type = 'application/vnd.palma.columnar+msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(columnar(data, view_enums(renderer_context)), default=default, use_bin_type=True)
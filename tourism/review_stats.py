@@ -0,0 +1,138 @@
+"""
+Agregados de las reseñas por itinerario.
+
+Cada itinerario con reseñas tiene una fila ItineraryReviewStats con, para
+cada valoración (la general y las cinco específicas), el número de reseñas
+que la rellenan, la suma y el histograma de 1 a 5 estrellas:
+
+    {"rating": {"count": 3, "sum": 13, "histogram": [0, 0, 0, 2, 1]}, ...}
+
+Al guardar o borrar una reseña se resta su valor anterior y se suma el
+nuevo con la fila bloqueada (ver signals.py), así que ordenar itinerarios por
+valoración no recorre las reseñas. Las operaciones que no envían señales
+(update() o bulk_create()) pueden desajustarlos: `check_review_stats --fix`
+los recalcula.
+"""
+from django.db import transaction
+
+from .models import ItineraryReview, ItineraryReviewStats
+
+# Nombre de la valoración: campo de ItineraryReview
+DIMENSIONS = {
+    'rating': 'rating',
+    'scenery': 'scenery_rating',
+    'accessibility': 'accessibility_rating',
+    'signposting': 'signposting_rating',
+    'cleanliness': 'cleanliness_rating',
+    'services': 'services_rating',
+}
+STARS = 5
+
+
+def review_values(review):
+    """
+    Valoraciones de una reseña (instancia o dict de `values()`).
+    """
+    if isinstance(review, dict):
+        return {name: review[field] for name, field in DIMENSIONS.items()}
+    return {name: getattr(review, field) for name, field in DIMENSIONS.items()}
+
+
+def add_values(dimensions, values, sign=1):
+    """
+    Suma (sign=1) o resta (sign=-1) las valoraciones de una reseña.
+    """
+    for name, value in values.items():
+        if value is None or not 1 <= value <= STARS:
+            continue
+        entry = dimensions.setdefault(name, {'count': 0, 'sum': 0, 'histogram': [0] * STARS})
+        entry['count'] += sign
+        entry['sum'] += sign * value
+        entry['histogram'][value - 1] += sign
+
+
+def summarize(dimensions):
+    """
+    Columnas de la fila derivadas de la valoración general.
+    """
+    overall = dimensions.get('rating') or {'count': 0, 'sum': 0}
+    return {
+        'review_count': overall['count'],
+        'average_rating': overall['sum'] / overall['count'] if overall['count'] else None,
+    }
+
+
+def normalized(dimensions):
+    return {name: entry for name, entry in dimensions.items() if entry['count']}
+
+
+def aggregate(rows):
+    """
+    Agregados desde cero a partir de filas `values('itinerary_id', *campos)`.
+    """
+    result = {}
+    for row in rows:
+        add_values(result.setdefault(row['itinerary_id'], {}), review_values(row))
+    return result
+
+
+def apply_change(itinerary_id, removed=None, added=None):
+    """
+    Resta las valoraciones `removed` y suma `added` en la fila del
+    itinerario. Solo se crea la fila si se suma algo: al borrar un
+    itinerario la fila puede haberse borrado ya en cascada.
+    """
+    with transaction.atomic():
+        if added is not None:
+            ItineraryReviewStats.objects.get_or_create(pk=itinerary_id)
+        stats = ItineraryReviewStats.objects.select_for_update().filter(pk=itinerary_id).first()
+        if stats is None:
+            return
+        if removed is not None:
+            add_values(stats.dimensions, removed, -1)
+        if added is not None:
+            add_values(stats.dimensions, added)
+        for field, value in summarize(stats.dimensions).items():
+            setattr(stats, field, value)
+        stats.save()
+
+
+def serialize_stats(stats):
+    """
+    Representación para la API: número, media e histograma por valoración.
+    """
+    dimensions = normalized(stats.dimensions) if stats is not None else {}
+    return {
+        **summarize(dimensions),
+        'dimensions': {
+            name: {
+                'count': entry['count'],
+                'mean': entry['sum'] / entry['count'],
+                'histogram': entry['histogram'],
+            }
+            for name, entry in dimensions.items()
+        },
+    }
+
+
+def check_consistency(fix=False):
+    """
+    Compara los agregados guardados con los calculados desde las reseñas.
+    Devuelve los ids de los itinerarios desajustados; con `fix` los corrige.
+    """
+    rows = ItineraryReview.objects.values('itinerary_id', *DIMENSIONS.values()).iterator(chunk_size=5000)
+    expected = aggregate(rows)
+    stored = dict(ItineraryReviewStats.objects.values_list('itinerary_id', 'dimensions'))
+
+    mismatched = sorted(
+        itinerary_id for itinerary_id in expected.keys() | stored.keys()
+        if normalized(expected.get(itinerary_id, {})) != normalized(stored.get(itinerary_id, {}))
+    )
+    if fix:
+        with transaction.atomic():
+            for itinerary_id in mismatched:
+                dimensions = expected.get(itinerary_id, {})
+                ItineraryReviewStats.objects.update_or_create(
+                    pk=itinerary_id, defaults={'dimensions': dimensions, **summarize(dimensions)}
+                )
+    return mismatched
@@ -0,0 +1,319 @@
+"""
+Optimización del orden de visita de los puntos de un itinerario.
+
+1. Matriz de distancias (haversine, km) entre todos los puntos en una sola
+   operación vectorizada de NumPy.
+2. Ruta inicial por vecino más cercano, mejorada con 2-opt y Or-opt. Las
+   rutas son abiertas (no vuelven al inicio): se resuelven como un ciclo con
+   un nodo ficticio a distancia 0 de todos.
+3. Si se reparten los puntos entre días, primero se optimiza una ruta con
+   todos ellos y después se corta en tramos contiguos de duración parecida
+   (visitas + desplazamientos), que son grupos geográficamente compactos.
+   Ningún tramo supera las horas disponibles por día: las paradas que no
+   caben en los días pedidos se dejan al final del último. Cada día se
+   vuelve a optimizar por separado.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# Las carreteras de la isla son sinuosas: distancia por carretera ≈ 1.4 × línea recta
+DETOUR_FACTOR = 1.4
+AVERAGE_SPEED_KMH = 40
+DEFAULT_DAY_MINUTES = 8 * 60
+# Tiempo de visita cuando el punto no lo indica
+RESTAURANT_MINUTES = 75
+EVENT_MINUTES = 120
+MAX_EVENT_MINUTES = 180
+DEFAULT_TIME_LIMIT = 0.5
+EPSILON = 1e-9
+
+
+def distance_matrix(lngs, lats, to_lngs=None, to_lats=None):
+    """
+    Matriz de distancias de círculo máximo en kilómetros: n×n entre los
+    puntos dados, o n×m hasta `to_lngs`/`to_lats`.
+    """
+    lng = np.radians(np.asarray(lngs, dtype=float))
+    lat = np.radians(np.asarray(lats, dtype=float))
+    if to_lngs is None:
+        to_lng, to_lat = lng, lat
+    else:
+        to_lng = np.radians(np.asarray(to_lngs, dtype=float))
+        to_lat = np.radians(np.asarray(to_lats, dtype=float))
+    dlat = lat[:, None] - to_lat[None, :]
+    dlng = lng[:, None] - to_lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(to_lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def travel_minutes(distance_km):
+    return distance_km * DETOUR_FACTOR / AVERAGE_SPEED_KMH * 60
+
+
+def path_length(route, dist):
+    route = np.asarray(route)
+    if len(route) < 2:
+        return 0.0
+    return float(dist[route[:-1], route[1:]].sum())
+
+
+def with_dummy(dist):
+    """
+    Añade un nodo a distancia 0 de todos: un ciclo óptimo por él equivale
+    a un camino abierto óptimo por el resto.
+    """
+    n = len(dist)
+    extended = np.zeros((n + 1, n + 1))
+    extended[:n, :n] = dist
+    return extended
+
+
+def nearest_neighbour(dist, start=0):
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    route = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        candidates = np.where(visited, np.inf, dist[route[-1]])
+        nxt = int(candidates.argmin())
+        route.append(nxt)
+        visited[nxt] = True
+    return np.array(route)
+
+
+def two_opt(route, dist, deadline):
+    """
+    2-opt sobre el ciclo: para cada arista (i, i+1) se evalúan a la vez todas
+    las aristas (j, j+1) y se aplica la mejor inversión.
+    """
+    n = len(route)
+    if n < 4:
+        return route
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(n - 2):
+            js = np.arange(i + 2, n if i > 0 else n - 1)
+            if not len(js):
+                continue
+            a, b = route[i], route[i + 1]
+            c, d = route[js], route[(js + 1) % n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            best = int(delta.argmin())
+            if delta[best] < -EPSILON:
+                j = js[best]
+                route[i + 1:j + 1] = route[i + 1:j + 1][::-1].copy()
+                improved = True
+    return route
+
+
+def or_opt(route, dist, deadline, max_segment=3):
+    """
+    Or-opt sobre el ciclo: mueve tramos de 1 a `max_segment` puntos (en
+    cualquier sentido) a la posición donde más acortan la ruta.
+    """
+    n = len(route)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for length in range(1, max_segment + 1):
+            if n < length + 3:
+                break
+            for i in range(n):
+                rotated = np.roll(route, -i)
+                segment, rest = rotated[:length], rotated[length:]
+                first, last = segment[0], segment[-1]
+                prev, nxt = rest[-1], rest[0]
+                removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+                u, v = rest[:-1], rest[1:]
+                forward = dist[u, first] + dist[last, v] - dist[u, v]
+                backward = dist[u, last] + dist[first, v] - dist[u, v]
+                insertion = np.minimum(forward, backward)
+                k = int(insertion.argmin())
+                if insertion[k] - removal_gain < -EPSILON:
+                    if backward[k] < forward[k]:
+                        segment = segment[::-1]
+                    route = np.concatenate([rest[:k + 1], segment, rest[k + 1:]])
+                    improved = True
+    return route
+
+
+def solve_path(dist, deadline):
+    """
+    Orden de visita (camino abierto) que minimiza la distancia total.
+    Devuelve índices de `dist`.
+    """
+    n = len(dist)
+    if n < 3:
+        return np.arange(n)
+    extended = with_dummy(dist)
+    route = nearest_neighbour(extended, start=n)
+    route = two_opt(route, extended, deadline)
+    route = or_opt(route, extended, deadline)
+    route = two_opt(route, extended, deadline)
+    dummy = int(np.where(route == n)[0][0])
+    return np.roll(route, -dummy)[1:]
+
+
+def day_cost(route, dist, visit):
+    """
+    Minutos de un día: visitas más desplazamientos entre ellas.
+    """
+    if not len(route):
+        return 0.0
+    return float(visit[route].sum()) + travel_minutes(path_length(route, dist))
+
+
+def split_route(route, dist, visit, days, day_minutes=None):
+    """
+    Corta la ruta en como mucho `days` tramos contiguos minimizando la
+    duración del día más largo (búsqueda binaria sobre ese máximo). Con
+    `day_minutes` ningún tramo lo supera (salvo una sola visita más larga).
+
+    Devuelve (tramos, paradas que no caben en los `days` días).
+    """
+    route = list(route)
+    if len(route) <= 1:
+        return [route], []
+
+    def cut(limit):
+        parts, current, cost = [], [], 0.0
+        for stop in route:
+            step = visit[stop] + (travel_minutes(dist[current[-1], stop]) if current else 0.0)
+            if current and cost + step > limit + EPSILON:
+                parts.append(current)
+                current, cost = [], 0.0
+                step = visit[stop]
+            current.append(stop)
+            cost += step
+        parts.append(current)
+        return parts
+
+    low = float(visit[route].max())
+    high = day_cost(np.array(route), dist, visit)
+    if days > 1:
+        for _ in range(50):
+            middle = (low + high) / 2
+            if len(cut(middle)) <= days:
+                high = middle
+            else:
+                low = middle
+    parts = cut(high if day_minutes is None else min(high, day_minutes))
+    return parts[:days], [stop for part in parts[days:] for stop in part]
+
+
+class Stop:
+    """
+    Punto a ordenar: `key` lo identifica (p. ej. el id del ItineraryPoint).
+    """
+
+    def __init__(self, key, lng, lat, minutes, day=1):
+        self.key = key
+        self.lng = lng
+        self.lat = lat
+        self.minutes = minutes
+        self.day = day
+
+
+def visit_minutes(point):
+    """
+    Minutos de visita de un ItineraryPoint según su tipo.
+    """
+    if point.point_of_interest_id and point.point_of_interest:
+        return point.point_of_interest.estimated_time / timedelta(minutes=1)
+    if point.event_id and point.event:
+        duration = (point.event.end_date - point.event.start_date) / timedelta(minutes=1)
+        return min(duration, MAX_EVENT_MINUTES) if duration > 0 else EVENT_MINUTES
+    return RESTAURANT_MINUTES
+
+
+def point_location(point):
+    target = point.point_of_interest or point.restaurant or point.event
+    return target.location if target is not None else None
+
+
+def stops_for_points(points):
+    """
+    Paradas a partir de ItineraryPoints con sus lugares ya cargados.
+    """
+    stops = []
+    for point in points:
+        location = point_location(point)
+        stops.append(Stop(
+            point.pk,
+            location.x if location else None,
+            location.y if location else None,
+            visit_minutes(point),
+            point.day,
+        ))
+    return stops
+
+
+def optimize(stops, days=None, day_minutes=DEFAULT_DAY_MINUTES, time_limit=DEFAULT_TIME_LIMIT):
+    """
+    Ordena las paradas. Si `days` es None cada parada se queda en su día y
+    solo se optimiza el orden dentro de él; si no, se reparten en `days`
+    días de como mucho `day_minutes`. Las paradas sin ubicación se dejan
+    al final de su día.
+
+    Devuelve una lista de días {day, keys, distance_km, travel_minutes,
+    visit_minutes, total_minutes, over_budget, overflow}. `overflow` son las
+    paradas que al repartir no caben en ningún día; se añaden al final del
+    último.
+    """
+    if not stops:
+        return []
+    deadline = time.perf_counter() + time_limit
+    located = [stop for stop in stops if stop.lng is not None]
+    unlocated = [stop for stop in stops if stop.lng is None]
+
+    dist = distance_matrix([stop.lng for stop in located], [stop.lat for stop in located])
+    visit = np.array([stop.minutes for stop in located], dtype=float)
+    overflow = []
+
+    if days is None:
+        groups = {}
+        for index, stop in enumerate(located):
+            groups.setdefault(stop.day, []).append(index)
+        for stop in unlocated:
+            groups.setdefault(stop.day, [])
+        plan = {}
+        for day, indices in groups.items():
+            indices = np.array(indices, dtype=int)
+            order = solve_path(dist[np.ix_(indices, indices)], deadline) if len(indices) else []
+            plan[day] = list(indices[order]) if len(indices) else []
+    else:
+        days = max(1, days)
+        route = solve_path(dist, deadline)
+        parts, overflow = split_route(route, dist, visit, days, day_minutes)
+        plan = {}
+        for day, part in enumerate(parts, 1):
+            indices = np.array(part, dtype=int)
+            order = solve_path(dist[np.ix_(indices, indices)], deadline)
+            plan[day] = list(indices[order])
+        for day in range(1, days + 1):
+            plan.setdefault(day, [])
+        plan[days] += overflow
+
+    result = []
+    for day in sorted(plan):
+        indices = np.array(plan[day], dtype=int)
+        distance_km = path_length(indices, dist)
+        minutes_travel = travel_minutes(distance_km)
+        extra = [stop for stop in unlocated if min(stop.day, max(plan)) == day]
+        minutes_visit = float(visit[indices].sum()) + sum(stop.minutes for stop in extra)
+        total = minutes_visit + minutes_travel
+        result.append({
+            'day': day,
+            'keys': [located[index].key for index in indices] + [stop.key for stop in extra],
+            'distance_km': round(distance_km, 2),
+            'travel_minutes': round(minutes_travel),
+            'visit_minutes': round(minutes_visit),
+            'total_minutes': round(total),
+            'over_budget': total > day_minutes,
+            'overflow': [located[index].key for index in overflow] if day == max(plan) else [],
+        })
+    return result
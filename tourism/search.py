@@ -0,0 +1,107 @@
+"""
+Búsqueda de texto completo en PostgreSQL.
+
+Cada modelo buscable tiene una columna `search_vector` (español + inglés)
+mantenida por un trigger e indexada con GIN, y un índice de trigramas sobre
+su nombre/título para tolerar errores tipográficos. Las búsquedas combinan
+ambos en una sola consulta y ordenan por relevancia.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.filters import SearchFilter
+
+from .models import Event, Itinerary, PointOfInterest, Restaurant
+from .spatial import X, Y
+
+SEARCH_CONFIGS = ('spanish', 'english')
+
+
+def build_query(term):
+    """
+    Consulta estilo buscador web evaluada con los analizadores de ambos idiomas.
+    """
+    queries = [SearchQuery(term, search_type='websearch', config=config) for config in SEARCH_CONFIGS]
+    query = queries[0]
+    for other in queries[1:]:
+        query = query | other
+    return query
+
+
+def has_search_vector(model):
+    try:
+        model._meta.get_field('search_vector')
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def full_text_search(queryset, term, trigram_field=None):
+    """
+    Filtra por coincidencia de texto completo o, si se indica `trigram_field`,
+    por similitud de trigramas en ese campo, y anota `search_rank`.
+    """
+    query = build_query(term)
+    condition = Q(search_vector=query)
+    rank = SearchRank(F('search_vector'), query)
+    if trigram_field:
+        condition |= Q(**{f'{trigram_field}__trigram_similar': term})
+        rank = rank + TrigramSimilarity(trigram_field, term)
+    return queryset.filter(condition).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Sustituto de SearchFilter que usa el índice de texto completo cuando el
+    modelo tiene `search_vector`. El campo de trigramas es el primero de
+    `search_fields`, o `trigram_search_field` si la vista lo define.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not has_search_vector(queryset.model):
+            return super().filter_queryset(request, queryset, view)
+
+        term = ' '.join(self.get_search_terms(request))
+        if not term:
+            return queryset
+
+        search_fields = self.get_search_fields(view, request) or []
+        trigram_field = getattr(view, 'trigram_search_field', search_fields[0] if search_fields else None)
+        return full_text_search(queryset, term, trigram_field)
+
+
+# tipo -> (modelo, campo de nombre, ¿tiene ubicación?)
+SEARCH_MODELS = {
+    'pois': (PointOfInterest, 'name', True),
+    'restaurants': (Restaurant, 'name', True),
+    'events': (Event, 'name', True),
+    'itineraries': (Itinerary, 'title', False),
+}
+
+
+def search_all(term, types=None, limit=20):
+    """
+    Busca en todos los tipos de contenido y mezcla los resultados por relevancia.
+    """
+    results = []
+    for content_type in types or SEARCH_MODELS:
+        model, name_field, geographic = SEARCH_MODELS[content_type]
+        queryset = full_text_search(model.objects.all(), term, name_field)
+        fields = ['id', name_field, 'search_rank']
+        if geographic:
+            queryset = queryset.annotate(lng=X('location'), lat=Y('location'))
+            fields += ['lng', 'lat']
+
+        for row in queryset.values(*fields)[:limit]:
+            result = {
+                'type': content_type,
+                'id': row['id'],
+                'name': row[name_field],
+                'rank': row['search_rank'],
+            }
+            if geographic:
+                result['coordinates'] = [row['lng'], row['lat']] if row['lng'] is not None else None
+            results.append(result)
+
+    results.sort(key=lambda result: result['rank'], reverse=True)
+    return results[:limit]
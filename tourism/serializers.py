@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
 from django.contrib.auth.models import User
-from .models import PointOfInterest, Restaurant, Event, Itinerary, ItineraryPoint, ItineraryReview, ReviewPhoto
+from .models import (
+    PointOfInterest, Restaurant, Event, Itinerary, ItineraryPoint, ItineraryReview, ItineraryReviewStats, ReviewPhoto
+)
+from .review_stats import serialize_stats
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -80,13 +83,25 @@ class ItineraryPointSerializer(serializers.ModelSerializer):
 class ItinerarySerializer(serializers.ModelSerializer):
     points = ItineraryPointSerializer(many=True, read_only=True)
     user = UserSerializer(read_only=True)
+    review_stats = serializers.SerializerMethodField()
 
     class Meta:
         model = Itinerary
         fields = ['id', 'title', 'description', 'start_date', 'end_date',
-                 'user', 'points', 'created_at', 'updated_at']
+                 'user', 'points', 'review_stats', 'created_at', 'updated_at']
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
 
+    def get_review_stats(self, obj):
+        """
+        Número de reseñas, media general y, por valoración, número, media e
+        histograma (ver tourism.review_stats)
+        """
+        try:
+            stats = obj.review_stats
+        except ItineraryReviewStats.DoesNotExist:
+            stats = None
+        return serialize_stats(stats)
+
 class ItineraryCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Itinerary
@@ -0,0 +1,124 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import leaderboard
+from .cache import bump_version
+from .itinerary_geojson import refresh, refresh_days
+from .models import (
+    Event, ItineraryGeoJSON, ItineraryPoint, ItineraryReview, ItineraryReviewStats, PointOfInterest, Restaurant
+)
+from .opening_hours import sync_opening_intervals
+from .review_stats import DIMENSIONS, apply_change, review_values
+from .tiles import LAYER_BY_MODEL, TILE_CACHE_ALIAS
+
+# Campo de ItineraryPoint que apunta a cada modelo del catálogo
+PLACE_FIELDS = {
+    PointOfInterest: 'point_of_interest',
+    Restaurant: 'restaurant',
+    Event: 'event',
+}
+
+
+def materialized_itinerary_days(sender, instance):
+    """
+    Pares (itinerario, día) con GeoJSON materializado que visitan el lugar.
+    """
+    return list(ItineraryPoint.objects.filter(
+        **{PLACE_FIELDS[sender]: instance}, itinerary__geojson__isnull=False
+    ).values_list('itinerary_id', 'day').distinct())
+
+
+@receiver(pre_delete, sender=PointOfInterest)
+@receiver(pre_delete, sender=Restaurant)
+@receiver(pre_delete, sender=Event)
+def remember_itinerary_days(sender, instance, **kwargs):
+    # Tras el borrado los puntos ya no apuntan al lugar (SET_NULL)
+    instance._itinerary_days = materialized_itinerary_days(sender, instance)
+
+
+@receiver([post_save, post_delete], sender=PointOfInterest)
+@receiver([post_save, post_delete], sender=Restaurant)
+@receiver([post_save, post_delete], sender=Event)
+def invalidate_catalogue(sender, instance=None, **kwargs):
+    """
+    Invalida las respuestas cacheadas, las teselas y los clusters del modelo
+    que cambió, y el GeoJSON de los itinerarios que visitan el lugar. Sin
+    `instance` (importaciones masivas) se descarta el GeoJSON de todos los
+    itinerarios con lugares de ese modelo; se vuelve a materializar al pedirlo.
+    """
+    bump_version(sender._meta.model_name)
+    bump_version(f'tiles-{LAYER_BY_MODEL[sender]}', alias=TILE_CACHE_ALIAS)
+
+    if instance is None:
+        ItineraryGeoJSON.objects.filter(
+            **{f'itinerary__points__{PLACE_FIELDS[sender]}__isnull': False}
+        ).delete()
+    elif hasattr(instance, '_itinerary_days'):
+        refresh_days(instance._itinerary_days)
+    else:
+        refresh_days(materialized_itinerary_days(sender, instance))
+
+
+@receiver([post_save, post_delete], sender=ItineraryPoint)
+def refresh_itinerary_geojson(sender, instance, **kwargs):
+    """
+    Recalcula el día del punto y, si se ha movido, el día en el que estaba.
+    """
+    refresh(instance.itinerary_id, {instance.day}, {instance.pk})
+
+
+@receiver(post_save, sender=Restaurant)
+def sync_restaurant_opening_hours(sender, instance, update_fields=None, **kwargs):
+    """
+    Mantiene los intervalos de apertura al día con `opening_hours`.
+    """
+    if update_fields is None or 'opening_hours' in update_fields:
+        sync_opening_intervals([instance])
+
+
+@receiver(pre_save, sender=ItineraryReview)
+def remember_review_values(sender, instance, update_fields=None, **kwargs):
+    # Valores guardados antes del cambio, para restarlos de los agregados
+    instance._previous_review = None
+    if instance.pk is None:
+        return
+    fields = ['itinerary_id', *DIMENSIONS.values()]
+    if update_fields is not None and not {'itinerary', *fields} & set(update_fields):
+        return
+    instance._previous_review = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(post_save, sender=ItineraryReview)
+def update_review_stats(sender, instance, created=False, **kwargs):
+    """
+    Resta la versión anterior de la reseña de los agregados y suma la nueva.
+    """
+    previous = getattr(instance, '_previous_review', None)
+    if previous is None and not created:
+        # Guardado parcial que no toca las valoraciones
+        return
+    if previous is not None and previous['itinerary_id'] == instance.itinerary_id:
+        apply_change(instance.itinerary_id, review_values(previous), review_values(instance))
+        return
+    if previous is not None:
+        apply_change(previous['itinerary_id'], removed=review_values(previous))
+    apply_change(instance.itinerary_id, added=review_values(instance))
+
+
+@receiver(post_delete, sender=ItineraryReview)
+def remove_review_stats(sender, instance, **kwargs):
+    apply_change(instance.itinerary_id, removed=review_values(instance))
+
+
+@receiver(post_save, sender=ItineraryReviewStats)
+def update_leaderboard(sender, instance, **kwargs):
+    # Tras el commit, para no publicar agregados que se deshagan
+    transaction.on_commit(partial(leaderboard.update, instance.itinerary_id, instance.dimensions))
+
+
+@receiver(post_delete, sender=ItineraryReviewStats)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    transaction.on_commit(partial(leaderboard.update, instance.itinerary_id, {}))
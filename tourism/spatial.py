@@ -0,0 +1,98 @@
+"""
+Utilidades de consultas espaciales compartidas por los endpoints de la API.
+
+Las columnas `location` son geometrías en SRID 4326. Para trabajar en metros
+sin calcular distancias esféricas fila a fila se usa un cast a `geography`,
+que está respaldado por un índice GiST funcional (ver migraciones).
+"""
+from django.contrib.gis.geos import Point
+from django.db.models import BooleanField, FloatField, Func
+
+
+def parse_location(query_params):
+    """
+    Construye un Point a partir de los parámetros `lat` y `lng`.
+    Lanza ValueError/TypeError si no son válidos.
+    """
+    lat = float(query_params.get('lat', 0))
+    lng = float(query_params.get('lng', 0))
+    return Point(lng, lat, srid=4326)
+
+
+def parse_bbox(value):
+    """
+    Caja "min_lng,min_lat,max_lng,max_lat". Lanza ValueError si no es válida.
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError(f"bbox inválida: {value}")
+    return parts
+
+
+class GeographyFunc(Func):
+    """
+    Función sobre `(columna)::geography` y un punto pasado como parámetro.
+
+    El cast se escribe igual que en los índices funcionales para que
+    PostgreSQL pueda usarlos.
+    """
+    sql_template = None
+
+    def __init__(self, expression, point, *args, **extra):
+        self.point = point
+        self.extra_params = args
+        super().__init__(expression, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return self.sql_template % {'column': sql}, [*params, self.point.ewkt, *self.extra_params]
+
+
+class KNNDistance(GeographyFunc):
+    """
+    Distancia en metros usando el operador `<->` sobre geography.
+
+    Usada en ORDER BY permite a PostgreSQL recorrer el índice GiST en orden
+    de cercanía (búsqueda KNN) en lugar de calcular y ordenar todas las filas.
+    """
+    sql_template = '(%(column)s)::geography <-> ST_GeogFromText(%%s)'
+    output_field = FloatField()
+
+
+class GeographyDistance(GeographyFunc):
+    """
+    Distancia exacta en metros sobre el esferoide.
+    """
+    sql_template = 'ST_Distance((%(column)s)::geography, ST_GeogFromText(%%s))'
+    output_field = FloatField()
+
+
+class GeographyDWithin(GeographyFunc):
+    """
+    Condición `ST_DWithin` en metros. Se resuelve primero con el índice
+    (caja envolvente) y solo comprueba la distancia en las filas candidatas.
+    """
+    sql_template = 'ST_DWithin((%(column)s)::geography, ST_GeogFromText(%%s), %%s)'
+    output_field = BooleanField()
+
+
+def within_radius(queryset, point, max_distance_km, field='location'):
+    """
+    Filtra el queryset a un radio en kilómetros alrededor de `point` y anota
+    `distance` (metros) solo sobre las filas que pasan el filtro.
+    """
+    return queryset.filter(
+        GeographyDWithin(field, point, max_distance_km * 1000)
+    ).annotate(
+        distance=GeographyDistance(field, point)
+    )
+
+
+class X(Func):
+    function = 'ST_X'
+    output_field = FloatField()
+
+
+class Y(Func):
+    function = 'ST_Y'
+    output_field = FloatField()
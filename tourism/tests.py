@@ -1,3 +1,1367 @@
-from django.test import TestCase
+import json
+import os
+import struct
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import leaderboard, llm, travel
+from .candidates import detect_types, select_candidates
+from .geojson import FastGeoFeatureSerializer
+from .renderers import ORJSONParser, ORJSONRenderer
+from .models import (
+    Event, Itinerary, ItineraryPoint, ItineraryReview, PointOfInterest, Restaurant
+)
+from .serializers import ItinerarySerializer, PointOfInterestSerializer, RestaurantSerializer
+
+
+def create_catalogue():
+    location = Point(-17.85, 28.68, srid=4326)
+    poi = PointOfInterest.objects.create(
+        name='Roque de los Muchachos', description='Mirador', location=location,
+        address='Garafía', type='VIEWPOINT', difficulty='EASY',
+        estimated_time=timedelta(hours=1),
+    )
+    restaurant = Restaurant.objects.create(
+        name='Casa Goyo', description='Pescado', location=location,
+        address='Breña Baja', cuisine_type='LOCAL', opening_hours={},
+    )
+    start = timezone.make_aware(datetime(2030, 5, 1, 10, 0))
+    event = Event.objects.create(
+        name='Fiesta', description='Fiesta local', location=location,
+        address='Santa Cruz', start_date=start, end_date=start + timedelta(hours=4),
+    )
+    return poi, restaurant, event
+
+
+def create_itinerary(user, poi, restaurant, event, points=20):
+    itinerary = Itinerary.objects.create(
+        title='Ruta', user=user,
+        start_date=date(2030, 5, 1), end_date=date(2030, 5, 3),
+    )
+    ItineraryPoint.objects.bulk_create([
+        ItineraryPoint(
+            itinerary=itinerary, day=i % 3 + 1, order=i,
+            point_of_interest=poi if i % 3 == 0 else None,
+            restaurant=restaurant if i % 3 == 1 else None,
+            event=event if i % 3 == 2 else None,
+        )
+        for i in range(points)
+    ])
+    return itinerary
+
+
+WGS84_PRJ = (
+    'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137,298.257223563]],'
+    'PRIMEM["Greenwich",0],UNIT["Degree",0.0174532925199433]]'
+)
+
+
+def write_shapefile(directory, records, prj=True):
+    """
+    Shapefile de puntos con columnas de texto; `records` son pares
+    ((lng, lat), {columna: valor}).
+    """
+    base = os.path.join(directory, 'capa')
+    lngs = [lng for (lng, _), _ in records]
+    lats = [lat for (_, lat), _ in records]
+
+    def header(length_words):
+        return (
+            struct.pack('>i5ii', 9994, 0, 0, 0, 0, 0, length_words)
+            + struct.pack('<ii4d4d', 1000, 1, min(lngs), min(lats), max(lngs), max(lats), 0, 0, 0, 0)
+        )
+
+    shp, shx = [], []
+    offset = 50
+    for number, ((lng, lat), _) in enumerate(records, 1):
+        shp.append(struct.pack('>ii', number, 10) + struct.pack('<idd', 1, lng, lat))
+        shx.append(struct.pack('>ii', offset, 10))
+        offset += 4 + 10
+    with open(f'{base}.shp', 'wb') as f:
+        f.write(header(offset) + b''.join(shp))
+    with open(f'{base}.shx', 'wb') as f:
+        f.write(header(50 + 4 * len(records)) + b''.join(shx))
+
+    columns = list(records[0][1])
+    widths = [max(len(str(values[column]).encode('utf-8')) for _, values in records) for column in columns]
+    with open(f'{base}.dbf', 'wb') as f:
+        f.write(struct.pack('<B3BIHH20x', 3, 124, 1, 1, len(records), 33 + 32 * len(columns), 1 + sum(widths)))
+        for column, width in zip(columns, widths):
+            f.write(struct.pack('<11sc4xBB14x', column.encode('ascii'), b'C', width, 0))
+        f.write(b'\r')
+        for _, values in records:
+            f.write(b' ' + b''.join(
+                str(values[column]).encode('utf-8').ljust(width) for column, width in zip(columns, widths)
+            ))
+        f.write(b'\x1a')
+    with open(f'{base}.cpg', 'w') as f:
+        f.write('UTF-8')
+    if prj:
+        with open(f'{base}.prj', 'w') as f:
+            f.write(WGS84_PRJ)
+    return f'{base}.shp'
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Número máximo de consultas por endpoint. Si alguno de estos tests falla
+    es que se ha reintroducido una carga perezosa (N+1) en un serializer.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='viajero')
+        poi, restaurant, event = create_catalogue()
+        cls.itineraries = [
+            create_itinerary(cls.user, poi, restaurant, event) for _ in range(10)
+        ]
+        for itinerary in cls.itineraries:
+            ItineraryReview.objects.create(itinerary=itinerary, user=cls.user, rating=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_itinerary_list(self):
+        # count + itinerarios con usuario + puntos con sus detalles
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/itineraries/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(response.data['results'][0]['points']), 20)
+
+    def test_itinerary_retrieve(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/itineraries/{self.itineraries[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['points'][0]['point_details'])
+
+    def test_itinerary_point_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/itinerary-points/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_itinerary_review_list(self):
+        # count + reseñas + fotos
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/itinerary-reviews/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_catalogue_lists(self):
+        for url in ['/api/points-of-interest/', '/api/restaurants/', '/api/events/']:
+            with self.subTest(url=url), self.assertNumQueries(2):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class ResponseCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_list_skips_database(self):
+        first = self.client.get('/api/points-of-interest/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/points-of-interest/')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_query_params_are_normalized(self):
+        first = self.client.get('/api/restaurants/?search=casa&ordering=name')
+        second = self.client.get('/api/restaurants/?ordering=name&search=casa')
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/api/events/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_save_invalidates_cache(self):
+        etag = self.client.get('/api/points-of-interest/')['ETag']
+        poi = PointOfInterest.objects.get()
+        poi.name = 'Caldera de Taburiente'
+        poi.save()
+        response = self.client.get('/api/points-of-interest/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(
+            response.data['results']['features'][0]['properties']['name'], 'Caldera de Taburiente'
+        )
+
+
+class NearestNeighbourTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        defaults = {'description': '', 'address': '', 'difficulty': 'EASY', 'estimated_time': timedelta(hours=1)}
+        places = [(-17.85, 28.68), (-17.80, 28.68), (-17.80, 28.68), (-17.70, 28.68)]
+        # Los dos del medio están a la misma distancia: el cursor desempata por id
+        cls.pois = [
+            PointOfInterest.objects.create(
+                name=f'POI {i}', type='VIEWPOINT', location=Point(lng, lat, srid=4326), **defaults
+            )
+            for i, (lng, lat) in enumerate(places)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages_through_all_results(self):
+        params = {'lat': 28.68, 'lng': -17.86, 'k': 1}
+        ids = []
+        for _ in range(len(self.pois) + 1):
+            response = self.client.get('/api/points-of-interest/nearby/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['features']), 1)
+            ids.append(response.data['features'][0]['id'])
+            if response.data['next_cursor'] is None:
+                break
+            params['cursor'] = response.data['next_cursor']
+        self.assertEqual(ids, [poi.pk for poi in self.pois])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/points-of-interest/nearby/', {'lat': 28.68, 'lng': -17.86, 'cursor': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class VectorTileTests(APITestCase):
+
+    def setUp(self):
+        caches['tiles'].clear()
+        self.poi, self.restaurant, self.event = create_catalogue()
+
+    def test_invalid_tiles(self):
+        self.assertEqual(self.client.get('/api/tiles/itineraries/0/0/0.mvt').status_code, 404)
+        self.assertEqual(self.client.get('/api/tiles/pois/23/0/0.mvt').status_code, 400)
+        self.assertEqual(self.client.get('/api/tiles/pois/1/2/0.mvt').status_code, 400)
+        self.assertEqual(self.client.get('/api/tiles/pois/1/0/-1.mvt').status_code, 404)
+
+    def test_tile_contains_layer(self):
+        # La Palma queda en la tesela noroeste del zoom 1
+        response = self.client.get('/api/tiles/pois/1/0/0.mvt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn(b'pois', response.content)
+        self.assertEqual(self.client.get('/api/tiles/pois/1/1/1.mvt').content, b'')
+
+    def test_save_invalidates_tiles(self):
+        url = '/api/tiles/pois/1/0/0.mvt'
+        self.assertNotEqual(self.client.get(url).content, b'')
+        self.poi.location = Point(150, -30, srid=4326)
+        self.poi.save()
+        self.assertEqual(self.client.get(url).content, b'')
+        self.assertNotEqual(self.client.get('/api/tiles/pois/1/1/1.mvt').content, b'')
+
+
+class TypeStatsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        defaults = {'description': '', 'address': '', 'estimated_time': timedelta(hours=1)}
+        PointOfInterest.objects.create(
+            name='Caldera', type='PARK', difficulty='EASY', location=Point(-17.9, 28.6, srid=4326), **defaults
+        )
+        PointOfInterest.objects.create(
+            name='Cubo de la Galga', type='PARK', difficulty='HARD', location=Point(-17.8, 28.8, srid=4326), **defaults
+        )
+        PointOfInterest.objects.create(
+            name='Charco Azul', type='BEACH', difficulty='MEDIUM', location=Point(-17.75, 28.85, srid=4326), **defaults
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_stats_per_type(self):
+        response = self.client.get('/api/points-of-interest/by_type/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([group['type'] for group in response.data], ['BEACH', 'PARK'])
+        beach, park = response.data
+        self.assertEqual(beach['count'], 1)
+        self.assertEqual(park['count'], 2)
+        # EASY = 1, HARD = 3
+        self.assertEqual(park['avg_difficulty'], 2)
+        self.assertEqual((park['min_difficulty'], park['max_difficulty']), (1, 3))
+        self.assertEqual([round(value, 6) for value in park['bbox']], [-17.9, 28.6, -17.8, 28.8])
+        self.assertEqual([round(value, 6) for value in park['centroid']], [-17.85, 28.7])
+
+    def test_type_filter_with_points(self):
+        response = self.client.get('/api/points-of-interest/by_type/', {'type': 'PARK', 'include_points': 'true'})
+        self.assertEqual(response.status_code, 200)
+        [park] = response.data
+        self.assertEqual(park['points']['count'], 2)
+        names = [feature['properties']['name'] for feature in park['points']['results']['features']]
+        self.assertEqual(sorted(names), ['Caldera', 'Cubo de la Galga'])
+
+    def test_include_points_requires_type(self):
+        response = self.client.get('/api/points-of-interest/by_type/', {'include_points': 'true'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.poi, cls.restaurant, cls.event = create_catalogue()
+        cls.second = PointOfInterest.objects.create(
+            name='Faro de Fuencaliente', description='Faro', location=Point(-17.84, 28.45, srid=4326),
+            address='Fuencaliente', type='MONUMENT', difficulty='EASY',
+            estimated_time=timedelta(minutes=30),
+        )
+
+    def read(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_geojson_export(self):
+        data = json.loads(self.read('/api/export/pois.geojson'))
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual([feature['id'] for feature in data['features']], [self.poi.pk, self.second.pk])
+        geometry = data['features'][1]['geometry']
+        self.assertEqual(geometry['type'], 'Point')
+        self.assertEqual([round(value, 6) for value in geometry['coordinates']], [-17.84, 28.45])
+        self.assertEqual(data['features'][1]['properties']['name'], 'Faro de Fuencaliente')
+
+    def test_ndjson_export(self):
+        lines = self.read('/api/export/restaurants.ndjson').splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['id'], self.restaurant.pk)
+
+    def test_events_are_wrapped_as_features(self):
+        for url in ['/api/export/events.geojson', '/api/export/events.ndjson']:
+            with self.subTest(url=url):
+                body = self.read(url)
+                if url.endswith('.geojson'):
+                    features = json.loads(body)['features']
+                else:
+                    features = [json.loads(line) for line in body.splitlines()]
+                [feature] = features
+                self.assertEqual(feature['type'], 'Feature')
+                self.assertEqual(feature['id'], self.event.pk)
+                self.assertEqual(feature['geometry']['type'], 'Point')
+                self.assertEqual(feature['properties']['name'], 'Fiesta')
+
+    def test_unknown_layer(self):
+        self.assertEqual(self.client.get('/api/export/itineraries.geojson').status_code, 404)
+
+
+class SharedVersionTests(APITestCase):
+    """
+    Las versiones viven en la caché compartida: un cambio guardado en otro
+    worker invalida las respuestas cacheadas en la memoria de este.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_in_shared_cache_invalidates_responses(self):
+        etag = self.client.get('/api/restaurants/')['ETag']
+        caches['versions'].incr('version:restaurant')
+        response = self.client.get('/api/restaurants/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class FastGeoFeatureSerializerTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue()
+        PointOfInterest.objects.create(
+            name='Sin ubicación', description='', address='', type='OTHER',
+            difficulty='HARD', estimated_time=timedelta(days=1, minutes=5),
+        )
+
+    def test_output_matches_drf_serializer(self):
+        renderer = JSONRenderer()
+        for serializer_class in [PointOfInterestSerializer, RestaurantSerializer]:
+            with self.subTest(serializer=serializer_class.__name__):
+                queryset = serializer_class.Meta.model.objects.order_by('pk')
+                fast = FastGeoFeatureSerializer(serializer_class)
+                self.assertEqual(
+                    renderer.render(fast.to_representation(fast.prepare(queryset))),
+                    renderer.render(serializer_class(queryset, many=True).data),
+                )
+
+
+class ORJSONRendererTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='viajero')
+        cls.itinerary = create_itinerary(user, *create_catalogue())
+
+    def test_output_matches_json_renderer(self):
+        data = ItinerarySerializer(self.itinerary).data
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser_rejects_invalid_json(self):
+        self.assertEqual(ORJSONParser().parse(BytesIO(b'{"day": 1}')), {'day': 1})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{day: 1}'))
+
+
+FAKE_ITINERARY = {
+    'display': 'Tu itinerario ya está disponible en el mapa',
+    'data': {
+        'title': 'Ruta de miradores',
+        'description': '',
+        'points': [
+            {'id': 1, 'day': 1, 'order': 1, 'notes': 'Llevar abrigo', 'point_details': {'name': 'Roque'}},
+            {'id': 2, 'day': 2, 'order': 1, 'notes': '', 'point_details': {'name': 'Caldera'}},
+        ],
+    },
+}
+
+
+class FakeLLMClient:
+    """
+    Cliente local con la misma interfaz que `openai.OpenAI`.
+    """
+    calls = []
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        FakeLLMClient.calls.append(kwargs)
+        content = '```json\n' + json.dumps(FAKE_ITINERARY) + '\n```'
+        if kwargs.get('stream'):
+            # Fragmentos pequeños para cortar el JSON en sitios arbitrarios
+            return (
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 5]))])
+                for i in range(0, len(content), 5)
+            )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FailingLLMClient(FakeLLMClient):
+
+    def create(self, **kwargs):
+        raise RuntimeError('Incorrect API key provided: sk-secreta')
+
+
+@override_settings(ITINERARY_LLM_CLIENT='tourism.tests.FakeLLMClient', ITINERARY_EAGER=True)
+class GenerateItineraryTests(APITestCase):
+    payload = {
+        'query': 'Dos días de miradores',
+        'available_pois': [{
+            'id': 1, 'name': 'Roque de los Muchachos', 'description': 'Mirador',
+            'type': 'VIEWPOINT', 'difficulty': 'EASY',
+        }],
+    }
+
+    def setUp(self):
+        cache.clear()
+        llm.job_cache().clear()
+        FakeLLMClient.calls = []
+
+    def test_generation_returns_job_with_result(self):
+        response = self.client.post('/api/generate-itinerary/', self.payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], llm.DONE)
+        self.assertEqual(response.data['data'], FAKE_ITINERARY['data'])
+
+        self.assertTrue(response.data['status_url'].endswith(f"/api/generate-itinerary/{response.data['job_id']}/"))
+        status = self.client.get(response.data['status_url'])
+        self.assertEqual(status.data['data'], FAKE_ITINERARY['data'])
+
+    def test_identical_requests_are_deduplicated(self):
+        first = self.client.post('/api/generate-itinerary/', self.payload, format='json')
+        second = self.client.post('/api/generate-itinerary/', self.payload, format='json')
+        self.assertEqual(first.data['job_id'], second.data['job_id'])
+        self.assertEqual(len(FakeLLMClient.calls), 1)
+
+    @override_settings(ITINERARY_EAGER=False)
+    def test_background_job_is_pending_until_done(self):
+        job_id = llm.job_id_for(self.payload['query'], self.payload['available_pois'])
+        llm.job_cache().set(llm.job_key(job_id), {'id': job_id, 'status': llm.PENDING, 'started_at': time.time()})
+        response = self.client.post('/api/generate-itinerary/', self.payload, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], llm.PENDING)
+        self.assertEqual(FakeLLMClient.calls, [])
+
+    def test_stale_pending_job_is_resubmitted(self):
+        job_id = llm.job_id_for(self.payload['query'], self.payload['available_pois'])
+        started_at = time.time() - llm.PENDING_TIMEOUT - 1
+        llm.job_cache().set(llm.job_key(job_id), {'id': job_id, 'status': llm.PENDING, 'started_at': started_at})
+        response = self.client.post('/api/generate-itinerary/', self.payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], llm.DONE)
+        self.assertEqual(len(FakeLLMClient.calls), 1)
+
+    @override_settings(ITINERARY_LLM_CLIENT='tourism.tests.FailingLLMClient')
+    def test_client_errors_are_not_exposed(self):
+        response = self.client.post('/api/generate-itinerary/', self.payload, format='json')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data['error'], llm.GENERATION_ERROR)
+        self.assertNotIn(b'sk-secreta', response.content)
+
+    def test_abandoned_job_is_reported_as_failed(self):
+        job_id = llm.job_id_for(self.payload['query'], self.payload['available_pois'])
+        started_at = time.time() - llm.PENDING_TIMEOUT - 1
+        llm.job_cache().set(llm.job_key(job_id), {'id': job_id, 'status': llm.PENDING, 'started_at': started_at})
+        response = self.client.get(f'/api/generate-itinerary/{job_id}/')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data['status'], llm.ERROR)
+        self.assertEqual(response.data['error'], llm.ABANDONED_ERROR)
+
+    def read_events(self, response):
+        body = b''.join(response.streaming_content).decode('utf-8')
+        events = []
+        for block in body.strip().split('\n\n'):
+            if block.startswith(':'):
+                continue
+            event, data = block.split('\n')
+            events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_stream_emits_points_then_done(self):
+        response = self.client.post('/api/generate-itinerary/?stream=true', self.payload, format='json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.read_events(response)
+        self.assertEqual([event for event, _ in events], ['point', 'point', 'done'])
+        self.assertEqual([data for _, data in events[:2]], FAKE_ITINERARY['data']['points'])
+        self.assertEqual(events[-1][1]['data'], FAKE_ITINERARY['data'])
+
+    def test_stream_replays_cached_result(self):
+        self.client.post('/api/generate-itinerary/', self.payload, format='json')
+        response = self.client.post('/api/generate-itinerary/?stream=true', self.payload, format='json')
+        self.assertEqual(len(self.read_events(response)), 3)
+        self.assertEqual(len(FakeLLMClient.calls), 1)
+
+    def test_stream_attaches_to_pending_job(self):
+        job_id = llm.job_id_for(self.payload['query'], self.payload['available_pois'])
+        llm.job_cache().set(llm.job_key(job_id), {'id': job_id, 'status': llm.PENDING, 'started_at': time.time()})
+
+        def finish(seconds):
+            # El trabajo en curso termina mientras el stream espera
+            llm.job_cache().set(llm.job_key(job_id), {'id': job_id, 'status': llm.DONE, 'result': FAKE_ITINERARY})
+
+        with mock.patch.object(llm.time, 'sleep', side_effect=finish):
+            response = self.client.post('/api/generate-itinerary/?stream=true', self.payload, format='json')
+            events = self.read_events(response)
+        self.assertEqual([event for event, _ in events], ['point', 'point', 'done'])
+        self.assertEqual(events[-1][1]['data'], FAKE_ITINERARY['data'])
+        self.assertEqual(FakeLLMClient.calls, [])
+
+    def test_stream_wait_falls_back_to_status_url(self):
+        job_id = llm.job_id_for(self.payload['query'], self.payload['available_pois'])
+        llm.job_cache().set(llm.job_key(job_id), {'id': job_id, 'status': llm.PENDING, 'started_at': time.time()})
+        with mock.patch.object(llm, 'STREAM_WAIT_TIMEOUT', 0):
+            response = self.client.post('/api/generate-itinerary/?stream=true', self.payload, format='json')
+            [(event, data)] = self.read_events(response)
+        self.assertEqual(event, 'pending')
+        self.assertTrue(data['status_url'].endswith(f'/api/generate-itinerary/{job_id}/'))
+        self.assertEqual(FakeLLMClient.calls, [])
+
+    def test_unknown_job_returns_404(self):
+        self.assertEqual(self.client.get('/api/generate-itinerary/desconocido/').status_code, 404)
+
+
+class CandidateSelectionTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        near = Point(-17.88, 28.75, srid=4326)
+        far = Point(-17.76, 28.50, srid=4326)
+        defaults = {'address': '', 'difficulty': 'EASY', 'estimated_time': timedelta(hours=1)}
+        cls.roque = PointOfInterest.objects.create(
+            name='Roque de los Muchachos', description='Cumbre de la isla', location=near,
+            type='VIEWPOINT', **defaults)
+        cls.near_viewpoint = PointOfInterest.objects.create(
+            name='Pico de la Cruz', description='Vistas sobre la caldera', location=near,
+            type='VIEWPOINT', **defaults)
+        cls.far_museum = PointOfInterest.objects.create(
+            name='Museo Insular', description='Historia de La Palma', location=far,
+            type='MUSEUM', **defaults)
+
+    def test_ranks_mentioned_place_and_neighbours_first(self):
+        candidates = select_candidates('Miradores cerca del Roque de los Muchachos', limit=2)
+        self.assertEqual(
+            [candidate['id'] for candidate in candidates],
+            [self.roque.id, self.near_viewpoint.id]
+        )
+
+    def test_detects_types_in_query(self):
+        self.assertEqual(detect_types('Un día de museos y playas'), ['BEACH', 'MUSEUM'])
+
+    @override_settings(ITINERARY_LLM_CLIENT='tourism.tests.FakeLLMClient', ITINERARY_EAGER=True)
+    def test_generate_without_available_pois_uses_catalogue(self):
+        cache.clear()
+        FakeLLMClient.calls = []
+        response = self.client.post('/api/generate-itinerary/', {'query': 'Museos'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        prompt = FakeLLMClient.calls[0]['messages'][1]['content']
+        self.assertIn('Museo Insular', prompt)
+
+
+class FullTextSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.poi, cls.restaurant, cls.event = create_catalogue()
+        cls.itinerary = Itinerary.objects.create(
+            title='Ruta de los volcanes', start_date=date(2030, 5, 1), end_date=date(2030, 5, 2)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_viewset_search_uses_stemming(self):
+        # "miradores" coincide con "Mirador" gracias al analizador en español
+        response = self.client.get('/api/points-of-interest/?search=miradores')
+        self.assertEqual(len(response.data['results']['features']), 1)
+
+    def test_viewset_search_tolerates_typos(self):
+        response = self.client.get('/api/restaurants/?search=Casa Goya')
+        self.assertEqual(response.data['results']['features'][0]['id'], self.restaurant.id)
+
+    def test_unified_search(self):
+        response = self.client.get('/api/search/?q=volcanes')
+        self.assertEqual(
+            [(result['type'], result['id']) for result in response.data['results']],
+            [('itineraries', self.itinerary.id)]
+        )
+
+    def test_unified_search_validates_types(self):
+        self.assertEqual(self.client.get('/api/search/?q=roque&types=hoteles').status_code, 400)
+
+
+class ImportCatalogueTests(APITestCase):
+
+    def setUp(self):
+        self.features = [
+            {
+                'type': 'Feature', 'id': 1,
+                'geometry': {'type': 'Point', 'coordinates': [-17.85, 28.68]},
+                'properties': {
+                    'name': 'Caldera', 'description': 'Parque nacional', 'address': 'El Paso',
+                    'type': 'PARK', 'difficulty': 'HARD', 'estimated_time': '04:00:00',
+                },
+            },
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [-17.76, 28.50]},
+                'properties': {
+                    'name': 'Sin tipo', 'description': '', 'address': '',
+                    'type': 'CASTLE', 'difficulty': 'EASY', 'estimated_time': '01:00:00',
+                },
+            },
+        ]
+
+    def write_geojson(self):
+        tmp = tempfile.NamedTemporaryFile('w', suffix='.geojson', encoding='utf-8')
+        json.dump({'type': 'FeatureCollection', 'features': self.features}, tmp)
+        tmp.flush()
+        self.addCleanup(tmp.close)
+        return tmp.name
+
+    def test_command_imports_valid_rows_and_reports_errors(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_catalogue', 'pois', self.write_geojson(), stdout=stdout, stderr=stderr)
+        self.assertEqual(list(PointOfInterest.objects.values_list('id', 'name')), [(1, 'Caldera')])
+        self.assertIn('Fila 2', stderr.getvalue())
+        self.assertIn('1 filas guardadas de 2', stdout.getvalue())
+
+    def test_reimport_updates_existing_rows(self):
+        path = self.write_geojson()
+        call_command('import_catalogue', 'pois', path, stdout=StringIO(), stderr=StringIO())
+        self.features[0]['properties']['name'] = 'Caldera de Taburiente'
+        call_command('import_catalogue', 'pois', self.write_geojson(), stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(PointOfInterest.objects.get(id=1).name, 'Caldera de Taburiente')
+
+    def test_create_after_import_with_ids(self):
+        call_command('import_catalogue', 'pois', self.write_geojson(), stdout=StringIO(), stderr=StringIO())
+        poi = PointOfInterest.objects.create(
+            name='Nuevo', description='', address='', type='PARK', difficulty='EASY',
+            estimated_time=timedelta(hours=1),
+        )
+        self.assertGreater(poi.pk, 1)
+
+    def test_csv_with_both_coordinate_styles(self):
+        tmp = tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='')
+        self.addCleanup(tmp.close)
+        tmp.write(
+            'name,description,address,type,difficulty,estimated_time,lng,lat,longitude,latitude\n'
+            'Caldera,Parque,El Paso,PARK,HARD,04:00:00,-17.85,28.68,-17.85,28.68\n'
+            'Charco Azul,Piscinas,San Andrés,BEACH,EASY,01:00:00,,,-17.76,28.50\n'
+        )
+        tmp.flush()
+        stderr = StringIO()
+        call_command('import_catalogue', 'pois', tmp.name, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(stderr.getvalue(), '')
+        locations = dict(PointOfInterest.objects.values_list('name', 'location'))
+        self.assertEqual(locations['Charco Azul'].coords, (-17.76, 28.5))
+
+    def shapefile_dir(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return tmp.name
+
+    def test_shapefile_maps_truncated_columns(self):
+        path = write_shapefile(self.shapefile_dir(), [((-17.85, 28.68), {
+            'name': 'Caldera', 'descriptio': 'Parque nacional', 'address': 'El Paso',
+            'type': 'PARK', 'difficulty': 'HARD', 'estimated_': '04:00:00',
+        })])
+        stderr = StringIO()
+        call_command('import_catalogue', 'pois', path, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(stderr.getvalue(), '')
+        poi = PointOfInterest.objects.get()
+        self.assertEqual((poi.description, poi.estimated_time), ('Parque nacional', timedelta(hours=4)))
+        self.assertEqual(poi.location.coords, (-17.85, 28.68))
+
+    def test_shapefile_without_srs_reports_rows(self):
+        path = write_shapefile(self.shapefile_dir(), [((-17.85, 28.68), {
+            'name': 'Caldera', 'descriptio': 'Parque nacional', 'address': 'El Paso',
+            'type': 'PARK', 'difficulty': 'HARD', 'estimated_': '04:00:00',
+        })], prj=False)
+        stderr = StringIO()
+        call_command('import_catalogue', 'pois', path, stdout=StringIO(), stderr=stderr)
+        self.assertIn('Fila 1', stderr.getvalue())
+        self.assertFalse(PointOfInterest.objects.exists())
+
+    def test_unreadable_shapefile(self):
+        path = os.path.join(self.shapefile_dir(), 'roto.shp')
+        with open(path, 'wb') as f:
+            f.write(b'no es un shapefile')
+        with self.assertRaises(CommandError):
+            call_command('import_catalogue', 'pois', path, stdout=StringIO(), stderr=StringIO())
+
+    def test_endpoint_requires_admin(self):
+        with open(self.write_geojson(), 'rb') as upload:
+            response = self.client.post('/api/import/pois/', {'file': upload})
+        self.assertEqual(response.status_code, 403)
+
+
+class ItineraryEditTests(APITestCase):
+
+    def setUp(self):
+        self.poi, self.restaurant, self.event = create_catalogue()
+        self.itinerary = Itinerary.objects.create(
+            title='Ruta', start_date=date(2030, 1, 1), end_date=date(2030, 1, 2)
+        )
+        self.points = [
+            ItineraryPoint.objects.create(
+                itinerary=self.itinerary, point_of_interest=self.poi, day=day, order=order
+            )
+            for day in (1, 2) for order in (1, 2, 3)
+        ]
+        self.url = f'/api/itineraries/{self.itinerary.pk}/'
+
+    def layout(self):
+        return list(ItineraryPoint.objects.filter(itinerary=self.itinerary).values_list('day', 'order', 'id'))
+
+    def test_batch_operations_renumber_days(self):
+        p = self.points
+        operations = [
+            {'op': 'move', 'point_id': p[0].pk, 'day': 2, 'order': 1},
+            {'op': 'delete', 'point_id': p[4].pk},
+            {'op': 'insert', 'point_type': 'restaurant', 'point_id': self.restaurant.pk, 'day': 1, 'order': 1},
+            {'op': 'reorder', 'day': 2, 'points': [p[5].pk]},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'{self.url}edit_points/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "tourism_itinerarypoint"')]
+        self.assertEqual(len(updates), 1)
+
+        inserted = ItineraryPoint.objects.get(itinerary=self.itinerary, restaurant=self.restaurant)
+        self.assertEqual(self.layout(), [
+            (1, 1, inserted.pk), (1, 2, p[1].pk), (1, 3, p[2].pk),
+            (2, 1, p[5].pk), (2, 2, p[0].pk), (2, 3, p[3].pk),
+        ])
+        self.assertEqual([point['id'] for point in response.data], [row[2] for row in self.layout()])
+
+    def test_invalid_operation_changes_nothing(self):
+        before = self.layout()
+        response = self.client.post(f'{self.url}edit_points/', {'operations': [
+            {'op': 'delete', 'point_id': self.points[0].pk},
+            {'op': 'insert', 'point_type': 'poi', 'point_id': 999999, 'day': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['operation'], 1)
+        self.assertEqual(self.layout(), before)
+
+    def test_move_point_renumbers_source_and_destination(self):
+        p = self.points
+        response = self.client.post(f'{self.url}move_point/', {
+            'point_id': p[1].pk, 'new_day': 2, 'new_order': 2
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['day'], response.data['order']), (2, 2))
+        self.assertEqual(self.layout(), [
+            (1, 1, p[0].pk), (1, 2, p[2].pk),
+            (2, 1, p[3].pk), (2, 2, p[1].pk), (2, 3, p[4].pk), (2, 4, p[5].pk),
+        ])
+
+    def test_reorder_points_rejects_points_from_other_day(self):
+        response = self.client.post(f'{self.url}reorder_points/', {
+            'day': 1, 'points': [self.points[3].pk]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class OptimizeItineraryTests(APITestCase):
+
+    def setUp(self):
+        self.itinerary = Itinerary.objects.create(
+            title='Zigzag', start_date=date(2030, 1, 1), end_date=date(2030, 1, 2)
+        )
+        # Cuatro POIs en línea de oeste a este, guardados en zigzag
+        self.pois = [
+            PointOfInterest.objects.create(
+                name=f'POI {i}', description='', address='', type='VIEWPOINT',
+                difficulty='EASY', estimated_time=timedelta(hours=1),
+                location=Point(-17.95 + i * 0.05, 28.65, srid=4326),
+            )
+            for i in range(4)
+        ]
+        for order, index in enumerate([0, 2, 1, 3], 1):
+            ItineraryPoint.objects.create(
+                itinerary=self.itinerary, point_of_interest=self.pois[index], day=1, order=order
+            )
+        self.url = f'/api/itineraries/{self.itinerary.pk}/optimize/'
+
+    def visit_order(self):
+        return list(ItineraryPoint.objects.filter(itinerary=self.itinerary).values_list(
+            'day', 'point_of_interest__name'
+        ))
+
+    def test_optimize_removes_zigzag(self):
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        names = [name for _, name in self.visit_order()]
+        self.assertIn(names, [['POI 0', 'POI 1', 'POI 2', 'POI 3'], ['POI 3', 'POI 2', 'POI 1', 'POI 0']])
+        self.assertLess(response.data['distance_km'], 16)
+
+    def test_dry_run_does_not_save(self):
+        before = self.visit_order()
+        response = self.client.post(self.url, {'dry_run': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('points', response.data)
+        self.assertEqual(self.visit_order(), before)
+
+    def test_redistribute_splits_across_days(self):
+        response = self.client.post(self.url, {'redistribute': True, 'hours_per_day': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(day['points']) for day in response.data['days']], [2, 2])
+        days = dict(ItineraryPoint.objects.filter(itinerary=self.itinerary).values_list(
+            'point_of_interest__name', 'day'
+        ))
+        self.assertEqual(days['POI 0'], days['POI 1'])
+        self.assertEqual(days['POI 2'], days['POI 3'])
+
+    def test_redistribute_respects_hours_per_day(self):
+        # Con hora y media no caben dos visitas de una hora en el mismo día
+        response = self.client.post(self.url, {
+            'redistribute': True, 'hours_per_day': 1.5, 'dry_run': True,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        first, last = response.data['days']
+        self.assertEqual(len(first['points']), 1)
+        self.assertFalse(first['over_budget'])
+        self.assertEqual(first['overflow'], [])
+        self.assertEqual(len(last['points']), 3)
+        self.assertEqual(last['points'][1:], last['overflow'])
+        self.assertTrue(last['over_budget'])
+
+
+class TravelMatrixTests(APITestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(TRAVEL_MATRIX_DIR=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.poi, self.restaurant, self.event = create_catalogue()
+        self.far = PointOfInterest.objects.create(
+            name='Faro de Fuencaliente', description='', address='', type='MONUMENT',
+            difficulty='EASY', estimated_time=timedelta(hours=1),
+            location=Point(-17.84, 28.45, srid=4326),
+        )
+
+    def test_neighbours_endpoint(self):
+        url = f'/api/travel/pois/{self.poi.pk}/neighbours/'
+        self.assertEqual(self.client.get(url).status_code, 503)
+
+        travel.build(k=5)
+        response = self.client.get(url, {'k': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['neighbours']), 2)
+        self.assertNotIn(('pois', self.far.pk), [(n['type'], n['id']) for n in response.data['neighbours']])
+
+        response = self.client.get(url, {'types': 'pois'})
+        self.assertEqual([n['id'] for n in response.data['neighbours']], [self.far.pk])
+
+    def test_incremental_build_matches_full_build(self):
+        travel.build(k=5)
+        self.far.location = Point(-17.851, 28.681, srid=4326)
+        self.far.save()
+        result = travel.build(k=5)
+        self.assertTrue(result['incremental'])
+        incremental = travel.get_matrix().nearest('pois', self.poi.pk)
+
+        travel.build(k=5, full=True)
+        self.assertEqual(travel.get_matrix().nearest('pois', self.poi.pk), incremental)
+        self.assertEqual(incremental[-1]['id'], self.far.pk)
+        self.assertLess(incremental[-1]['distance_km'], 1)
+
+
+class ItineraryGeoJSONTests(APITestCase):
+
+    def setUp(self):
+        self.poi, self.restaurant, self.event = create_catalogue()
+        self.itinerary = create_itinerary(None, self.poi, self.restaurant, self.event, points=6)
+        self.url = f'/api/itineraries/{self.itinerary.pk}/geojson/'
+
+    def test_includes_every_point_kind_and_a_route_per_day(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        features = response.data['features']
+        kinds = [feature['properties']['type'] for feature in features]
+        self.assertEqual(kinds.count('poi') + kinds.count('restaurant') + kinds.count('event'), 6)
+        self.assertEqual({'poi', 'restaurant', 'event', 'route'}, set(kinds))
+        routes = [feature for feature in features if feature['properties']['type'] == 'route']
+        self.assertEqual([route['properties']['day'] for route in routes], [1, 2, 3])
+        self.assertEqual(routes[0]['geometry']['type'], 'LineString')
+
+    def test_etag_revalidation_skips_rebuild(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_point_changes_refresh_only_affected_days(self):
+        etag = self.client.get(self.url)['ETag']
+        point = ItineraryPoint.objects.filter(itinerary=self.itinerary, day=1).first()
+        point.notes = 'Llevar agua'
+        point.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        notes = {feature['id']: feature['properties'].get('notes') for feature in response.data['features']}
+        self.assertEqual(notes[point.pk], 'Llevar agua')
+
+        point.delete()
+        ids = [feature['id'] for feature in self.itinerary.get_points_geojson()['features']]
+        self.assertNotIn(point.pk, ids)
+
+    def test_added_point_with_day_as_text_refreshes_geojson(self):
+        self.client.get(self.url)
+        # Con un formulario el día llega como texto
+        response = self.client.post(f'/api/itineraries/{self.itinerary.pk}/add_point/', {
+            'point_type': 'poi', 'point_id': self.poi.pk, 'day': '2',
+        })
+        self.assertLess(response.status_code, 300)
+
+        features = self.client.get(self.url).data['features']
+        points = ItineraryPoint.objects.filter(itinerary=self.itinerary, day=2).values_list('pk', flat=True)
+        ids = {feature['id'] for feature in features if feature['properties']['type'] != 'route'}
+        self.assertLessEqual(set(points), ids)
+        routes = [feature['properties']['day'] for feature in features if feature['properties']['type'] == 'route']
+        self.assertEqual(routes, [1, 2, 3])
+
+    def test_batch_edit_and_catalogue_changes_refresh_geojson(self):
+        self.client.get(self.url)
+        point = ItineraryPoint.objects.filter(itinerary=self.itinerary, day=1).first()
+        self.client.post(f'/api/itineraries/{self.itinerary.pk}/move_point/', {
+            'point_id': point.pk, 'new_day': 3,
+        }, format='json')
+        self.poi.name = 'Roque'
+        self.poi.save()
+
+        features = self.itinerary.get_points_geojson()['features']
+        moved = next(feature for feature in features if feature['id'] == point.pk)
+        self.assertEqual(moved['properties']['day'], 3)
+        names = {feature['properties']['name'] for feature in features if feature['properties']['type'] == 'poi'}
+        self.assertEqual(names, {'Roque'})
+
+
+class OpeningHoursTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(
+            name='El Jardín', description='', address='Los Llanos', cuisine_type='LOCAL',
+            location=Point(-17.85, 28.68, srid=4326),
+            opening_hours={'lunes': '12:00-16:00', 'friday': ['20:00-01:00']},
+        )
+
+    def open_ids(self, **params):
+        response = self.client.get('/api/restaurants/nearby/', {'lat': 28.68, 'lng': -17.85, **params})
+        self.assertEqual(response.status_code, 200)
+        return [feature['id'] for feature in response.data['features']]
+
+    def test_open_at_uses_canary_time_and_overnight_spans(self):
+        self.assertEqual(self.open_ids(open_at='2030-07-01T13:00'), [self.restaurant.pk])
+        self.assertEqual(self.open_ids(open_at='2030-07-01T17:00'), [])
+        # 12:30 UTC son las 13:30 en Canarias (verano)
+        self.assertEqual(self.open_ids(open_at='2030-07-01T12:30:00+00:00'), [self.restaurant.pk])
+        # Viernes 20:00 - sábado 01:00
+        self.assertEqual(self.open_ids(open_at='2030-07-06T00:30'), [self.restaurant.pk])
+
+    def test_intervals_follow_json_changes(self):
+        self.restaurant.opening_hours = {'monday': 'closed'}
+        self.restaurant.save()
+        self.assertFalse(self.restaurant.opening_intervals.exists())
+        self.assertEqual(self.open_ids(open_at='2030-07-01T13:00'), [])
+
+    def test_invalid_open_at(self):
+        response = self.client.get('/api/restaurants/nearby/', {'lat': 28.68, 'lng': -17.85, 'open_at': 'ayer'})
+        self.assertEqual(response.status_code, 400)
+
+
+class EventPeriodTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.poi, self.restaurant, self.festival = create_catalogue()
+        start = timezone.make_aware(datetime(2030, 5, 10, 20, 0))
+        self.concert = Event.objects.create(
+            name='Concierto', description='', address='Tazacorte',
+            location=Point(-17.94, 28.64, srid=4326),
+            start_date=start, end_date=start + timedelta(hours=3),
+        )
+
+    def test_period_is_maintained_by_trigger(self):
+        self.concert.refresh_from_db()
+        self.assertEqual(self.concert.period.lower, self.concert.start_date)
+        self.assertEqual(self.concert.period.upper, self.concert.end_date)
+
+    def test_during_window_and_location(self):
+        response = self.client.get('/api/events/during/', {'start': '2030-05-01', 'end': '2030-05-31'})
+        self.assertEqual([event['id'] for event in response.data], [self.festival.pk, self.concert.pk])
+
+        response = self.client.get('/api/events/during/', {
+            'start': '2030-05-10T22:00', 'lat': 28.64, 'lng': -17.94, 'max_distance': 2,
+        })
+        self.assertEqual([event['id'] for event in response.data], [self.concert.pk])
+
+        self.assertEqual(self.client.get('/api/events/during/').status_code, 400)
+
+    def test_events_during_itinerary(self):
+        itinerary = Itinerary.objects.create(
+            title='Mayo', start_date=date(2030, 5, 10), end_date=date(2030, 5, 11)
+        )
+        response = self.client.get(f'/api/itineraries/{itinerary.pk}/events/')
+        self.assertEqual([event['id'] for event in response.data], [self.concert.pk])
+
+    def test_list_date_filters(self):
+        response = self.client.get('/api/events/', {'start_date': '2030-05-05'})
+        self.assertEqual([event['id'] for event in response.data['results']], [self.concert.pk])
+        self.assertEqual(self.client.get('/api/events/', {'start_date': 'mañana'}).status_code, 400)
+
+
+    def test_inverted_dates_use_date_columns(self):
+        start = timezone.make_aware(datetime(2030, 5, 12, 20, 0))
+        inverted = Event.objects.create(
+            name='Fechas al revés', description='', address='Tazacorte',
+            location=Point(-17.94, 28.64, srid=4326),
+            start_date=start, end_date=start - timedelta(hours=3),
+        )
+        inverted.refresh_from_db()
+        self.assertIsNone(inverted.period)
+
+        response = self.client.get('/api/events/', {'start_date': '2030-05-05', 'end_date': '2030-05-31'})
+        self.assertIn(inverted.pk, [event['id'] for event in response.data['results']])
+        response = self.client.get('/api/events/', {'start_date': '2030-05-13'})
+        self.assertNotIn(inverted.pk, [event['id'] for event in response.data['results']])
+
+class ClusterTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['tiles'].clear()
+        self.poi, self.restaurant, self.festival = create_catalogue()
+        self.far = PointOfInterest.objects.create(
+            name='Faro de Fuencaliente', description='Faro', location=Point(-17.84, 28.45, srid=4326),
+            address='Fuencaliente', type='BEACH', difficulty='EASY',
+            estimated_time=timedelta(minutes=30),
+        )
+
+    def test_low_zoom_merges_layers(self):
+        response = self.client.get('/api/clusters/', {'zoom': 3})
+        self.assertEqual(response.status_code, 200)
+        [cluster] = response.data['clusters']
+        self.assertEqual(cluster['count'], 3)
+        self.assertEqual(cluster['counts'], {
+            'pois': {'VIEWPOINT': 1, 'BEACH': 1}, 'restaurants': {'LOCAL': 1},
+        })
+
+    def test_high_zoom_and_bbox(self):
+        response = self.client.get('/api/clusters/', {'zoom': 12})
+        self.assertEqual([cluster['count'] for cluster in response.data['clusters']], [2, 1])
+        single = response.data['clusters'][1]
+        self.assertEqual((single['type'], single['id']), ('pois', self.far.pk))
+
+        response = self.client.get('/api/clusters/', {'zoom': 12, 'bbox': '-18,28.6,-17.7,28.9', 'types': 'pois'})
+        self.assertEqual(response.data['clusters'][0]['counts'], {'pois': {'VIEWPOINT': 1}})
+        self.assertEqual(len(response.data['clusters']), 1)
+
+    def test_invalidated_on_change(self):
+        self.client.get('/api/clusters/', {'zoom': 3})
+        self.far.delete()
+        response = self.client.get('/api/clusters/', {'zoom': 3})
+        self.assertEqual(response.data['clusters'][0]['count'], 2)
+
+    def test_etag_follows_layer_versions(self):
+        response = self.client.get('/api/clusters/', {'zoom': 3})
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/clusters/', {'zoom': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.far.name = 'Faro'
+        self.far.save()
+        response = self.client.get('/api/clusters/', {'zoom': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/clusters/').status_code, 400)
+        self.assertEqual(self.client.get('/api/clusters/', {'zoom': 5, 'bbox': '1,2,3'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/clusters/', {'zoom': 5, 'types': 'events'}).status_code, 400)
+
+
+class ViewportTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.poi, self.restaurant, self.festival = create_catalogue()
+        self.far = PointOfInterest.objects.create(
+            name='Playa de Nogales', description='Playa', location=Point(-17.74, 28.75, srid=4326),
+            address='Puntallana', type='BEACH', difficulty='MEDIUM',
+            estimated_time=timedelta(hours=2),
+        )
+
+    def test_full_features_inside_bbox(self):
+        response = self.client.get('/api/points-of-interest/in_bbox/', {'bbox': '-17.9,28.6,-17.8,28.7'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['mode'], 'full')
+        [feature] = response.data['features']
+        self.assertEqual(feature['id'], self.poi.pk)
+        self.assertEqual(feature['properties']['name'], 'Roque de los Muchachos')
+
+        response = self.client.get('/api/events/in_bbox/', {'bbox': '-17.9,28.6,-17.8,28.7'})
+        self.assertEqual([feature['id'] for feature in response.data['features']], [self.festival.pk])
+        self.assertEqual(response.data['features'][0]['geometry']['coordinates'], [-17.85, 28.68])
+
+    def test_compact_over_budget(self):
+        # Conteo de ids + filas compactas, sin construir features completas
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/points-of-interest/in_bbox/', {
+                'bbox': '-18,28.4,-17.7,28.9', 'limit': 1, 'ordering': 'name',
+            })
+        self.assertEqual(response.data['mode'], 'compact')
+        self.assertEqual(response.data['fields'], ['id', 'type', 'lng', 'lat'])
+        self.assertCountEqual(response.data['features'], [
+            [self.poi.pk, 'VIEWPOINT', -17.85, 28.68],
+            [self.far.pk, 'BEACH', -17.74, 28.75],
+        ])
+        self.assertFalse(response.data['truncated'])
+
+    def test_invalid_bbox(self):
+        self.assertEqual(self.client.get('/api/restaurants/in_bbox/').status_code, 400)
+        self.assertEqual(
+            self.client.get('/api/restaurants/in_bbox/', {'bbox': '-17,28,-18,29'}).status_code, 400
+        )
+
+
+class ColumnarFormatTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.poi, self.restaurant, self.festival = create_catalogue()
+
+    def test_list_as_columnar_json(self):
+        response = self.client.get('/api/points-of-interest/', {'format': 'columnar'})
+        self.assertEqual(response['Content-Type'], 'application/vnd.palma.columnar+json')
+        results = json.loads(response.content)['results']
+        self.assertEqual(results['type'], 'ColumnarFeatureCollection')
+        self.assertEqual(results['ids'], [self.poi.pk])
+        self.assertEqual(results['coordinates'], [-17.85, 28.68])
+        self.assertEqual(results['properties']['name'], ['Roque de los Muchachos'])
+        type_code = results['properties']['type'][0]
+        self.assertEqual(results['enums']['type'][type_code], 'VIEWPOINT')
+
+    def test_nearby_as_msgpack(self):
+        response = self.client.get(
+            '/api/restaurants/nearby/', {'lat': 28.68, 'lng': -17.85},
+            HTTP_ACCEPT='application/vnd.palma.columnar+msgpack',
+        )
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data['ids'], [self.restaurant.pk])
+        self.assertEqual(data['enums']['cuisine_type'][data['properties']['cuisine_type'][0]], 'LOCAL')
+
+    def test_etag_depends_on_format(self):
+        json_etag = self.client.get('/api/points-of-interest/')['ETag']
+        response = self.client.get(
+            '/api/points-of-interest/', HTTP_ACCEPT='application/vnd.palma.columnar+json',
+            HTTP_IF_NONE_MATCH=json_etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], json_etag)
+        self.assertIn('Accept', response['Vary'])
+
+
+class ReviewStatsTests(APITestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'viajero{i}') for i in range(3)]
+        self.best = Itinerary.objects.create(title='Costa', start_date=date(2030, 5, 1), end_date=date(2030, 5, 2))
+        self.other = Itinerary.objects.create(title='Cumbre', start_date=date(2030, 5, 1), end_date=date(2030, 5, 2))
+        self.unrated = Itinerary.objects.create(title='Sin reseñas', start_date=date(2030, 5, 1), end_date=date(2030, 5, 2))
+        ItineraryReview.objects.create(itinerary=self.best, user=self.users[0], rating=5, scenery_rating=4)
+        ItineraryReview.objects.create(itinerary=self.best, user=self.users[1], rating=4)
+        self.review = ItineraryReview.objects.create(itinerary=self.other, user=self.users[2], rating=2)
+
+    def stats(self, itinerary):
+        return self.client.get(f'/api/itineraries/{itinerary.pk}/').data['review_stats']
+
+    def test_aggregates_follow_reviews(self):
+        stats = self.stats(self.best)
+        self.assertEqual(stats['review_count'], 2)
+        self.assertEqual(stats['average_rating'], 4.5)
+        self.assertEqual(stats['dimensions']['rating']['histogram'], [0, 0, 0, 1, 1])
+        self.assertEqual(stats['dimensions']['scenery'], {'count': 1, 'mean': 4.0, 'histogram': [0, 0, 0, 1, 0]})
+
+        self.review.rating = 3
+        self.review.save()
+        self.assertEqual(self.stats(self.other)['dimensions']['rating']['histogram'], [0, 0, 1, 0, 0])
+
+        self.review.itinerary = self.best
+        self.review.save()
+        self.assertEqual(self.stats(self.other)['review_count'], 0)
+        self.assertEqual(self.stats(self.best)['average_rating'], 4.0)
+
+        self.review.delete()
+        self.assertEqual(self.stats(self.best)['review_count'], 2)
+        self.assertEqual(self.stats(self.unrated), {'review_count': 0, 'average_rating': None, 'dimensions': {}})
+
+    def test_ordering_by_rating(self):
+        response = self.client.get('/api/itineraries/', {'ordering': '-average_rating'})
+        self.assertEqual(
+            [itinerary['id'] for itinerary in response.data['results']],
+            [self.best.pk, self.other.pk, self.unrated.pk],
+        )
+        response = self.client.get('/api/itineraries/', {'ordering': '-review_count,title'})
+        self.assertEqual(response.data['results'][0]['id'], self.best.pk)
+
+    def test_consistency_command(self):
+        call_command('check_review_stats', stdout=StringIO())
+
+        # update() no envía señales
+        ItineraryReview.objects.filter(pk=self.review.pk).update(rating=5)
+        with self.assertRaises(CommandError):
+            call_command('check_review_stats', stdout=StringIO())
+
+        call_command('check_review_stats', '--fix', stdout=StringIO())
+        self.assertEqual(self.stats(self.other)['average_rating'], 5.0)
+        call_command('check_review_stats', stdout=StringIO())
+
+
+class LeaderboardTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create(username=f'viajero{i}') for i in range(12)]
+        self.single, self.popular, self.poor = [
+            Itinerary.objects.create(title=title, start_date=date(2030, 5, 1), end_date=date(2030, 5, 2))
+            for title in ('Una reseña', 'Popular', 'Floja')
+        ]
+        self.review(self.single, [5])
+        self.review(self.popular, [5, 5, 5, 5, 4, 4, 4, 4], accessibility_rating=3)
+        self.review(self.poor, [2, 2], accessibility_rating=5)
+
+    def review(self, itinerary, ratings, **extra):
+        start = itinerary.reviews.count()
+        for user, rating in zip(self.users[start:], ratings):
+            ItineraryReview.objects.create(itinerary=itinerary, user=user, rating=rating, **extra)
+
+    def ranking(self, **params):
+        response = self.client.get('/api/itineraries/leaderboard/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_bayesian_ranking(self):
+        data = self.ranking()
+        self.assertAlmostEqual(data['prior_mean'], 45 / 11)
+        self.assertEqual(
+            [row['itinerary_id'] for row in data['results']], [self.popular.pk, self.single.pk, self.poor.pk]
+        )
+        self.assertEqual(data['results'][0]['title'], 'Popular')
+        self.assertEqual(data['results'][0]['review_count'], 8)
+        self.assertEqual(data['results'][0]['mean'], 4.5)
+
+        data = self.ranking(dimension='accessibility_rating', limit=1)
+        self.assertEqual(data['dimension'], 'accessibility')
+        self.assertEqual([row['itinerary_id'] for row in data['results']], [self.poor.pk])
+        self.assertEqual(data['count'], 2)
+
+    def test_incremental_update(self):
+        self.ranking()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review(self.poor, [5] * 8)
+        data = self.ranking()
+        # La media global no se recalcula hasta que caduca la clasificación
+        self.assertAlmostEqual(data['prior_mean'], 45 / 11)
+        self.assertEqual(
+            [row['itinerary_id'] for row in data['results']], [self.popular.pk, self.poor.pk, self.single.pk]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.popular.delete()
+        data = self.ranking()
+        self.assertEqual([row['itinerary_id'] for row in data['results']], [self.poor.pk, self.single.pk])
+
+    @mock.patch.object(leaderboard, 'BLOCK_SIZE', 1)
+    def test_update_rewrites_only_touched_blocks(self):
+        self.ranking()
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            leaderboard.update(self.poor.pk, {'rating': {'sum': 44, 'count': 10}})
+        # Floja pasa del último bloque al primero; el de "Una reseña" no se toca
+        written = set().union(*(call.args[0] for call in set_many.call_args_list))
+        self.assertIn(leaderboard.block_key('rating', 0), written)
+        self.assertIn(leaderboard.block_key('rating', 2), written)
+        self.assertNotIn(leaderboard.block_key('rating', 1), written)
+
+        data = self.ranking()
+        self.assertEqual(
+            [row['itinerary_id'] for row in data['results']], [self.popular.pk, self.poor.pk, self.single.pk]
+        )
+        self.assertEqual(data['count'], 3)
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/itineraries/leaderboard/', {'dimension': 'comida'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/itineraries/leaderboard/', {'limit': 'diez'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,95 @@
+"""
+Generación de teselas vectoriales (Mapbox Vector Tiles) con ST_AsMVT.
+
+Las teselas se guardan en la caché `tiles` con una clave que incluye la
+versión de datos de la capa. Al guardar o borrar una fila de la capa se
+incrementa la versión (ver signals.py), así que las teselas antiguas dejan
+de usarse sin tener que recorrerlas para invalidarlas.
+"""
+from django.db import connection
+
+from .cache import get_or_compute
+from .models import Event, PointOfInterest, Restaurant
+
+TILE_CACHE_ALIAS = 'tiles'
+TILE_CACHE_TIMEOUT = 60 * 60 * 24
+MAX_ZOOM = 22
+
+# Atributos por capa y zoom mínimo a partir del cual se incluyen: en zooms
+# de isla completa solo viaja lo necesario para pintar y filtrar.
+TILE_LAYERS = {
+    'pois': {
+        'model': PointOfInterest,
+        'attributes': [
+            (0, {'id': 't.id', 'type': 't.type'}),
+            (12, {'name': 't.name', 'difficulty': 't.difficulty'}),
+        ],
+    },
+    'restaurants': {
+        'model': Restaurant,
+        'attributes': [
+            (0, {'id': 't.id', 'cuisine_type': 't.cuisine_type'}),
+            (12, {'name': 't.name', 'price_range': 't.price_range'}),
+        ],
+    },
+    'events': {
+        'model': Event,
+        'attributes': [
+            (0, {'id': 't.id'}),
+            (12, {'name': 't.name', 'start_date': 't.start_date::text', 'end_date': 't.end_date::text'}),
+        ],
+    },
+}
+
+LAYER_BY_MODEL = {config['model']: layer for layer, config in TILE_LAYERS.items()}
+
+
+def is_valid_tile(z, x, y):
+    if not 0 <= z <= MAX_ZOOM:
+        return False
+    size = 2 ** z
+    return 0 <= x < size and 0 <= y < size
+
+
+def layer_attributes(layer, z):
+    columns = {}
+    for min_zoom, attributes in TILE_LAYERS[layer]['attributes']:
+        if z >= min_zoom:
+            columns.update(attributes)
+    return columns
+
+
+def render_tile(layer, z, x, y):
+    """
+    Genera la tesela en PostGIS y devuelve los bytes MVT.
+    """
+    model = TILE_LAYERS[layer]['model']
+    columns = ', '.join(
+        f'{expression} AS {connection.ops.quote_name(name)}'
+        for name, expression in layer_attributes(layer, z).items()
+    )
+    sql = f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%s, %s, %s) AS geom
+        ),
+        mvtgeom AS (
+            SELECT ST_AsMVTGeom(ST_Transform(t.location, 3857), bounds.geom) AS geom, {columns}
+            FROM {connection.ops.quote_name(model._meta.db_table)} t, bounds
+            WHERE t.location && ST_Transform(bounds.geom, 4326)
+        )
+        SELECT ST_AsMVT(mvtgeom.*, %s, 4096, 'geom') FROM mvtgeom
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [z, x, y, layer])
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b''
+
+
+def get_tile(layer, z, x, y):
+    """
+    Devuelve la tesela desde la caché o la genera si la versión cambió.
+    """
+    return get_or_compute(
+        f'tiles-{layer}', f'{z}:{x}:{y}', lambda: render_tile(layer, z, x, y),
+        timeout=TILE_CACHE_TIMEOUT, alias=TILE_CACHE_ALIAS,
+    )
@@ -0,0 +1,298 @@
+"""
+Matriz persistente de vecinos más cercanos entre POIs, restaurantes y eventos.
+
+Para cada lugar del catálogo se guardan sus K vecinos más cercanos (de
+cualquier capa) con la distancia en km; el tiempo de viaje se deriva de ella
+con `routing.travel_minutes`. Los datos son arrays de NumPy guardados en
+disco (.npy) y abiertos con mmap, así que todos los procesos comparten las
+mismas páginas y cargar la matriz no cuesta nada.
+
+La matriz se reconstruye con `python manage.py build_travel_matrix`. Por
+defecto solo se recalculan las filas de los lugares creados, movidos o
+borrados desde la última ejecución (según `updated_at`) y las de los lugares
+cuyos vecinos han cambiado.
+
+Estructura en TRAVEL_MATRIX_DIR:
+
+    CURRENT                 nombre de la versión en uso
+    <versión>/meta.json     fecha de construcción y K
+    <versión>/keys.npy      clave (capa << 40 | id) de cada lugar, ordenadas
+    <versión>/lngs.npy, lats.npy
+    <versión>/neighbours.npy  n×K índices de los vecinos (-1 si no hay)
+    <versión>/distances.npy   n×K distancias en km (inf si no hay)
+"""
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Event, PointOfInterest, Restaurant
+from .routing import distance_matrix, travel_minutes
+from .spatial import X, Y
+
+MATRIX_LAYERS = {
+    'pois': PointOfInterest,
+    'restaurants': Restaurant,
+    'events': Event,
+}
+LAYER_NAMES = list(MATRIX_LAYERS)
+KEY_SHIFT = 40
+ID_MASK = (1 << KEY_SHIFT) - 1
+DEFAULT_K = 50
+# Elementos de la matriz de distancias calculados a la vez (~32 MB en float64)
+CHUNK_ELEMENTS = 4 * 1024 * 1024
+ARRAYS = ['keys', 'lngs', 'lats', 'neighbours', 'distances']
+
+
+def matrix_dir():
+    path = getattr(settings, 'TRAVEL_MATRIX_DIR', None)
+    return Path(path) if path else Path(settings.BASE_DIR) / 'cache' / 'travel_matrix'
+
+
+def encode(layer, pk):
+    return (LAYER_NAMES.index(layer) << KEY_SHIFT) | int(pk)
+
+
+def decode(key):
+    key = int(key)
+    return LAYER_NAMES[key >> KEY_SHIFT], key & ID_MASK
+
+
+class TravelMatrix:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path / 'meta.json') as f:
+            meta = json.load(f)
+        self.built_at = datetime.fromisoformat(meta['built_at'])
+        self.k = meta['k']
+        for name in ARRAYS:
+            setattr(self, name, np.load(path / f'{name}.npy', mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def index_of(self, layer, pk):
+        if layer not in MATRIX_LAYERS:
+            return None
+        key = encode(layer, pk)
+        index = int(np.searchsorted(self.keys, key))
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return None
+
+    def describe(self, index, distance_km=None):
+        layer, pk = decode(self.keys[index])
+        result = {
+            'type': layer,
+            'id': pk,
+            'coordinates': [float(self.lngs[index]), float(self.lats[index])],
+        }
+        if distance_km is not None:
+            result['distance_km'] = round(float(distance_km), 3)
+            result['travel_minutes'] = round(travel_minutes(float(distance_km)), 1)
+        return result
+
+    def nearest(self, layer, pk, k=None, layers=None):
+        """
+        Vecinos más cercanos de un lugar, del más próximo al más lejano.
+        Con `layers` se filtran los K guardados, así que pueden salir menos
+        de `k`. Devuelve None si el lugar no está en la matriz.
+        """
+        index = self.index_of(layer, pk)
+        if index is None:
+            return None
+        result = []
+        for neighbour, distance in zip(self.neighbours[index], self.distances[index]):
+            if neighbour < 0:
+                break
+            item = self.describe(neighbour, distance)
+            if layers and item['type'] not in layers:
+                continue
+            result.append(item)
+            if k and len(result) >= k:
+                break
+        return result
+
+    def distance_km(self, origin, destination):
+        """
+        Distancia entre dos lugares dados como (capa, id).
+        """
+        a, b = self.index_of(*origin), self.index_of(*destination)
+        if a is None or b is None:
+            return None
+        return float(distance_matrix(self.lngs[[a]], self.lats[[a]], self.lngs[[b]], self.lats[[b]])[0, 0])
+
+
+_loaded = None
+_lock = threading.Lock()
+
+
+def get_matrix():
+    """
+    Matriz en uso (None si no se ha construido). Se vuelve a abrir cuando
+    otra ejecución de build_travel_matrix publica una versión nueva.
+    """
+    global _loaded
+    try:
+        name = (matrix_dir() / 'CURRENT').read_text().strip()
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _loaded is None or _loaded[0] != name:
+            _loaded = (name, TravelMatrix(matrix_dir() / name))
+        return _loaded[1]
+
+
+def load_locations():
+    """
+    Claves ordenadas, coordenadas y fecha de modificación de todos los
+    lugares con ubicación.
+    """
+    keys, lngs, lats, updated = [], [], [], []
+    for layer, model in MATRIX_LAYERS.items():
+        rows = model.objects.filter(location__isnull=False).annotate(
+            lng=X('location'), lat=Y('location')
+        ).values_list('id', 'lng', 'lat', 'updated_at')
+        for pk, lng, lat, updated_at in rows.iterator(chunk_size=10000):
+            keys.append(encode(layer, pk))
+            lngs.append(lng)
+            lats.append(lat)
+            updated.append(updated_at)
+    keys = np.array(keys, dtype=np.int64)
+    order = np.argsort(keys)
+    return (
+        keys[order],
+        np.array(lngs, dtype=float)[order],
+        np.array(lats, dtype=float)[order],
+        [updated[i] for i in order],
+    )
+
+
+def top_k(rows, lngs, lats, k):
+    """
+    Los `k` vecinos más cercanos de cada fila de `rows` (índices en
+    lngs/lats), excluido el propio lugar.
+    """
+    n = len(lngs)
+    neighbours = np.full((len(rows), k), -1, dtype=np.int32)
+    distances = np.full((len(rows), k), np.inf, dtype=np.float32)
+    available = min(k, n - 1)
+    if available <= 0:
+        return neighbours, distances
+
+    chunk = max(1, CHUNK_ELEMENTS // n)
+    for start in range(0, len(rows), chunk):
+        block = rows[start:start + chunk]
+        dist = distance_matrix(lngs[block], lats[block], lngs, lats)
+        dist[np.arange(len(block)), block] = np.inf
+        nearest = np.argpartition(dist, available - 1, axis=1)[:, :available]
+        nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+        order = np.argsort(nearest_dist, axis=1)
+        neighbours[start:start + len(block), :available] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:start + len(block), :available] = np.take_along_axis(nearest_dist, order, axis=1)
+    return neighbours, distances
+
+
+def merge_candidates(neighbours, distances, rows, candidates, lngs, lats, k):
+    """
+    Mezcla los vecinos actuales de `rows` con los lugares `candidates` y se
+    queda con los `k` más cercanos.
+    """
+    chunk = max(1, CHUNK_ELEMENTS // max(1, len(candidates)))
+    for start in range(0, len(rows), chunk):
+        block = rows[start:start + chunk]
+        extra = distance_matrix(lngs[block], lats[block], lngs[candidates], lats[candidates])
+        extra[block[:, None] == candidates[None, :]] = np.inf
+        all_idx = np.concatenate([neighbours[block], np.broadcast_to(candidates, extra.shape)], axis=1)
+        all_dist = np.concatenate([distances[block], extra.astype(np.float32)], axis=1)
+        order = np.argsort(all_dist, axis=1)[:, :k]
+        best_dist = np.take_along_axis(all_dist, order, axis=1)
+        best_idx = np.take_along_axis(all_idx, order, axis=1)
+        best_idx[np.isinf(best_dist)] = -1
+        neighbours[block] = best_idx
+        distances[block] = best_dist
+
+
+def build(k=DEFAULT_K, full=False):
+    """
+    Construye (o actualiza) la matriz y la publica como versión en uso.
+    Devuelve un dict con el número de lugares y de filas recalculadas.
+    """
+    built_at = timezone.now()
+    previous = None if full else get_matrix()
+    if previous is not None and previous.k != k:
+        previous = None
+
+    keys, lngs, lats, updated = load_locations()
+    n = len(keys)
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    distances = np.full((n, k), np.inf, dtype=np.float32)
+
+    if previous is None:
+        recompute = np.arange(n)
+    else:
+        old_keys = np.asarray(previous.keys)
+        is_new = ~np.isin(keys, old_keys)
+        is_modified = np.array([value > previous.built_at for value in updated], dtype=bool)
+        changed = np.flatnonzero(is_new | is_modified)
+        removed = old_keys[~np.isin(old_keys, keys)]
+        if not len(changed) and not len(removed):
+            return {'locations': n, 'recomputed': 0, 'incremental': True}
+        stale = np.concatenate([keys[changed], removed])
+
+        # Reutilizar las filas de los lugares sin cambios, pasando los
+        # índices de sus vecinos de la versión anterior a la nueva
+        kept = np.flatnonzero(~(is_new | is_modified))
+        old_rows = np.searchsorted(old_keys, keys[kept])
+        old_neighbours = np.asarray(previous.neighbours)[old_rows]
+        valid = old_neighbours >= 0
+        neighbour_keys = np.where(valid, old_keys[np.where(valid, old_neighbours, 0)], -1)
+        remapped = np.searchsorted(keys, neighbour_keys).astype(np.int32)
+        neighbours[kept] = np.where(valid, remapped, -1)
+        distances[kept] = np.where(valid, np.asarray(previous.distances)[old_rows], np.inf)
+
+        # Si algún vecino se ha movido o borrado la fila se recalcula entera;
+        # si no, basta con comparar con los lugares que han cambiado
+        affected = np.isin(neighbour_keys, stale).any(axis=1)
+        recompute = np.concatenate([changed, kept[affected]])
+        untouched = kept[~affected]
+        if len(changed) and len(untouched):
+            merge_candidates(neighbours, distances, untouched, changed, lngs, lats, k)
+
+    if len(recompute):
+        neighbours[recompute], distances[recompute] = top_k(recompute, lngs, lats, k)
+
+    name = built_at.strftime('%Y%m%dT%H%M%S%f')
+    publish(name, built_at, k, {
+        'keys': keys, 'lngs': lngs, 'lats': lats, 'neighbours': neighbours, 'distances': distances,
+    })
+    return {'locations': n, 'recomputed': len(recompute), 'incremental': previous is not None}
+
+
+def publish(name, built_at, k, arrays):
+    """
+    Escribe la versión en un directorio nuevo y cambia CURRENT de forma
+    atómica; las versiones anteriores se borran después.
+    """
+    base = matrix_dir()
+    path = base / name
+    path.mkdir(parents=True, exist_ok=True)
+    for array_name, array in arrays.items():
+        np.save(path / f'{array_name}.npy', array)
+    with open(path / 'meta.json', 'w') as f:
+        json.dump({'built_at': built_at.isoformat(), 'k': k, 'size': len(arrays['keys'])}, f)
+
+    tmp = base / 'CURRENT.tmp'
+    tmp.write_text(name)
+    os.replace(tmp, base / 'CURRENT')
+
+    for old in base.iterdir():
+        if old.is_dir() and old.name != name:
+            shutil.rmtree(old, ignore_errors=True)
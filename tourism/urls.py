@@ -13,5 +13,13 @@ router.register(r'itinerary-reviews', views.ItineraryReviewViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('health/', views.health_check),
+    path('search/', views.search),
+    path('clusters/', views.clusters),
+    path('travel/<str:layer>/<int:pk>/neighbours/', views.travel_neighbours),
+    path('import/<str:layer>/', views.import_catalogue),
     path('generate-itinerary/', views.generate_itinerary),
+    path('generate-itinerary/<str:job_id>/', views.itinerary_job, name='itinerary-job'),
+    path('tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt', views.vector_tile),
+    path('export/<str:layer>.geojson', views.export_layer, {'fmt': 'geojson'}),
+    path('export/<str:layer>.ndjson', views.export_layer, {'fmt': 'ndjson'}),
 ] 
\ No newline at end of file
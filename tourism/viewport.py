@@ -0,0 +1,109 @@
+"""
+Consultas por la vista actual del mapa (bbox).
+
+El filtro usa el operador `&&` sobre `location`, que se resuelve con el
+índice GiST de la columna. Para que mover el mapa siga siendo rápido en
+zonas densas hay un presupuesto de features: si la vista tiene más lugares
+que `limit`, se responde en modo compacto con solo id, categoría y
+coordenadas, leídos en SQL sin instanciar modelos ni serializers.
+"""
+from django.contrib.gis.geos import Polygon
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+
+from .cache import cache_response
+from .export import to_feature
+from .geojson import FastGeoFeatureSerializer, ogr_coordinate
+from .spatial import X, Y, parse_bbox
+
+DEFAULT_MAX_FEATURES = 500
+MAX_FEATURES = 2000
+# Límite de filas en modo compacto
+MAX_COMPACT_FEATURES = 20000
+
+
+def filter_in_bbox(queryset, bbox, field='location'):
+    """
+    Filtra el queryset a los lugares dentro de `bbox` (min_lng, min_lat,
+    max_lng, max_lat).
+    """
+    polygon = Polygon.from_bbox(bbox)
+    polygon.srid = 4326
+    return queryset.filter(**{f'{field}__bboverlaps': polygon})
+
+
+class ViewportMixin:
+    """
+    Añade la acción `in_bbox` a un ViewSet de lugares. `viewport_category`
+    es el campo que se devuelve como categoría en el modo compacto (None
+    para no devolver ninguna).
+    """
+    viewport_category = None
+
+    def get_viewport_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_MAX_FEATURES))
+        except ValueError:
+            raise ValidationError({'limit': "Debe ser un número entero"})
+        return max(1, min(limit, MAX_FEATURES))
+
+    def full_features(self, queryset, limit):
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, GeoFeatureModelSerializer):
+            fast = FastGeoFeatureSerializer(serializer_class)
+            return [fast.to_feature(row) for row in fast.prepare(queryset)[:limit]]
+        return [to_feature(obj, serializer_class) for obj in queryset[:limit]]
+
+    def compact_fields(self):
+        return ['id', self.viewport_category] if self.viewport_category else ['id']
+
+    def compact_features(self, queryset):
+        """
+        Filas [id, categoría, lng, lat], hasta MAX_COMPACT_FEATURES + 1.
+        """
+        rows = queryset.order_by().annotate(
+            _lng=X('location'), _lat=Y('location')
+        ).values_list(*self.compact_fields(), '_lng', '_lat')[:MAX_COMPACT_FEATURES + 1]
+        return [
+            [*row[:-2], ogr_coordinate(row[-2]), ogr_coordinate(row[-1])]
+            for row in rows
+        ]
+
+    @action(detail=False, methods=['get'])
+    @cache_response
+    def in_bbox(self, request):
+        """
+        Lugares dentro de la vista actual del mapa.
+        Parámetros:
+        - bbox: min_lng,min_lat,max_lng,max_lat (requerido)
+        - limit: máximo de features completas (default: 500, máx: 2000).
+          Si la vista tiene más lugares la respuesta pasa a modo compacto:
+          `fields` describe las columnas y `features` es una lista de filas.
+        """
+        try:
+            bbox = parse_bbox(request.query_params['bbox'])
+        except KeyError:
+            return Response({"error": "Se requiere el parámetro bbox"}, status=400)
+        except ValueError:
+            return Response({"error": "bbox inválida"}, status=400)
+
+        queryset = filter_in_bbox(self.filter_queryset(self.get_queryset()), bbox)
+        return Response(self.viewport_data(queryset, self.get_viewport_limit(request)))
+
+    def viewport_data(self, queryset, limit):
+        """
+        FeatureCollection completa si hay como mucho `limit` lugares; si no,
+        filas compactas. La densidad se mide antes leyendo solo los ids.
+        """
+        if len(queryset.order_by().values('pk')[:limit + 1]) <= limit:
+            return {'type': 'FeatureCollection', 'mode': 'full', 'features': self.full_features(queryset, limit)}
+
+        rows = self.compact_features(queryset)
+        return {
+            'mode': 'compact',
+            'fields': [*self.compact_fields(), 'lng', 'lat'],
+            'features': rows[:MAX_COMPACT_FEATURES],
+            'truncated': len(rows) > MAX_COMPACT_FEATURES,
+        }
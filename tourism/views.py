@@ -1,39 +1,229 @@
 # trigger redeploy for Render
 from django.shortcuts import render
 from rest_framework import viewsets, filters
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from django.contrib.gis.geos import Point
-from django.contrib.gis.db.models.functions import Distance
-from django.contrib.gis.measure import D
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.settings import api_settings
+from rest_framework.filters import OrderingFilter
+from rest_framework.utils.urls import replace_query_param
 from .models import PointOfInterest, Restaurant, Event, Itinerary, ItineraryPoint, ItineraryReview
 from .serializers import (
     PointOfInterestSerializer, RestaurantSerializer, EventSerializer,
     ItinerarySerializer, ItineraryPointSerializer, ItineraryReviewSerializer,
     ItineraryCreateSerializer, ItineraryPointCreateSerializer
 )
+from . import itinerary_geojson, leaderboard, llm, routing, travel
+from .candidates import select_candidates
+from .cache import CachedResponseMixin, cache_response, etag_matches, get_or_compute
+from .clusters import CLUSTER_LAYERS, get_clusters, get_etag as cluster_etag
+from .export import EXPORT_LAYERS, geojson_stream, ndjson_stream
+from .geojson import FastGeoJSONListMixin
+from .importers import IMPORT_LAYERS, detect_format, import_file
+from .itinerary_edits import EditError, apply_operations
+from .opening_hours import open_at, week_minute
+from .pagination import NearestCursorPagination
+from .renderers import ColumnarJSONRenderer, ColumnarMsgPackRenderer
+from .periods import contained_in, itinerary_window, overlapping, parse_moment
+from .search import SEARCH_MODELS, FullTextSearchFilter, search_all
+from .spatial import KNNDistance, parse_bbox, parse_location, within_radius
+from .tiles import TILE_LAYERS, get_tile, is_valid_tile
+from .viewport import ViewportMixin
 from django.utils import timezone
-from django.db.models import Avg, Max
-from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.contrib.gis.db.models import Collect, Extent
+from django.contrib.gis.db.models.functions import Centroid
+from django.contrib.gis.gdal import GDALException
+from django.db.models import Avg, Case, Count, IntegerField, Max, Min, Prefetch, Value, When
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+import logging
 import os
-from django.conf import settings
-from openai import OpenAI
-import json
-import re
+import tempfile
 from django.views.decorators.csrf import csrf_exempt
 
+logger = logging.getLogger(__name__)
+
 # Create your views here.
 
+# Las capas del mapa admiten además el formato columnar (ver renderers.py)
+MAP_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer, ColumnarMsgPackRenderer]
+
 def health_check(request):
     return JsonResponse({"status": "ok"})
 
+def vector_tile(request, layer, z, x, y):
+    """
+    Devuelve una tesela vectorial (MVT) de la capa indicada.
+    Capas: pois, restaurants, events
+    """
+    if layer not in TILE_LAYERS:
+        return JsonResponse({"error": f"Capa desconocida: {layer}"}, status=404)
+    if not is_valid_tile(z, x, y):
+        return JsonResponse({"error": "Coordenadas de tesela inválidas"}, status=400)
+
+    response = HttpResponse(get_tile(layer, z, x, y), content_type='application/vnd.mapbox-vector-tile')
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
+
+def export_layer(request, layer, fmt):
+    """
+    Exporta una capa completa como GeoJSON o NDJSON (una feature por línea).
+    Capas: pois, restaurants, events
+    """
+    if layer not in EXPORT_LAYERS:
+        return JsonResponse({"error": f"Capa desconocida: {layer}"}, status=404)
+
+    if fmt == 'ndjson':
+        response = StreamingHttpResponse(ndjson_stream(layer), content_type='application/x-ndjson')
+    else:
+        response = StreamingHttpResponse(geojson_stream(layer), content_type='application/geo+json')
+    response['Content-Disposition'] = f'attachment; filename="{layer}.{fmt}"'
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def import_catalogue(request, layer):
+    """
+    Importación masiva de una capa desde un fichero subido en el campo 'file'.
+    Formatos: GeoJSON, NDJSON, CSV o shapefile comprimido en .zip
+    """
+    if layer not in IMPORT_LAYERS:
+        return Response({"error": f"Capa desconocida: {layer}"}, status=404)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"error": "El campo 'file' es requerido"}, status=400)
+
+    try:
+        fmt = request.data.get('format') or detect_format(upload.name)
+        # Los formatos se leen desde disco; las subidas pequeñas están en memoria
+        if hasattr(upload, 'temporary_file_path'):
+            result = import_file(layer, upload.temporary_file_path(), fmt)
+        else:
+            suffix = os.path.splitext(upload.name)[1]
+            with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+                for chunk in upload.chunks():
+                    tmp.write(chunk)
+                tmp.flush()
+                result = import_file(layer, tmp.name, fmt)
+    except (ValueError, GDALException) as e:
+        return Response({"error": str(e)}, status=400)
+
+    return Response(result.as_dict())
+
+
+@api_view(['GET'])
+def search(request):
+    """
+    Búsqueda de texto completo en todos los tipos de contenido.
+    Parámetros:
+    - q: texto a buscar
+    - types: tipos separados por comas (pois, restaurants, events, itineraries)
+    - limit: número máximo de resultados (default: 20, máx: 100)
+    """
+    term = request.query_params.get('q', '').strip()
+    if not term:
+        return Response({"error": "El parámetro 'q' es requerido"}, status=400)
+
+    types = request.query_params.get('types')
+    types = [t.strip() for t in types.split(',') if t.strip()] if types else None
+    if types and any(t not in SEARCH_MODELS for t in types):
+        return Response(
+            {"error": f"Tipos válidos: {', '.join(SEARCH_MODELS)}"},
+            status=400
+        )
+
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+    except ValueError:
+        return Response({"error": "limit debe ser un número entero"}, status=400)
+
+    return Response({'results': search_all(term, types, limit)})
+
+@api_view(['GET'])
+def travel_neighbours(request, layer, pk):
+    """
+    Lugares más cercanos a un POI, restaurante o evento según la matriz
+    precalculada (ver tourism.travel).
+    Parámetros:
+    - k: número de vecinos (default: 10)
+    - types: capas de los vecinos separadas por comas (pois, restaurants, events)
+    """
+    matrix = travel.get_matrix()
+    if matrix is None:
+        return Response({"error": "La matriz de distancias no se ha construido todavía"}, status=503)
+    if layer not in travel.MATRIX_LAYERS:
+        return Response({"error": f"Capa desconocida: {layer}"}, status=404)
+
+    types = request.query_params.get('types')
+    types = [t.strip() for t in types.split(',') if t.strip()] if types else None
+    if types and any(t not in travel.MATRIX_LAYERS for t in types):
+        return Response(
+            {"error": f"Tipos válidos: {', '.join(travel.MATRIX_LAYERS)}"},
+            status=400
+        )
+
+    try:
+        k = max(1, min(int(request.query_params.get('k', 10)), matrix.k))
+    except ValueError:
+        return Response({"error": "k debe ser un número entero"}, status=400)
+
+    neighbours = matrix.nearest(layer, pk, k, types)
+    if neighbours is None:
+        return Response({"error": "Lugar no encontrado en la matriz"}, status=404)
+    return Response({
+        'type': layer,
+        'id': pk,
+        'built_at': matrix.built_at,
+        'neighbours': neighbours,
+    })
+
+@api_view(['GET'])
+def clusters(request):
+    """
+    Clusters de POIs y restaurantes para pintar el mapa a zooms bajos.
+    Parámetros:
+    - zoom: nivel de zoom del mapa (requerido)
+    - bbox: min_lng,min_lat,max_lng,max_lat (opcional)
+    - types: capas separadas por comas (pois, restaurants; default: ambas)
+
+    Responde 304 si el ETag enviado sigue vigente (cambia al modificarse
+    alguna de las capas).
+    """
+    try:
+        zoom = int(request.query_params['zoom'])
+        bbox = request.query_params.get('bbox')
+        bbox = parse_bbox(bbox) if bbox else None
+    except KeyError:
+        return Response({"error": "Se requiere el parámetro zoom"}, status=400)
+    except ValueError:
+        return Response({"error": "Parámetros zoom o bbox inválidos"}, status=400)
+
+    types = request.query_params.get('types')
+    types = [t.strip() for t in types.split(',') if t.strip()] if types else None
+    if types and any(t not in CLUSTER_LAYERS for t in types):
+        return Response(
+            {"error": f"Tipos válidos: {', '.join(CLUSTER_LAYERS)}"},
+            status=400
+        )
+
+    etag = f'"{cluster_etag(zoom, bbox, types)}"'
+    if etag_matches(request, etag):
+        return Response(status=304, headers={'ETag': etag})
+    return Response(get_clusters(zoom, bbox, types), headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
 @api_view(['GET', 'POST'])
 @csrf_exempt
 def generate_itinerary(request):
     if request.method == 'GET':
         return Response({
-            "message": "Este endpoint espera una petición POST con un JSON que contenga los campos 'query' y 'available_pois'",
+            "message": "Este endpoint espera una petición POST con un JSON que contenga el campo 'query'. "
+                       "'available_pois' es opcional: si no se envía, el servidor elige los puntos de interés más relevantes. "
+                       "Devuelve un job_id cuyo estado se consulta en status_url hasta que 'status' sea 'done'. "
+                       "Con ?stream=true responde con Server-Sent Events: un evento 'point' por punto y un 'done' final.",
             "example": {
                 "query": "Quiero un itinerario de 2 días en La Palma visitando el Roque de los Muchachos",
                 "available_pois": [
@@ -58,122 +248,72 @@ def generate_itinerary(request):
         )
     
     if not available_pois:
-        return Response(
-            {"error": "El campo 'available_pois' es requerido"},
-            status=400
+        # Sin lista del cliente se eligen en servidor los POIs más relevantes
+        available_pois = select_candidates(user_query)
+        if not available_pois:
+            return Response(
+                {"error": "No hay puntos de interés disponibles"},
+                status=400
+            )
+
+    if request.query_params.get('stream', '').lower() in ('1', 'true'):
+        # Server-Sent Events: cada punto se envía en cuanto el modelo lo completa.
+        # La respuesta ocupa un hilo del worker hasta el final (ver llm.py)
+        job_id = llm.job_id_for(user_query, available_pois)
+        status_url = request.build_absolute_uri(reverse('itinerary-job', args=[job_id]))
+        response = StreamingHttpResponse(
+            llm.stream_itinerary(user_query, available_pois, status_url),
+            content_type='text/event-stream'
         )
-    
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
     try:
-        context = "\n".join([
-            f"- {poi['name']} (ID: {poi['id']}): {poi['description']} - Tipo: {poi['type']}, Dificultad: {poi['difficulty']}"
-            for poi in available_pois
-        ])
-        
-        prompt = f"""
-        Como experto en turismo de La Palma, genera un itinerario basado en esta solicitud: {user_query}
-        
-        Usa SOLO los siguientes puntos de interés disponibles:
-        {context}
-        
-        IMPORTANTE: Responde SOLO con este JSON, sin ningún texto adicional:
-        {{
-            "display": "Tu itinerario ya está disponible en el mapa",
-            "data": {{
-                "title": "Título atractivo para el itinerario",
-                "description": "Descripción breve y atractiva del itinerario, máximo 50 palabras.",
-                "points": [
-                    {{
-                        "id": 1,
-                        "day": 1,
-                        "order": 1,
-                        "notes": "Consejo breve, máximo 10 palabras",
-                        "point_details": {{
-                            "name": "Nombre del lugar",
-                            "description": "Descripción breve, máximo 30 palabras",
-                            "type": "PARK",
-                            "estimated_time": "HH:MM",
-                            "coordinates": [longitud, latitud]
-                        }}
-                    }},
-                    {{
-                        "id": 2,
-                        "day": 2,
-                        "order": 1,
-                        "notes": "Consejo breve, máximo 10 palabras",
-                        "point_details": {{
-                            "name": "Nombre del lugar",
-                            "description": "Descripción breve, máximo 30 palabras",
-                            "type": "VIEWPOINT",
-                            "estimated_time": "HH:MM",
-                            "coordinates": [longitud, latitud]
-                        }}
-                    }}
-                ]
-            }}
-        }}
-        """
-        
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4-1106-preview",
-            messages=[
-                {"role": "system", "content": "Eres un asistente especializado en crear itinerarios turísticos para La Palma. Debes responder SOLO con un JSON válido, sin texto adicional."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Procesar la respuesta de GPT
-        content = response.choices[0].message.content.strip()
-        print("\n=== RESPUESTA CRUDA DE GPT ===")
-        print(content)
-        print("=============================\n")
-        
-        # Limpiar cualquier bloque markdown al principio y al final
-        cleaned = content.strip()
-        cleaned = re.sub(r"^```(?:json)?\s*", "", cleaned, flags=re.IGNORECASE)
-        cleaned = re.sub(r"\s*```$", "", cleaned)
-        cleaned = cleaned.strip()
-        
-        print("\n=== CONTENIDO LIMPIO ===")
-        print(cleaned)
-        print("========================\n")
-        
-        try:
-            gpt_response = json.loads(cleaned)
-            print("\n=== JSON PARSEADO ===")
-            print(json.dumps(gpt_response, indent=2))
-            print("====================\n")
-            
-            display = gpt_response.get('display', '')
-            data = gpt_response.get('data', {})
-            return Response({
-                'display': display,
-                'data': data
-            })
-        except json.JSONDecodeError as e:
-            print(f"\n=== ERROR DE PARSEO JSON ===")
-            print(f"Error: {str(e)}")
-            print(f"Posición del error: {e.pos}")
-            print(f"Línea: {e.lineno}, Columna: {e.colno}")
-            print("===========================\n")
-            raise
-    except Exception as e:
-        print(f"\n=== ERROR GENERAL ===")
-        print(f"Error: {str(e)}")
-        print("===================\n")
+        job = llm.submit_job(user_query, available_pois)
+    except Exception:
+        logger.exception("Error encolando la generación del itinerario")
         return Response(
-            {"error": str(e)},
+            {"error": llm.GENERATION_ERROR},
             status=500
         )
-
-class PointOfInterestViewSet(viewsets.ModelViewSet):
+    return _itinerary_job_response(request, job)
+
+@api_view(['GET'])
+def itinerary_job(request, job_id):
+    """
+    Estado de un trabajo de generación de itinerario.
+    """
+    job = llm.get_job(job_id)
+    if job is None:
+        return Response({"error": "Trabajo no encontrado"}, status=404)
+    return _itinerary_job_response(request, job)
+
+def _itinerary_job_response(request, job):
+    body = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': request.build_absolute_uri(reverse('itinerary-job', args=[job['id']])),
+    }
+    if job['status'] == llm.DONE:
+        body.update(job['result'])
+        return Response(body)
+    if job['status'] == llm.ERROR:
+        body['error'] = job['error']
+        return Response(body, status=500)
+    return Response(body, status=202)
+
+class PointOfInterestViewSet(CachedResponseMixin, FastGeoJSONListMixin, ViewportMixin, viewsets.ModelViewSet):
     queryset = PointOfInterest.objects.all()
     serializer_class = PointOfInterestSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'created_at']
+    viewport_category = 'type'
+    renderer_classes = MAP_RENDERER_CLASSES
 
     @action(detail=False, methods=['get'])
+    @cache_response
     def nearby(self, request):
         """
         Encuentra puntos de interés cercanos a una ubicación dada.
@@ -182,18 +322,21 @@ class PointOfInterestViewSet(viewsets.ModelViewSet):
         - lng: longitud
         - max_distance: distancia máxima en kilómetros (default: 10)
         - type: tipo de punto de interés (opcional)
+
+        Modo vecinos más cercanos (se activa con `k`, `limit` o `cursor`):
+        - k / limit: número de resultados por página (default: 20, máx: 100)
+        - cursor: cursor devuelto en `next_cursor` para obtener el siguiente anillo
+        - max_distance: solo se aplica si se indica explícitamente
         """
+        if any(param in request.query_params for param in ('k', 'limit', 'cursor')):
+            return self._nearest(request)
+
         try:
-            lat = float(request.query_params.get('lat', 0))
-            lng = float(request.query_params.get('lng', 0))
+            user_location = parse_location(request.query_params)
             max_distance = float(request.query_params.get('max_distance', 10))
             point_type = request.query_params.get('type')
 
-            user_location = Point(lng, lat, srid=4326)
-            
-            queryset = self.get_queryset().annotate(
-                distance=Distance('location', user_location)
-            ).filter(location__distance_lte=(user_location, D(km=max_distance)))
+            queryset = within_radius(self.get_queryset(), user_location, max_distance)
 
             if point_type:
                 queryset = queryset.filter(type=point_type)
@@ -209,53 +352,155 @@ class PointOfInterestViewSet(viewsets.ModelViewSet):
                 status=400
             )
 
+    def _nearest(self, request):
+        """
+        Búsqueda KNN ordenada por el índice GiST con paginación por cursor.
+        """
+        try:
+            user_location = parse_location(request.query_params)
+            max_distance = request.query_params.get('max_distance')
+            max_distance = float(max_distance) if max_distance is not None else None
+        except (ValueError, TypeError):
+            return Response(
+                {"error": "Parámetros de ubicación inválidos"},
+                status=400
+            )
+
+        queryset = self.get_queryset().filter(location__isnull=False).annotate(
+            knn_distance=KNNDistance('location', user_location)
+        )
+        if max_distance is not None:
+            queryset = queryset.filter(knn_distance__lte=max_distance * 1000)
+
+        point_type = request.query_params.get('type')
+        if point_type:
+            queryset = queryset.filter(type=point_type)
+
+        paginator = NearestCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'])
+    @cache_response
     def by_type(self, request):
         """
         Agrupa puntos de interés por tipo y devuelve estadísticas básicas.
+        Parámetros:
+        - type: limitar a un tipo (opcional)
+        - include_points: incluir los puntos del tipo, paginados (requiere type)
+
+        La dificultad se expresa en escala ordinal: 1 = EASY, 2 = MEDIUM, 3 = HARD.
         """
-        types = PointOfInterest.objects.values('type').distinct()
+        point_type = request.query_params.get('type')
+        include_points = request.query_params.get('include_points', '').lower() in ('1', 'true')
+
+        if include_points and not point_type:
+            return Response(
+                {"error": "include_points requiere el parámetro type"},
+                status=400
+            )
+
+        groups = get_or_compute('pointofinterest', 'by_type', self._type_stats)
+        if point_type:
+            groups = [group for group in groups if group['type'] == point_type]
+
+        url = request.build_absolute_uri()
         result = []
-        
-        for type_dict in types:
-            type_name = type_dict['type']
-            points = self.get_queryset().filter(type=type_name)
-            
-            result.append({
-                'type': type_name,
-                'count': points.count(),
-                'avg_difficulty': points.aggregate(Avg('difficulty'))['difficulty__avg'],
-                'points': self.get_serializer(points, many=True).data
-            })
-        
+        for group in groups:
+            group = dict(group)
+            group['points_url'] = replace_query_param(
+                replace_query_param(url, 'type', group['type']), 'include_points', 'true'
+            )
+            result.append(group)
+
+        if include_points and result:
+            points = self.get_queryset().filter(type=point_type).order_by('id')
+            page = self.paginate_queryset(points)
+            serializer = self.get_serializer(page, many=True)
+            result[0]['points'] = self.get_paginated_response(serializer.data).data
+
         return Response(result)
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+    def _type_stats(self):
+        """
+        Estadísticas por tipo calculadas en una sola consulta agrupada.
+        """
+        difficulty_level = Case(
+            *[When(difficulty=key, then=Value(level))
+              for key, level in PointOfInterest.DIFFICULTY_LEVELS.items()],
+            output_field=IntegerField()
+        )
+        groups = self.get_queryset().order_by().values('type').annotate(
+            count=Count('id'),
+            avg_difficulty=Avg(difficulty_level),
+            min_difficulty=Min(difficulty_level),
+            max_difficulty=Max(difficulty_level),
+            extent=Extent('location'),
+            centroid=Centroid(Collect('location')),
+        ).order_by('type')
+
+        return [
+            {
+                'type': group['type'],
+                'count': group['count'],
+                'avg_difficulty': group['avg_difficulty'],
+                'min_difficulty': group['min_difficulty'],
+                'max_difficulty': group['max_difficulty'],
+                'bbox': list(group['extent']) if group['extent'] else None,
+                'centroid': [group['centroid'].x, group['centroid'].y] if group['centroid'] else None,
+            }
+            for group in groups
+        ]
+
+class RestaurantViewSet(CachedResponseMixin, FastGeoJSONListMixin, ViewportMixin, viewsets.ModelViewSet):
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'created_at']
+    viewport_category = 'cuisine_type'
+    renderer_classes = MAP_RENDERER_CLASSES
+
+    def cache_vary(self, request):
+        # Con open_now la respuesta cambia con el minuto de la semana
+        if request.query_params.get('open_now', '').lower() in ('1', 'true'):
+            return week_minute()
+        return ''
 
     @action(detail=False, methods=['get'])
+    @cache_response
     def nearby(self, request):
         """
         Encuentra restaurantes cercanos a una ubicación dada.
+        Filtros opcionales:
+        - cuisine_type
+        - open_now: solo los abiertos ahora (hora de Canarias)
+        - open_at: solo los abiertos en esa fecha y hora (ISO 8601; sin zona
+          horaria se interpreta en hora de Canarias)
         """
         try:
-            lat = float(request.query_params.get('lat', 0))
-            lng = float(request.query_params.get('lng', 0))
+            user_location = parse_location(request.query_params)
             max_distance = float(request.query_params.get('max_distance', 5))
             cuisine = request.query_params.get('cuisine_type')
-
-            user_location = Point(lng, lat, srid=4326)
-            
-            queryset = self.get_queryset().annotate(
-                distance=Distance('location', user_location)
-            ).filter(location__distance_lte=(user_location, D(km=max_distance)))
+            open_now = request.query_params.get('open_now', '').lower() in ('1', 'true')
+            moment = request.query_params.get('open_at')
+            if moment:
+                moment = parse_datetime(moment)
+                if moment is None:
+                    return Response(
+                        {"error": "open_at debe ser una fecha ISO 8601"},
+                        status=400
+                    )
+
+            queryset = within_radius(self.get_queryset(), user_location, max_distance)
 
             if cuisine:
                 queryset = queryset.filter(cuisine_type=cuisine)
+            if moment:
+                queryset = open_at(queryset, moment)
+            elif open_now:
+                queryset = open_at(queryset)
 
             queryset = queryset.order_by('distance')
             
@@ -268,10 +513,10 @@ class RestaurantViewSet(viewsets.ModelViewSet):
                 status=400
             )
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(CachedResponseMixin, ViewportMixin, viewsets.ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'start_date', 'created_at']
 
@@ -280,10 +525,16 @@ class EventViewSet(viewsets.ModelViewSet):
         start_date = self.request.query_params.get('start_date', None)
         end_date = self.request.query_params.get('end_date', None)
 
-        if start_date:
-            queryset = queryset.filter(start_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(end_date__lte=end_date)
+        # Eventos que empiezan y terminan dentro de las fechas (índice GiST sobre period)
+        if start_date or end_date:
+            try:
+                queryset = contained_in(
+                    queryset,
+                    parse_moment(start_date) if start_date else None,
+                    parse_moment(end_date) if end_date else None,
+                )
+            except ValueError as e:
+                raise ValidationError({"error": str(e)})
 
         return queryset
 
@@ -293,17 +544,11 @@ class EventViewSet(viewsets.ModelViewSet):
         Devuelve eventos próximos en un área específica.
         """
         try:
-            lat = float(request.query_params.get('lat', 0))
-            lng = float(request.query_params.get('lng', 0))
+            user_location = parse_location(request.query_params)
             max_distance = float(request.query_params.get('max_distance', 10))
 
-            user_location = Point(lng, lat, srid=4326)
-            
-            queryset = self.get_queryset().annotate(
-                distance=Distance('location', user_location)
-            ).filter(
-                location__distance_lte=(user_location, D(km=max_distance)),
-                end_date__gte=timezone.now()
+            queryset = overlapping(
+                within_radius(self.get_queryset(), user_location, max_distance), timezone.now()
             ).order_by('start_date')
             
             serializer = self.get_serializer(queryset, many=True)
@@ -315,12 +560,61 @@ class EventViewSet(viewsets.ModelViewSet):
                 status=400
             )
 
+    @action(detail=False, methods=['get'])
+    def during(self, request):
+        """
+        Eventos que coinciden con una ventana de tiempo, opcionalmente cerca
+        de un punto.
+        Parámetros:
+        - start, end: extremos de la ventana (ISO 8601; al menos uno)
+        - lat, lng, max_distance (km, default: 10): solo eventos cercanos
+        """
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        if not start and not end:
+            return Response({"error": "Se requiere start y/o end"}, status=400)
+
+        try:
+            start = parse_moment(start) if start else None
+            end = parse_moment(end) if end else None
+            queryset = self.get_queryset()
+            if 'lat' in request.query_params or 'lng' in request.query_params:
+                queryset = within_radius(
+                    queryset,
+                    parse_location(request.query_params),
+                    float(request.query_params.get('max_distance', 10)),
+                )
+        except (ValueError, TypeError):
+            return Response({"error": "Parámetros de fecha o ubicación inválidos"}, status=400)
+
+        queryset = overlapping(queryset, start, end).order_by('start_date', 'pk')
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
 class ItineraryViewSet(viewsets.ModelViewSet):
     queryset = Itinerary.objects.all()
     serializer_class = ItinerarySerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     search_fields = ['title', 'description']
-    ordering_fields = ['title', 'start_date', 'created_at']
+    ordering_fields = ['title', 'start_date', 'created_at', 'average_rating', 'review_count']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            # Cargar usuario, agregados de reseñas, puntos y sus detalles en
+            # un número fijo de consultas
+            queryset = queryset.select_related('user', 'review_stats').prefetch_related(
+                Prefetch('points', queryset=ItineraryPoint.objects.select_related(
+                    'point_of_interest', 'restaurant', 'event'
+                ))
+            )
+        if self.action == 'list':
+            # Ordenación por valoración: los itinerarios sin reseñas cuentan como 0
+            queryset = queryset.annotate(
+                average_rating=Coalesce('review_stats__average_rating', Value(0.0)),
+                review_count=Coalesce('review_stats__review_count', Value(0), output_field=IntegerField()),
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -331,6 +625,82 @@ class ItineraryViewSet(viewsets.ModelViewSet):
         # Durante desarrollo, usar un usuario por defecto o None
         serializer.save(user=None)
 
+    @action(detail=False, methods=['get'])
+    def leaderboard(self, request):
+        """
+        Itinerarios mejor valorados según la media bayesiana de una
+        valoración (ver tourism.leaderboard).
+        Parámetros:
+        - dimension: rating (default), scenery, accessibility, signposting,
+          cleanliness o services; también con el nombre del campo
+          (p. ej. accessibility_rating)
+        - limit: número de itinerarios (default: 10, máx: 100)
+        - offset: posición de inicio (default: 0)
+        """
+        try:
+            dimension = leaderboard.resolve_dimension(request.query_params.get('dimension', 'rating'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 100))
+            offset = max(0, int(request.query_params.get('offset', 0)))
+        except ValueError:
+            return Response({"error": "limit y offset deben ser números enteros"}, status=400)
+
+        board, rows = leaderboard.top(dimension, limit, offset)
+        titles = dict(Itinerary.objects.filter(
+            pk__in=[row['itinerary_id'] for row in rows]
+        ).values_list('pk', 'title'))
+        return Response({
+            'dimension': dimension,
+            'prior_mean': board['prior_mean'],
+            'prior_weight': board['prior_weight'],
+            'count': board['size'],
+            'results': [
+                {**row, 'title': titles.get(row['itinerary_id'])}
+                for row in rows
+            ],
+        })
+
+    @action(detail=True, methods=['get'])
+    def geojson(self, request, pk=None):
+        """
+        GeoJSON del itinerario: un punto por POI, restaurante o evento y una
+        LineString con la ruta de cada día. Responde 304 si el ETag enviado
+        en If-None-Match sigue siendo válido.
+        """
+        etag = itinerary_geojson.get_etag(pk) if str(pk).isdigit() else None
+        if etag and etag_matches(request, f'"{etag}"'):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+        itinerary = self.get_object()
+        data, etag = itinerary_geojson.get_geojson(itinerary.pk)
+        if etag_matches(request, f'"{etag}"'):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+        return Response(data, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+    @action(detail=True, methods=['get'])
+    def events(self, request, pk=None):
+        """
+        Eventos que tienen lugar durante las fechas del itinerario.
+        Parámetros opcionales: lat, lng y max_distance (km, default: 10)
+        para limitarlos a una zona.
+        """
+        itinerary = self.get_object()
+        queryset = Event.objects.all()
+        if 'lat' in request.query_params or 'lng' in request.query_params:
+            try:
+                queryset = within_radius(
+                    queryset,
+                    parse_location(request.query_params),
+                    float(request.query_params.get('max_distance', 10)),
+                )
+            except (ValueError, TypeError):
+                return Response({"error": "Parámetros de ubicación inválidos"}, status=400)
+
+        queryset = overlapping(queryset, *itinerary_window(itinerary)).order_by('start_date', 'pk')
+        return Response(EventSerializer(queryset, many=True).data)
+
     @action(detail=True, methods=['post'])
     def add_point(self, request, pk=None):
         """
@@ -391,6 +761,26 @@ class ItineraryViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
+    @action(detail=True, methods=['post'])
+    def edit_points(self, request, pk=None):
+        """
+        Aplica varias operaciones sobre los puntos de forma atómica.
+        Parámetros en el body:
+        - operations: lista de operaciones, cada una con 'op':
+          - move: point_id, day, order (opcional, por defecto al final)
+          - reorder: day, points (IDs en el nuevo orden)
+          - insert: point_type, point_id, day, order y notes (opcionales)
+          - delete: point_id
+        Devuelve todos los puntos del itinerario renumerados.
+        """
+        itinerary = self.get_object()
+        try:
+            points = apply_operations(itinerary.pk, request.data.get('operations'))
+        except EditError as e:
+            return Response({"error": str(e), "operation": e.index}, status=400)
+        serializer = ItineraryPointSerializer(points, many=True)
+        return Response(serializer.data)
+
     @action(detail=True, methods=['post'])
     def reorder_points(self, request, pk=None):
         """
@@ -410,38 +800,81 @@ class ItineraryViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            # Verificar que todos los puntos pertenecen al itinerario y día
-            points = ItineraryPoint.objects.filter(
-                itinerary=itinerary,
-                day=day,
-                id__in=point_ids
+            points = apply_operations(itinerary.pk, [{'op': 'reorder', 'day': day, 'points': point_ids}])
+        except EditError:
+            return Response(
+                {"error": "Algunos puntos no existen o no pertenecen a este día"},
+                status=400
             )
 
-            if points.count() != len(point_ids):
-                return Response(
-                    {"error": "Algunos puntos no existen o no pertenecen a este día"},
-                    status=400
-                )
-
-            # Actualizar el orden
-            for new_order, point_id in enumerate(point_ids, 1):
-                ItineraryPoint.objects.filter(id=point_id).update(order=new_order)
+        # Devolver los puntos actualizados
+        serializer = ItineraryPointSerializer(points.filter(day=day), many=True)
+        return Response(serializer.data)
 
-            # Devolver los puntos actualizados
-            points = ItineraryPoint.objects.filter(
-                itinerary=itinerary,
-                day=day
-            ).order_by('order')
-            serializer = ItineraryPointSerializer(points, many=True)
-            return Response(serializer.data)
+    @action(detail=True, methods=['post'])
+    def optimize(self, request, pk=None):
+        """
+        Optimiza el orden de visita para minimizar los desplazamientos.
+        Parámetros en el body:
+        - redistribute: repartir los puntos entre los días (por defecto solo
+          se reordena cada día)
+        - days: número de días al repartir (por defecto, la duración del itinerario)
+        - hours_per_day: horas disponibles por día (por defecto 8). Al
+          repartir, los puntos que no caben en `days` días se dejan al final
+          del último y se listan en su `overflow`
+        - dry_run: devolver el plan sin guardarlo
+        """
+        itinerary = self.get_object()
+        redistribute = str(request.data.get('redistribute', '')).lower() in ('1', 'true')
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        try:
+            days = int(request.data.get('days') or (itinerary.end_date - itinerary.start_date).days + 1)
+            hours_per_day = float(request.data.get('hours_per_day') or 8)
+        except (TypeError, ValueError):
+            return Response({"error": "days y hours_per_day deben ser numéricos"}, status=400)
+        if days < 1 or hours_per_day <= 0:
+            return Response({"error": "days y hours_per_day deben ser positivos"}, status=400)
+
+        points = ItineraryPoint.objects.filter(itinerary=itinerary).select_related(
+            'point_of_interest', 'restaurant', 'event'
+        )
+        plan = routing.optimize(
+            routing.stops_for_points(points),
+            days=days if redistribute else None,
+            day_minutes=hours_per_day * 60,
+        )
 
-        except Exception as e:
-            return Response({"error": str(e)}, status=400)
+        result = {
+            'days': [
+                {**{key: value for key, value in day.items() if key != 'keys'}, 'points': day['keys']}
+                for day in plan
+            ],
+            'distance_km': round(sum(day['distance_km'] for day in plan), 2),
+        }
+        if dry_run:
+            return Response(result)
+
+        # Cada punto se mueve al final de su día en el orden del plan
+        operations = [
+            {'op': 'move', 'point_id': point_id, 'day': day['day']}
+            for day in plan for point_id in day['keys']
+        ]
+        if operations:
+            try:
+                points = apply_operations(itinerary.pk, operations)
+            except EditError:
+                return Response(
+                    {"error": "El itinerario ha cambiado durante la optimización, inténtalo de nuevo"},
+                    status=409
+                )
+            result['points'] = ItineraryPointSerializer(points, many=True).data
+        return Response(result)
 
     @action(detail=True, methods=['post'])
     def move_point(self, request, pk=None):
         """
-        Mueve un punto a otro día y/o posición.
+        Mueve un punto a otro día y/o posición. Los puntos de ambos días se
+        renumeran.
         Parámetros en el body:
         - point_id: ID del punto a mover
         - new_day: nuevo número de día
@@ -459,38 +892,29 @@ class ItineraryViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            point = ItineraryPoint.objects.get(
-                itinerary=itinerary,
-                id=point_id
-            )
-
-            # Si no se especifica new_order, añadir al final del nuevo día
-            if not new_order:
-                max_order = ItineraryPoint.objects.filter(
-                    itinerary=itinerary,
-                    day=new_day
-                ).aggregate(Max('order'))['order__max'] or 0
-                new_order = max_order + 1
-
-            point.day = new_day
-            point.order = new_order
-            point.save()
-
-            serializer = ItineraryPointSerializer(point)
-            return Response(serializer.data)
-
-        except ItineraryPoint.DoesNotExist:
+            exists = ItineraryPoint.objects.filter(itinerary=itinerary, id=point_id).exists()
+        except (TypeError, ValueError):
+            exists = False
+        if not exists:
             return Response(
                 {"error": "Punto no encontrado"},
                 status=404
             )
-        except Exception as e:
+
+        try:
+            points = apply_operations(itinerary.pk, [
+                {'op': 'move', 'point_id': point_id, 'day': new_day, 'order': new_order}
+            ])
+        except EditError as e:
             return Response({"error": str(e)}, status=400)
 
+        serializer = ItineraryPointSerializer(points.get(id=point_id))
+        return Response(serializer.data)
+
 class ItineraryPointViewSet(viewsets.ModelViewSet):
-    queryset = ItineraryPoint.objects.all()
+    queryset = ItineraryPoint.objects.select_related('point_of_interest', 'restaurant', 'event')
     serializer_class = ItineraryPointSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     ordering_fields = ['day', 'order']
 
     def get_serializer_class(self):
@@ -499,9 +923,9 @@ class ItineraryPointViewSet(viewsets.ModelViewSet):
         return self.serializer_class
 
 class ItineraryReviewViewSet(viewsets.ModelViewSet):
-    queryset = ItineraryReview.objects.all()
+    queryset = ItineraryReview.objects.prefetch_related('photos')
     serializer_class = ItineraryReviewSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     search_fields = ['comment']
     ordering_fields = ['rating', 'created_at']
 